@@ -0,0 +1,493 @@
+"""
+Agent间异步消息总线（A2A）
+Agent之间直接发送类型化消息，而不是各自轮询MCP服务器：
+- 发布/订阅：消息按主题投递给所有订阅者；每个订阅有一个有界队列，队列满时发布方等待（背压）
+- 请求/应答：request() 为消息分配关联ID并等待应答，应答经发送方节点的应答主题送回
+- 多进程：SocketLink 通过本地套接字（Unix域套接字，或 "host:port" 形式的本机TCP）连接两个进程的总线，
+  把对方订阅的主题转发过去，每行一个JSON帧
+航班查询助手和预订管理助手通过 AirlineBusAdapter / BookingBusAdapter 接入总线：
+航班查询助手把搜索结果直接推送给预订管理助手，预订管理助手存入会话记忆，之后 "订第2个航班" 可以直接引用
+总线的方法必须在事件循环中调用
+"""
+
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import time
+import uuid
+from typing import Dict, Any, Callable, ClassVar, Iterable, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel
+
+# 每个订阅的队列长度上限；request() 等待应答的秒数
+AGENT_BUS_MAX_QUEUE = int(os.getenv("AGENT_BUS_MAX_QUEUE", 1000))
+AGENT_BUS_REQUEST_TIMEOUT = float(os.getenv("AGENT_BUS_REQUEST_TIMEOUT", 10))
+# 多进程部署时总线服务监听的地址：Unix域套接字路径，或 host:port
+AGENT_BUS_ADDRESS = os.getenv("AGENT_BUS_ADDRESS", "/tmp/agent_bus.sock")
+# 套接字上单个JSON帧的长度上限（字节）
+AGENT_BUS_FRAME_LIMIT = 4 * 1024 * 1024
+
+REPLY_TOPIC_PREFIX = "_reply."
+
+class BusError(Exception):
+    """消息总线错误：没有订阅者、等待应答超时、未注册的消息类型等"""
+
+class BusMessage(BaseModel):
+    """总线消息基类：子类用 topic 声明默认主题，并用 register_message 注册，跨进程传输时按主题还原类型"""
+    topic: ClassVar[str] = ""
+
+MESSAGE_TYPES: Dict[str, Type[BusMessage]] = {}
+
+def register_message(cls: Type[BusMessage]) -> Type[BusMessage]:
+    if not cls.topic:
+        raise ValueError(f"{cls.__name__} 未声明 topic")
+    MESSAGE_TYPES[cls.topic] = cls
+    return cls
+
+@register_message
+class FlightSearchRequest(BusMessage):
+    """请求航班查询助手搜索航线"""
+    topic: ClassVar[str] = "flights.search"
+    departure: str
+    arrival: str
+    session_id: Optional[str] = None
+
+@register_message
+class FlightSearchResults(BusMessage):
+    """航线搜索结果（推送给订阅者，或作为 FlightSearchRequest 的应答）"""
+    topic: ClassVar[str] = "flights.results"
+    departure: str
+    arrival: str
+    flights: List[Dict[str, Any]]
+    session_id: Optional[str] = None
+
+@register_message
+class BookingCommand(BusMessage):
+    """请求预订管理助手搜索并预订（对应 POST /bookings/auto）"""
+    topic: ClassVar[str] = "bookings.auto_book"
+    passenger_name: str
+    departure: str
+    arrival: str
+    departure_date: str
+    policy: str = "cheapest"
+    session_id: Optional[str] = None
+
+@register_message
+class BookingResult(BusMessage):
+    """BookingCommand 的应答"""
+    topic: ClassVar[str] = "bookings.result"
+    success: bool
+    booking: Optional[Dict[str, Any]] = None
+    flight: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class Envelope:
+    """消息信封：消息本身加上路由信息（origin 为收到该消息的SocketLink，避免转发回来源）"""
+    __slots__ = ("id", "topic", "message", "sender", "correlation_id", "reply_to", "sent_at", "origin")
+
+    def __init__(self, id: str, topic: str, message: BusMessage, sender: str = "",
+                 correlation_id: Optional[str] = None, reply_to: Optional[str] = None,
+                 sent_at: Optional[float] = None, origin: Any = None):
+        self.id = id
+        self.topic = topic
+        self.message = message
+        self.sender = sender
+        self.correlation_id = correlation_id
+        self.reply_to = reply_to
+        self.sent_at = sent_at if sent_at is not None else time.time()
+        self.origin = origin
+
+    def to_frame(self) -> Dict[str, Any]:
+        return {
+            "op": "message",
+            "id": self.id,
+            "topic": self.topic,
+            "type": self.message.topic,
+            "sender": self.sender,
+            "correlation_id": self.correlation_id,
+            "reply_to": self.reply_to,
+            "sent_at": self.sent_at,
+            "body": self.message.model_dump(mode="json")
+        }
+
+    @classmethod
+    def from_frame(cls, frame: Dict[str, Any], origin: Any = None) -> "Envelope":
+        message_type = MESSAGE_TYPES.get(frame["type"])
+        if message_type is None:
+            raise BusError(f"未注册的消息类型: {frame['type']}")
+        return cls(frame["id"], frame["topic"], message_type.model_validate(frame["body"]), frame.get("sender", ""),
+                   frame.get("correlation_id"), frame.get("reply_to"), frame.get("sent_at"), origin)
+
+# 订阅的处理函数：接收信封，可以是协程函数；返回BusMessage且消息需要应答时，自动作为应答发回
+Handler = Callable[[Envelope], Any]
+
+class Subscription:
+    """
+    一个订阅：有界队列 + 处理任务
+    指定handler时由后台任务逐条处理；否则由调用方用 get() 取消息
+    """
+    def __init__(self, bus: "MessageBus", topic: str, handler: Optional[Handler], max_queue: int, name: str):
+        self.bus = bus
+        self.topic = topic
+        self.handler = handler
+        self.name = name
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.skip_origin: Any = None
+        self.handled = 0
+        self.task: Optional[asyncio.Task] = None
+        if handler is not None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def get(self) -> Envelope:
+        envelope = await self.queue.get()
+        self.queue.task_done()
+        return envelope
+
+    async def _run(self) -> None:
+        while True:
+            envelope = await self.queue.get()
+            try:
+                result = self.handler(envelope)
+                if inspect.isawaitable(result):
+                    result = await result
+                if isinstance(result, BusMessage) and envelope.reply_to:
+                    await self.bus.reply(envelope, result, sender=self.name)
+                self.handled += 1
+            except Exception as e:
+                self.bus._stats["handler_errors"] += 1
+                print(f"❌ 消息处理失败 [{self.topic}] {self.name}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def cancel(self) -> None:
+        self.bus.unsubscribe(self)
+
+class MessageBus:
+    """进程内的异步消息总线"""
+    def __init__(self, node_id: Optional[str] = None, max_queue: int = AGENT_BUS_MAX_QUEUE):
+        self.node_id = node_id or uuid.uuid4().hex[:8]
+        self.reply_topic = REPLY_TOPIC_PREFIX + self.node_id
+        self.max_queue = max_queue
+        self._subscriptions: Dict[str, List[Subscription]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._stats = {"published": 0, "delivered": 0, "blocked": 0, "requests": 0, "replies": 0,
+                       "timeouts": 0, "handler_errors": 0, "bad_frames": 0}
+
+    def subscribe(self, topic: Union[str, Type[BusMessage]], handler: Optional[Handler] = None,
+                  max_queue: Optional[int] = None, name: str = "") -> Subscription:
+        """订阅主题（主题名或消息类型）"""
+        topic = topic if isinstance(topic, str) else topic.topic
+        subscription = Subscription(self, topic, handler, max_queue or self.max_queue, name or topic)
+        self._subscriptions.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.topic, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+        if subscription.task is not None:
+            subscription.task.cancel()
+
+    async def publish(self, message: BusMessage, topic: Optional[str] = None, sender: str = "",
+                      correlation_id: Optional[str] = None, reply_to: Optional[str] = None) -> int:
+        """
+        发布消息，订阅者队列已满时等待（背压）
+
+        Returns:
+            接收消息的订阅数
+        """
+        envelope = Envelope(f"{self.node_id}-{next(self._ids)}", topic or message.topic, message, sender,
+                            correlation_id, reply_to)
+        return await self.deliver(envelope)
+
+    def resolve_reply(self, envelope: Envelope) -> int:
+        """把发往本节点应答主题的信封交给等待中的 request()，不会等待"""
+        self._stats["published"] += 1
+        future = self._pending.pop(envelope.correlation_id, None)
+        if future is None or future.done():
+            return 0
+        future.set_result(envelope.message)
+        return 1
+
+    async def deliver(self, envelope: Envelope) -> int:
+        """把信封投递给订阅者；发往本节点应答主题的信封直接交给等待中的 request()"""
+        if envelope.topic == self.reply_topic:
+            return self.resolve_reply(envelope)
+        self._stats["published"] += 1
+        delivered = 0
+        for subscription in tuple(self._subscriptions.get(envelope.topic, ())):
+            if subscription.skip_origin is not None and envelope.origin is subscription.skip_origin:
+                continue
+            if subscription.queue.full():
+                self._stats["blocked"] += 1
+            await subscription.queue.put(envelope)
+            delivered += 1
+        self._stats["delivered"] += delivered
+        return delivered
+
+    async def request(self, message: BusMessage, topic: Optional[str] = None, sender: str = "",
+                      timeout: float = AGENT_BUS_REQUEST_TIMEOUT) -> BusMessage:
+        """
+        发送请求并等待应答
+
+        Raises:
+            BusError: 主题没有订阅者，或超时未收到应答
+        """
+        topic = topic or message.topic
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[correlation_id] = future
+        self._stats["requests"] += 1
+        try:
+            if not await self.publish(message, topic, sender, correlation_id, self.reply_topic):
+                raise BusError(f"主题 {topic} 没有订阅者")
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise BusError(f"等待 {topic} 的应答超时（{timeout}秒）")
+        finally:
+            self._pending.pop(correlation_id, None)
+
+    async def reply(self, request: Envelope, message: BusMessage, sender: str = "") -> None:
+        """应答请求：发往请求方节点的应答主题（请求方在其他进程时由SocketLink转发）"""
+        if not request.reply_to:
+            raise BusError(f"消息 {request.id} 不需要应答")
+        self._stats["replies"] += 1
+        await self.publish(message, request.reply_to, sender, request.correlation_id)
+
+    async def join(self) -> None:
+        """等待所有订阅处理完已投递的消息"""
+        await asyncio.gather(*(subscription.queue.join()
+                               for subscriptions in self._subscriptions.values() for subscription in subscriptions))
+
+    async def close(self) -> None:
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                self.unsubscribe(subscription)
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(BusError("消息总线已关闭"))
+        self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["node_id"] = self.node_id
+        stats["subscriptions"] = {topic: len(subscriptions) for topic, subscriptions in self._subscriptions.items()
+                                  if subscriptions and not topic.startswith(REPLY_TOPIC_PREFIX)}
+        stats["pending_requests"] = len(self._pending)
+        return stats
+
+class SocketLink:
+    """
+    通过套接字连接两个进程的总线
+    连接建立后双方各自声明想接收的主题（以及本节点的应答主题），对方为这些主题创建转发订阅；
+    收到的消息在本端总线上发布。转发订阅的队列和套接字写缓冲共同形成跨进程的背压
+
+    读取任务只解析帧：应答直接交给等待中的 request()，其余消息放入有界的接收缓冲，由投递任务按顺序投递。
+    订阅者队列满时只有投递任务等待，读取任务继续读取，排在后面的应答不会被堵住
+    （订阅者的处理函数自己在等待应答时，这样不会死锁）；接收缓冲也满时读取任务才等待。
+    无法解析的帧（JSON错误、未注册的消息类型、消息校验失败）记录并计入 bad_frames 后跳过
+    """
+    def __init__(self, bus: MessageBus, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 topics: Iterable[str] = ()):
+        self.bus = bus
+        self.reader = reader
+        self.writer = writer
+        self.topics = [topic if isinstance(topic, str) else topic.topic for topic in topics]
+        self._forwarders: Dict[str, Subscription] = {}
+        self._write_lock = asyncio.Lock()
+        self._peer_ready = asyncio.Event()
+        self._inbound: asyncio.Queue = asyncio.Queue(bus.max_queue)
+        self._reader_task: Optional[asyncio.Task] = None
+        self._deliver_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._deliver_task = asyncio.ensure_future(self._deliver_loop())
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        for topic in [self.bus.reply_topic] + self.topics:
+            await self._send({"op": "subscribe", "topic": topic})
+        await self._send({"op": "ready"})
+
+    async def wait_ready(self, timeout: float = AGENT_BUS_REQUEST_TIMEOUT) -> None:
+        """等待对方声明完订阅的主题，此后发布的消息不会因为对方尚未订阅而丢失"""
+        await asyncio.wait_for(self._peer_ready.wait(), timeout)
+
+    async def _send(self, frame: Dict[str, Any]) -> None:
+        data = json.dumps(frame, ensure_ascii=False).encode() + b"\n"
+        async with self._write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def _forward(self, envelope: Envelope) -> None:
+        await self._send(envelope.to_frame())
+
+    async def _handle_frame(self, frame: Dict[str, Any]) -> None:
+        op = frame.get("op")
+        if op == "message":
+            envelope = Envelope.from_frame(frame, origin=self)
+            if envelope.topic == self.bus.reply_topic:
+                self.bus.resolve_reply(envelope)
+            else:
+                # 接收缓冲满时在此等待，不再读取套接字，对方的写入随之阻塞
+                await self._inbound.put(envelope)
+        elif op == "subscribe" and frame["topic"] not in self._forwarders:
+            subscription = self.bus.subscribe(frame["topic"], self._forward, name=f"link:{frame['topic']}")
+            subscription.skip_origin = self
+            self._forwarders[frame["topic"]] = subscription
+        elif op == "ready":
+            self._peer_ready.set()
+
+    def _bad_frame(self, error: Exception) -> None:
+        self.bus._stats["bad_frames"] += 1
+        print(f"⚠️  丢弃无法处理的总线消息帧: {type(error).__name__}: {error}")
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except ValueError as e:
+                    # 超过 AGENT_BUS_FRAME_LIMIT 的帧，已从读缓冲中丢弃
+                    self._bad_frame(e)
+                    continue
+                if not line:
+                    break
+                try:
+                    await self._handle_frame(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError, BusError) as e:
+                    # JSON错误、消息校验失败（ValidationError是ValueError）、缺少字段、未注册的消息类型
+                    self._bad_frame(e)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._drop_forwarders()
+        # 连接结束后投递任务处理完缓冲中的消息再退出
+        await self._inbound.put(None)
+
+    async def _deliver_loop(self) -> None:
+        while True:
+            envelope = await self._inbound.get()
+            if envelope is None:
+                return
+            # 本端订阅者的队列满时在此等待，接收缓冲随之积压
+            await self.bus.deliver(envelope)
+
+    def _drop_forwarders(self) -> None:
+        for subscription in self._forwarders.values():
+            self.bus.unsubscribe(subscription)
+        self._forwarders.clear()
+
+    async def close(self) -> None:
+        for task in (self._reader_task, self._deliver_task):
+            if task is not None:
+                task.cancel()
+        self._drop_forwarders()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+def _parse_address(address: str) -> Tuple[Optional[str], Union[str, int]]:
+    """host:port 为本机TCP，否则为Unix域套接字路径"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and not address.startswith("/"):
+        return host or "127.0.0.1", int(port)
+    return None, address
+
+async def serve_bus(bus: MessageBus, address: str = AGENT_BUS_ADDRESS,
+                    topics: Iterable[Union[str, Type[BusMessage]]] = ()) -> asyncio.AbstractServer:
+    """
+    在本地套接字上提供总线服务，其他进程用 connect_bus 连接
+
+    Args:
+        topics: 本进程处理的主题，连接方发布的这些消息会转发过来
+    """
+    topics = list(topics)
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await SocketLink(bus, reader, writer, topics).start()
+
+    host, port = _parse_address(address)
+    if host is not None:
+        return await asyncio.start_server(on_connect, host, port, limit=AGENT_BUS_FRAME_LIMIT)
+    if os.path.exists(address):
+        os.unlink(address)  # 上次运行残留的套接字文件
+    return await asyncio.start_unix_server(on_connect, path=address, limit=AGENT_BUS_FRAME_LIMIT)
+
+async def connect_bus(bus: MessageBus, address: str = AGENT_BUS_ADDRESS,
+                      topics: Iterable[Union[str, Type[BusMessage]]] = ()) -> SocketLink:
+    """
+    把本进程的总线连接到 serve_bus 提供的总线
+
+    Args:
+        topics: 本进程处理的主题，对方发布的这些消息会转发过来
+    """
+    host, port = _parse_address(address)
+    if host is not None:
+        reader, writer = await asyncio.open_connection(host, port, limit=AGENT_BUS_FRAME_LIMIT)
+    else:
+        reader, writer = await asyncio.open_unix_connection(address, limit=AGENT_BUS_FRAME_LIMIT)
+    link = SocketLink(bus, reader, writer, topics)
+    await link.start()
+    await link.wait_ready()
+    return link
+
+class AirlineBusAdapter:
+    """把航班查询助手接入总线：应答航班搜索请求，并把搜索结果推送给订阅者（如预订管理助手）"""
+    def __init__(self, bus: MessageBus, agent, name: str = "airline_agent"):
+        self.bus = bus
+        self.agent = agent
+        self.name = name
+
+    def start(self) -> "AirlineBusAdapter":
+        self.bus.subscribe(FlightSearchRequest, self._on_search, name=self.name)
+        return self
+
+    async def _search(self, departure: str, arrival: str, session_id: Optional[str]) -> FlightSearchResults:
+        # Agent的同步方法在后台事件循环上访问MCP服务器，这里放到线程中调用，不阻塞总线
+        flights = await asyncio.to_thread(self.agent.search_flights, departure, arrival)
+        return FlightSearchResults(departure=departure, arrival=arrival, flights=flights or [], session_id=session_id)
+
+    async def _on_search(self, envelope: Envelope) -> FlightSearchResults:
+        request = envelope.message
+        return await self._search(request.departure, request.arrival, request.session_id)
+
+    async def push_search_results(self, departure: str, arrival: str, session_id: Optional[str] = None) -> int:
+        """搜索航线并把结果推送给订阅者，返回接收方数量"""
+        results = await self._search(departure, arrival, session_id)
+        return await self.bus.publish(results, sender=self.name)
+
+class BookingBusAdapter:
+    """把预订管理助手接入总线：收到的航班搜索结果存入会话记忆，并处理搜索并预订的请求"""
+    def __init__(self, bus: MessageBus, agent, name: str = "booking_agent"):
+        self.bus = bus
+        self.agent = agent
+        self.name = name
+        self.received = 0
+
+    def start(self) -> "BookingBusAdapter":
+        self.bus.subscribe(FlightSearchResults, self._on_results, name=self.name)
+        self.bus.subscribe(BookingCommand, self._on_command, name=self.name)
+        return self
+
+    def _on_results(self, envelope: Envelope) -> None:
+        results = envelope.message
+        memory = self.agent.memory.get(results.session_id)
+        memory.remember(route=(results.departure, results.arrival), flights=results.flights)
+        if len(results.flights) == 1:
+            memory.remember(flight=results.flights[0])
+        self.received += 1
+
+    async def _on_command(self, envelope: Envelope) -> BookingResult:
+        command = envelope.message
+        result = await asyncio.to_thread(self.agent.auto_book, command.passenger_name, command.departure,
+                                         command.arrival, command.departure_date, command.policy)
+        if not result:
+            return BookingResult(success=False, error="预订失败（航线没有可预订的航班或已售罄）")
+        if command.session_id:
+            self.agent.memory.get(command.session_id).remember(booking=result["booking"], flight=result["flight"])
+        return BookingResult(success=True, booking=result["booking"], flight=result["flight"])
@@ -4,6 +4,7 @@
 展示智能预订管理助手和航班查询助手之间的协作流程
 """
 
+import asyncio
 import requests
 import json
 from datetime import datetime, date, time
@@ -11,8 +12,10 @@ from decimal import Decimal
 from typing import Dict, Any, Optional, List
 import random
 
+from agent_bus import AirlineBusAdapter, BookingBusAdapter, BookingCommand, BusError, MessageBus
 from booking_agent import BookingAgent
 from airline_agent import AirlineAgent
+from booking_workflow import print_report, run_booking_batch
 
 class MultiAgentDemo:
     def __init__(self):
@@ -27,12 +30,12 @@ class MultiAgentDemo:
         except requests.exceptions.RequestException:
             return False
     
-    def automated_booking_flow(self, passenger_name: str, departure: str, arrival: str) -> Dict[str, Any]:
+    def automated_booking_flow(self, passenger_name: str, departure: str, arrival: str,
+                               policy: str = "cheapest") -> Dict[str, Any]:
         """
         自动化预订流程演示
-        1. 航班查询助手搜索航班
-        2. 选择合适的航班
-        3. 预订管理助手创建预订
+        1. 航班查询助手展示航线上的航班
+        2. 预订管理助手一次请求完成选择航班、确认余票和创建预订（服务器端同一事务，不会在搜索和预订之间被抢走座位）
         """
         print(f"\n🔄 多Agent协作流程")
         print(f"乘客: {passenger_name}")
@@ -48,33 +51,20 @@ class MultiAgentDemo:
         
         print(f"✅ 找到 {len(flights)} 个航班")
         for i, flight in enumerate(flights, 1):
-            print(f"  {i}. {flight['flight_number']} ({flight['airline']}) - ¥{flight['price']}")
-        
-        # 步骤2: 选择航班（这里选择第一个）
-        selected_flight = flights[0]
-        print(f"\n📡 步骤2: 选择航班 {selected_flight['flight_number']}")
-        
-        # 步骤3: 预订管理助手创建预订
-        print(f"\n📡 步骤3: 预订管理助手创建预订...")
-        
-        # 构造预订数据
-        booking_data = {
-            "title": f"{passenger_name}的航班预订",
-            "passenger_name": passenger_name,
-            "flight_number": selected_flight['flight_number'],
-            "departure_date": "2024-08-15",  # 示例日期
-            "departure_time": selected_flight['departure_time'],
-            "arrival_date": "2024-08-15",
-            "arrival_time": selected_flight['arrival_time'],
-            "departure_airport": selected_flight['departure_airport'],
-            "arrival_airport": selected_flight['arrival_airport'],
-            "seat_number": f"{random.randint(1, 30)}{random.choice(['A', 'B', 'C', 'D', 'E', 'F'])}",
-            "price": str(selected_flight['price'])
-        }
-        
-        booking_result = self.booking_agent.create_booking(booking_data)
-        
-        if booking_result:
+            print(f"  {i}. {flight['flight_number']} ({flight['airline']}) - ¥{flight['price']} (余票 {flight['available_seats']})")
+        
+        # 步骤2: 预订管理助手按策略选择航班并创建预订
+        print(f"\n📡 步骤2: 预订管理助手搜索并预订（策略: {policy}）...")
+        result = self.booking_agent.auto_book(
+            passenger_name, departure, arrival,
+            departure_date="2024-08-15",  # 示例日期
+            policy=policy,
+            seat_number=f"{random.randint(1, 30)}{random.choice(['A', 'B', 'C', 'D', 'E', 'F'])}"
+        )
+        
+        if result:
+            selected_flight, booking_result = result["flight"], result["booking"]
+            print(f"✅ 选择航班 {selected_flight['flight_number']}，剩余座位 {selected_flight['available_seats']}")
             print(f"✅ 预订创建成功，预订ID: {booking_result['id']}")
             return {
                 "success": True,
@@ -83,7 +73,7 @@ class MultiAgentDemo:
                 "message": "预订流程完成"
             }
         else:
-            return {"success": False, "message": "预订创建失败"}
+            return {"success": False, "message": "预订创建失败（航班可能已售罄）"}
     
     def interactive_collaboration_demo(self):
         """交互式协作演示"""
@@ -120,41 +110,21 @@ class MultiAgentDemo:
             print(f"\n❌ 协作演示失败: {result['message']}")
     
     def batch_demo(self):
-        """批量演示多个预订流程"""
+        """批量演示多个预订流程（由工作流引擎并发执行）"""
         print("\n🎯 批量预订演示")
         print("=" * 50)
         
         # 预定义的演示数据
         demo_data = [
-            {"passenger": "张三", "departure": "PEK", "arrival": "SHA"},
-            {"passenger": "李四", "departure": "SHA", "arrival": "CAN"},
-            {"passenger": "王五", "departure": "CAN", "arrival": "CTU"},
+            {"passenger_name": "张三", "departure": "PEK", "arrival": "SHA"},
+            {"passenger_name": "李四", "departure": "SHA", "arrival": "CAN"},
+            {"passenger_name": "王五", "departure": "CAN", "arrival": "CTU"},
         ]
         
-        successful_bookings = []
-        
-        for i, data in enumerate(demo_data, 1):
-            print(f"\n📋 演示 {i}/{len(demo_data)}")
-            result = self.automated_booking_flow(
-                data["passenger"], 
-                data["departure"], 
-                data["arrival"]
-            )
-            
-            if result["success"]:
-                successful_bookings.append(result)
-            
-            # 添加一些延迟，模拟真实场景
-            import time
-            time.sleep(1)
-        
-        # 总结演示结果
-        print(f"\n📊 批量演示总结")
-        print("=" * 30)
-        print(f"总演示数: {len(demo_data)}")
-        print(f"成功预订: {len(successful_bookings)}")
-        print(f"成功率: {len(successful_bookings)/len(demo_data)*100:.1f}%")
+        report = run_booking_batch(demo_data, mcp_server_url=self.booking_agent.mcp_server_url)
+        print_report(report)
         
+        successful_bookings = [result for result in report["results"] if result["status"] == "booked"]
         if successful_bookings:
             print(f"\n✅ 成功的预订:")
             for booking in successful_bookings:
@@ -200,6 +170,51 @@ class MultiAgentDemo:
             else:
                 print("ℹ️  暂无共同航班数据")
     
+    def message_bus_demo(self, passenger_name: str = "赵六", departure: str = "PEK", arrival: str = "SHA"):
+        """消息总线演示：航班查询助手把搜索结果直接推送给预订管理助手，预订管理助手经总线应答预订请求"""
+        print("\n📨 Agent消息总线演示")
+        print("=" * 50)
+        asyncio.run(self._message_bus_demo(passenger_name, departure, arrival))
+    
+    async def _message_bus_demo(self, passenger_name: str, departure: str, arrival: str):
+        bus = MessageBus()
+        airline = AirlineBusAdapter(bus, self.airline_agent).start()
+        booking = BookingBusAdapter(bus, self.booking_agent).start()
+        session_id = f"bus-demo-{bus.node_id}"
+        
+        # 步骤1: 航班查询助手搜索并推送结果，预订管理助手存入会话记忆
+        print(f"\n📡 步骤1: 航班查询助手搜索 {departure} → {arrival} 并推送结果...")
+        receivers = await airline.push_search_results(departure, arrival, session_id)
+        await bus.join()
+        flights = self.booking_agent.memory.get(session_id).recall("flights") or []
+        print(f"✅ 结果已推送给 {receivers} 个订阅者，预订管理助手收到 {len(flights)} 个航班")
+        
+        # 步骤2: 预订管理助手直接引用收到的航班，不再查询MCP服务器
+        if flights:
+            question = "我想订第1个航班"
+            print(f"\n📡 步骤2: 预订管理助手引用推送的航班")
+            print(f"💬 用户: {question}")
+            reply = await asyncio.to_thread(self.booking_agent.ai_chat, question, session_id)
+            print(f"🤖 预订管理助手: {reply}")
+        
+        # 步骤3: 经总线发送预订请求，按关联ID等待应答
+        print(f"\n📡 步骤3: 经总线请求预订管理助手为 {passenger_name} 预订...")
+        try:
+            result = await bus.request(BookingCommand(
+                passenger_name=passenger_name, departure=departure, arrival=arrival,
+                departure_date="2024-08-15", session_id=session_id
+            ), sender="demo")
+            if result.success:
+                print(f"✅ 预订成功: 航班 {result.flight['flight_number']}，预订ID {result.booking['id']}")
+            else:
+                print(f"❌ 预订失败: {result.error}")
+        except BusError as e:
+            print(f"❌ 预订请求失败: {e}")
+        
+        stats = bus.stats()
+        print(f"\n📊 总线统计: 发布 {stats['published']} 条，投递 {stats['delivered']} 条，请求 {stats['requests']} 次")
+        await bus.close()
+    
     def run_demo(self):
         """运行演示"""
         print("🎮 智能机票预订系统 - 多Agent协作演示")
@@ -219,9 +234,10 @@ class MultiAgentDemo:
             print("2. 交互模式")
             print("3. 批量演示")
             print("4. 通信测试")
-            print("5. 退出")
+            print("5. 消息总线演示")
+            print("6. 退出")
             
-            choice = input("\n请选择 (1-5): ").strip()
+            choice = input("\n请选择 (1-6): ").strip()
             
             if choice == "1":
                 # 自动演示
@@ -241,6 +257,9 @@ class MultiAgentDemo:
                 self.agent_communication_test()
             
             elif choice == "5":
+                self.message_bus_demo()
+            
+            elif choice == "6":
                 print("👋 再见!")
                 break
             
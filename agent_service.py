@@ -0,0 +1,389 @@
+"""
+Agent的A2A风格HTTP服务
+把预订管理助手或航班查询助手发布为异步HTTP服务，同时服务多个对话：
+- 每个会话有独立的状态（对话历史），同一会话内的消息按到达顺序处理
+- 不同会话并发处理，工作线程数有上限，排队的请求过多时返回429
+- 支持一次性回复（/tasks/send）和SSE流式回复（/tasks/sendSubscribe）
+交互式命令行通过 AgentServiceClient 作为该服务的一个客户端
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# 同时处理的对话消息数（工作线程数）
+AGENT_SERVICE_WORKERS = int(os.getenv("AGENT_SERVICE_WORKERS", 8))
+# 等待处理的消息上限，超出时返回429
+AGENT_SERVICE_MAX_PENDING = int(os.getenv("AGENT_SERVICE_MAX_PENDING", 100))
+# 会话空闲超过N秒后清除；会话总数上限，超出时清除最久未活动的会话
+AGENT_SESSION_TTL = int(os.getenv("AGENT_SESSION_TTL", 1800))
+AGENT_SESSION_MAX = int(os.getenv("AGENT_SESSION_MAX", 10000))
+# 每个会话保留的对话历史条数
+AGENT_SESSION_HISTORY = int(os.getenv("AGENT_SESSION_HISTORY", 20))
+AGENT_SERVICE_MAX_TASKS = 1000
+
+class TaskRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+class AgentSession:
+    """单个对话会话的状态"""
+    def __init__(self, session_id: str, history_size: int = AGENT_SESSION_HISTORY):
+        self.session_id = session_id
+        self.history: deque = deque(maxlen=history_size)
+        self.created_at = datetime.utcnow()
+        self.last_active = time.monotonic()
+        # 同一会话的消息串行处理，保证回复顺序与提问顺序一致
+        self.lock = asyncio.Lock()
+
+    def add(self, role: str, text: str) -> None:
+        self.history.append({"role": role, "text": text, "time": datetime.utcnow().isoformat()})
+        self.last_active = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "created_at": self.created_at.isoformat(),
+            "idle_seconds": round(time.monotonic() - self.last_active, 1),
+            "history": list(self.history)
+        }
+
+class SessionStore:
+    """会话表：按最近活动时间排序，清除空闲超时和超出上限的会话"""
+    def __init__(self, ttl: int = AGENT_SESSION_TTL, max_sessions: int = AGENT_SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, AgentSession]" = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> AgentSession:
+        """获取会话，不存在时创建（客户端可以自行指定会话ID）"""
+        self._expire()
+        session_id = session_id or uuid.uuid4().hex
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = AgentSession(session_id)
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def find(self, session_id: str) -> Optional[AgentSession]:
+        self._expire()
+        return self._sessions.get(session_id)
+
+    def remove(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active < self.ttl or session.lock.locked():
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class AgentService:
+    """
+    在有界线程池中执行Agent的对话方法
+
+    agent需要提供 ai_chat(text, session_id) -> str 和 ai_chat_stream(text, session_id) -> Iterator[str]，
+    会话ID传给Agent，由Agent的会话记忆解析上下文中的指代；
+    Agent的方法是同步的（调用LLM和MCP服务器），在工作线程中执行，不阻塞事件循环。
+    """
+    def __init__(self, agent, workers: int = AGENT_SERVICE_WORKERS, max_pending: int = AGENT_SERVICE_MAX_PENDING,
+                 sessions: Optional[SessionStore] = None):
+        self.agent = agent
+        self.workers = workers
+        self.max_pending = max_pending
+        self.sessions = sessions or SessionStore()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-service")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"tasks": 0, "completed": 0, "failed": 0, "rejected": 0, "streams": 0, "busy_ms": 0.0}
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # 信号量在服务的事件循环中创建
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    def admit(self) -> None:
+        """接收一条消息，排队已满时拒绝"""
+        if self._pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            raise HTTPException(status_code=429, detail="Agent繁忙，请稍后重试")
+        self._pending += 1
+
+    def release(self) -> None:
+        """归还admit占用的排队名额"""
+        self._pending -= 1
+
+    def _new_task(self, session: AgentSession, text: str) -> Dict[str, Any]:
+        task = {"id": uuid.uuid4().hex[:12], "session_id": session.session_id, "status": "submitted",
+                "message": text, "reply": None, "error": None, "elapsed_ms": None}
+        self._tasks[task["id"]] = task
+        while len(self._tasks) > AGENT_SERVICE_MAX_TASKS:
+            self._tasks.popitem(last=False)
+        self._stats["tasks"] += 1
+        return task
+
+    def _finish_task(self, task: Dict[str, Any], session: AgentSession, reply: Optional[str],
+                     error: Optional[Exception], start: float) -> None:
+        elapsed = (time.perf_counter() - start) * 1000
+        task["elapsed_ms"] = round(elapsed, 1)
+        self._stats["busy_ms"] += elapsed
+        if error is None:
+            task.update(status="completed", reply=reply)
+            session.add("agent", reply)
+            self._stats["completed"] += 1
+        else:
+            task.update(status="failed", error=str(error))
+            self._stats["failed"] += 1
+
+    async def send(self, text: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """处理一条消息并返回完成的任务（调用前需先admit）"""
+        try:
+            session = self.sessions.get(session_id)
+            task = self._new_task(session, text)
+            async with session.lock, self._get_slots():
+                session.add("user", text)
+                task["status"] = "working"
+                start = time.perf_counter()
+                reply, error = None, None
+                try:
+                    loop = asyncio.get_running_loop()
+                    reply = await loop.run_in_executor(self._executor, self.agent.ai_chat, text, session.session_id)
+                except Exception as e:
+                    error = e
+                self._finish_task(task, session, reply, error, start)
+            return dict(task)
+        finally:
+            self.release()
+
+    async def stream(self, text: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理一条消息（调用前需先admit，响应结束后由调用方release）
+
+        Yields:
+            {"type": "task"} 任务信息、{"type": "chunk", "text": ...} 回复片段、{"type": "done"} 或 {"type": "error"}
+        """
+        session = self.sessions.get(session_id)
+        task = self._new_task(session, text)
+        self._stats["streams"] += 1
+        yield {"type": "task", "task_id": task["id"], "session_id": session.session_id}
+        async with session.lock, self._get_slots():
+            session.add("user", text)
+            task["status"] = "working"
+            start = time.perf_counter()
+            chunks, error = [], None
+            try:
+                async for chunk in self._iterate_in_worker(self.agent.ai_chat_stream, text, session.session_id):
+                    chunks.append(chunk)
+                    yield {"type": "chunk", "text": chunk}
+            except Exception as e:
+                error = e
+            self._finish_task(task, session, "".join(chunks), error, start)
+        if error is None:
+            yield {"type": "done", "task_id": task["id"], "elapsed_ms": task["elapsed_ms"]}
+        else:
+            yield {"type": "error", "task_id": task["id"], "error": str(error)}
+
+    async def _iterate_in_worker(self, generate, *args) -> AsyncIterator[str]:
+        """在工作线程中迭代同步生成器，片段通过队列送回事件循环"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def produce():
+            try:
+                for item in generate(*args):
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        loop.run_in_executor(self._executor, produce)
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def end_session(self, session_id: str) -> bool:
+        """结束会话，同时清除Agent中该会话的记忆"""
+        memory = getattr(self.agent, "memory", None)
+        if memory is not None:
+            memory.drop(session_id)
+        return self.sessions.remove(session_id)
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task = self._tasks.get(task_id)
+        return dict(task) if task else None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(pending=self._pending, workers=self.workers, sessions=len(self.sessions))
+        memory = getattr(self.agent, "memory", None)
+        if memory is not None:
+            stats["memory"] = memory.stats()
+        stats["avg_task_ms"] = stats["busy_ms"] / (stats["completed"] + stats["failed"]) \
+            if stats["completed"] + stats["failed"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    流式响应结束时归还排队名额
+    客户端在响应体开始前断开时生成器不会执行，名额不能在生成器中归还；响应对象总会被调用，在这里归还
+    """
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+def create_agent_app(agent, name: str, description: str, skills: List[Dict[str, str]],
+                     service: Optional[AgentService] = None) -> FastAPI:
+    """
+    创建Agent服务应用
+
+    Args:
+        skills: Agent能力列表 [{"id", "name", "description"}]，发布在 /.well-known/agent.json
+    """
+    service = service or AgentService(agent)
+    app = FastAPI(title=name, description=description)
+    app.state.service = service
+
+    @app.get("/.well-known/agent.json")
+    async def agent_card():
+        """A2A Agent卡片：名称、能力和接口"""
+        return {
+            "name": name,
+            "description": description,
+            "version": "1.0.0",
+            "capabilities": {"streaming": True, "sessions": True},
+            "skills": skills,
+            "endpoints": {"send": "/tasks/send", "stream": "/tasks/sendSubscribe", "task": "/tasks/{task_id}",
+                          "session": "/sessions/{session_id}"}
+        }
+
+    @app.post("/tasks/send")
+    async def send_task(request: TaskRequest):
+        """发送一条消息，处理完成后返回回复"""
+        service.admit()
+        return await service.send(request.message, request.session_id)
+
+    @app.post("/tasks/sendSubscribe")
+    async def send_task_subscribe(request: TaskRequest):
+        """发送一条消息，以SSE流式返回回复片段"""
+        service.admit()
+
+        async def events():
+            async for event in service.stream(request.message, request.session_id):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+        return AdmittedStreamingResponse(events(), release=service.release, media_type="text/event-stream")
+
+    @app.get("/tasks/{task_id}")
+    async def get_task(task_id: str):
+        task = service.get_task(task_id)
+        if task is None:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        return task
+
+    @app.get("/sessions/{session_id}")
+    async def get_session(session_id: str):
+        session = service.sessions.find(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return session.to_dict()
+
+    @app.delete("/sessions/{session_id}")
+    async def delete_session(session_id: str):
+        if not service.end_session(session_id):
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return {"message": f"会话 {session_id} 已结束"}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "agent": name, "timestamp": datetime.utcnow().isoformat()}
+
+    @app.get("/stats")
+    async def stats():
+        return service.stats()
+
+    return app
+
+def serve_agent(app: FastAPI, host: str, port: int) -> None:
+    print(f"🌐 Agent服务: http://{host}:{port}  (Agent卡片: /.well-known/agent.json)")
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+class AgentServiceClient:
+    """Agent服务的HTTP客户端：首次对话时由服务分配会话ID，之后的消息都在同一会话中"""
+    def __init__(self, base_url: str, session_id: Optional[str] = None, timeout: float = 120):
+        self.base_url = base_url.rstrip("/")
+        self.session_id = session_id
+        self._client = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    def agent_card(self) -> Dict[str, Any]:
+        response = self._client.get("/.well-known/agent.json")
+        response.raise_for_status()
+        return response.json()
+
+    def send(self, text: str) -> Dict[str, Any]:
+        response = self._client.post("/tasks/send", json={"message": text, "session_id": self.session_id})
+        response.raise_for_status()
+        task = response.json()
+        self.session_id = task["session_id"]
+        return task
+
+    def stream(self, text: str) -> Iterator[str]:
+        """逐片段产出回复文本"""
+        with self._client.stream("POST", "/tasks/sendSubscribe",
+                                 json={"message": text, "session_id": self.session_id}) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "task":
+                    self.session_id = event["session_id"]
+                elif event["type"] == "chunk":
+                    yield event["text"]
+                elif event["type"] == "error":
+                    raise RuntimeError(event["error"])
+
+    def end_session(self) -> None:
+        if self.session_id:
+            self._client.delete(f"/sessions/{self.session_id}")
+            self.session_id = None
+
+    def close(self) -> None:
+        self._client.close()
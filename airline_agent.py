@@ -4,58 +4,177 @@
 管理航班信息，提供查询和推荐服务
 """
 
+import asyncio
+import httpx
 import requests
 import json
+import os
+import sys
 from datetime import datetime, time
 from decimal import Decimal
-from typing import Dict, Any, Optional, List
+from time import perf_counter
+from typing import Dict, Any, Optional, List, Iterator, AsyncIterator, Tuple
 from azure_openai_client import azure_client
+from airport_extractor import extract_route
+from recommendation_jobs import RecommendationJobQueue
+from mcp_client import MCP_CLIENT_PAGE_SIZE, MCP_TRANSPORT, AsyncMCPClient, MCPRequestError, aiter_pages, iter_pages, run_sync
+from agent_service import AgentServiceClient, create_agent_app, serve_agent
+from flight_catalog import FLIGHT_SNAPSHOT_ENABLED, FlightCatalog
+from conversation_memory import ConversationMemory, ConversationStore, conversation_store
+
+AIRLINE_AGENT_HOST = os.getenv("AIRLINE_AGENT_HOST", "localhost")
+AIRLINE_AGENT_PORT = int(os.getenv("AIRLINE_AGENT_PORT", 8002))
+
+CHAT_FALLBACK = "我可以帮您查询航班信息、搜索航线或提供出行建议。请告诉我您的具体需求。"
+
+class AsyncAirlineAgent(AsyncMCPClient):
+    """航班查询助手的异步接口：各方法可以用 asyncio.gather 并发调用"""
+    async def get_all_flights(self, skip: int = 0, limit: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """获取所有航班"""
+        params = {"skip": skip, "limit": limit}
+        return await self._make_request("GET", "/flights", params=params)
+    
+    def iter_flights(self, page_size: int = MCP_CLIENT_PAGE_SIZE, prefetch: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """逐页读取全部有效航班（async for），prefetch时处理当前页的同时请求下一页"""
+        return aiter_pages(self.get_all_flights, page_size, prefetch)
+    
+    async def get_flight_by_id(self, flight_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取航班"""
+        return await self._make_request("GET", f"/flights/{flight_id}")
+    
+    async def get_flight_by_number(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        """根据航班号获取航班"""
+        return await self._make_request("GET", f"/flights/number/{flight_number}")
+    
+    async def search_flights(self, departure: str, arrival: str) -> Optional[List[Dict[str, Any]]]:
+        """搜索航班"""
+        return await self._make_request("GET", f"/flights/search/{departure}/{arrival}")
+    
+    async def create_flight(self, flight_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """创建新航班"""
+        return await self._make_request("POST", "/flights", json=flight_data)
+    
+    async def delete_flight(self, flight_id: int) -> bool:
+        """删除航班"""
+        result = await self._make_request("DELETE", f"/flights/{flight_id}")
+        return result is not None
+    
+    async def get_route_recommendation(self, departure: str, arrival: str, wait: bool = False) -> Optional[Dict[str, Any]]:
+        """获取服务器预计算的航线推荐（wait=True时等待过期推荐重新生成）"""
+        return await self._make_request("GET", f"/recommendations/{departure}/{arrival}", params={"wait": wait})
+    
+    async def get_stats(self) -> Optional[Dict[str, Any]]:
+        """获取系统统计信息"""
+        return await self._make_request("GET", "/stats")
+    
+    async def get_flight_changes(self, updated_since: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取updated_since之后变更和删除的航班（不传则返回完整目录）"""
+        params = {"updated_since": updated_since} if updated_since else {}
+        return await self._make_request("GET", "/flights/changes", params=params)
+    
+    async def search_routes(self, routes: List[Tuple[str, str]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """并发搜索多条航线，结果与routes一一对应"""
+        return list(await asyncio.gather(*(self.search_flights(departure, arrival) for departure, arrival in routes)))
+    
+    async def get_flight_overview(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        """获取航班及同航线航班、航线推荐和系统统计（航班之后的三个请求并发发出）"""
+        flight = await self.get_flight_by_number(flight_number)
+        if not flight:
+            return None
+        departure, arrival = flight['departure_airport'], flight['arrival_airport']
+        route_flights, recommendation, stats = await asyncio.gather(
+            self.search_flights(departure, arrival),
+            self.get_route_recommendation(departure, arrival),
+            self.get_stats()
+        )
+        return {"flight": flight, "route_flights": route_flights, "recommendation": recommendation, "stats": stats}
 
 class AirlineAgent:
-    def __init__(self, mcp_server_url: str = "http://localhost:8000"):
+    def __init__(self, mcp_server_url: str = "http://localhost:8000", use_snapshot: bool = FLIGHT_SNAPSHOT_ENABLED,
+                 transport: str = MCP_TRANSPORT, memory: ConversationStore = conversation_store):
         self.mcp_server_url = mcp_server_url
-        self.session = requests.Session()
+        # 同步接口是异步Agent的薄封装，请求在后台事件循环中执行并复用其连接池
+        self.async_agent = AsyncAirlineAgent(mcp_server_url, transport=transport)
+        # AI对话的会话记忆（与预订管理助手共用全局记忆时，可以在预订时引用这里查到的航班）
+        self.memory = memory
+        # 航班目录变化很少，启用快照后航线和航班号查询在本地回答，目录按间隔增量同步
+        self.catalog = FlightCatalog(self.get_flight_changes) if use_snapshot else None
+        # 推荐由服务器按航线预计算，后台任务只负责拉取，避免阻塞航班列表的显示
+        self.recommendation_jobs = RecommendationJobQueue(generate=self._fetch_route_recommendation)
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[Any, Any]]:
-        """发送HTTP请求到MCP服务器"""
-        url = f"{self.mcp_server_url}{endpoint}"
-        try:
-            response = self.session.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"❌ 请求失败: {e}")
-            return None
+    def _snapshot(self) -> Optional[FlightCatalog]:
+        """可用的本地航班目录快照（未启用或同步失败时返回None，查询回退到服务器）"""
+        if self.catalog is not None and self.catalog.ensure_fresh():
+            return self.catalog
+        return None
     
     def get_all_flights(self, skip: int = 0, limit: int = 100) -> Optional[List[Dict[str, Any]]]:
         """获取所有航班"""
-        params = {"skip": skip, "limit": limit}
-        return self._make_request("GET", "/flights", params=params)
+        catalog = self._snapshot()
+        if catalog:
+            return catalog.list_active(skip, limit)
+        return run_sync(self.async_agent.get_all_flights(skip, limit))
+    
+    def iter_flights(self, page_size: int = MCP_CLIENT_PAGE_SIZE, prefetch: bool = True) -> Iterator[Dict[str, Any]]:
+        """逐页读取全部有效航班，不受单页limit限制；prefetch时在后台线程预取下一页"""
+        return iter_pages(self.get_all_flights, page_size, prefetch)
     
     def get_flight_by_id(self, flight_id: int) -> Optional[Dict[str, Any]]:
         """根据ID获取航班"""
-        return self._make_request("GET", f"/flights/{flight_id}")
+        return run_sync(self.async_agent.get_flight_by_id(flight_id))
     
     def get_flight_by_number(self, flight_number: str) -> Optional[Dict[str, Any]]:
         """根据航班号获取航班"""
-        return self._make_request("GET", f"/flights/number/{flight_number}")
+        catalog = self._snapshot()
+        if catalog:
+            return catalog.get_by_number(flight_number)
+        return run_sync(self.async_agent.get_flight_by_number(flight_number))
     
     def search_flights(self, departure: str, arrival: str) -> Optional[List[Dict[str, Any]]]:
         """搜索航班"""
-        return self._make_request("GET", f"/flights/search/{departure}/{arrival}")
+        catalog = self._snapshot()
+        if catalog:
+            return catalog.search(departure, arrival)
+        return run_sync(self.async_agent.search_flights(departure, arrival))
     
     def create_flight(self, flight_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """创建新航班"""
-        return self._make_request("POST", "/flights", json=flight_data)
+        result = run_sync(self.async_agent.create_flight(flight_data))
+        if result and self.catalog is not None:
+            self.catalog.upsert(result)
+        return result
     
     def delete_flight(self, flight_id: int) -> bool:
         """删除航班"""
-        result = self._make_request("DELETE", f"/flights/{flight_id}")
-        return result is not None
+        deleted = run_sync(self.async_agent.delete_flight(flight_id))
+        if deleted and self.catalog is not None:
+            self.catalog.remove(flight_id)
+        return deleted
+    
+    def get_flight_changes(self, updated_since: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取updated_since之后变更和删除的航班（不传则返回完整目录）"""
+        return run_sync(self.async_agent.get_flight_changes(updated_since))
+    
+    def get_route_recommendation(self, departure: str, arrival: str, wait: bool = False) -> Optional[Dict[str, Any]]:
+        """获取服务器预计算的航线推荐（wait=True时等待过期推荐重新生成）"""
+        return run_sync(self.async_agent.get_route_recommendation(departure, arrival, wait))
+    
+    def get_flight_overview(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        """获取航班及同航线航班、航线推荐和系统统计"""
+        return run_sync(self.async_agent.get_flight_overview(flight_number))
+    
+    def _fetch_route_recommendation(self, departure: str, arrival: str, flights: List[Dict[str, Any]]) -> str:
+        # 推荐任务按航班集合哈希缓存结果：只接受最新的推荐，过期的旧推荐不能缓存到新的航班集合下
+        result = self.get_route_recommendation(departure, arrival, wait=True)
+        if not result or not result.get("recommendation"):
+            raise RuntimeError(f"获取 {departure}-{arrival} 航线推荐失败")
+        if result.get("stale"):
+            raise RuntimeError(f"{departure}-{arrival} 航线推荐尚未更新")
+        return result["recommendation"]
     
     def get_stats(self) -> Optional[Dict[str, Any]]:
         """获取系统统计信息"""
-        return self._make_request("GET", "/stats")
+        return run_sync(self.async_agent.get_stats())
     
     def interactive_search_flights(self) -> None:
         """交互式搜索航班"""
@@ -78,9 +197,14 @@ class AirlineAgent:
                 for flight in results:
                     print(f"{flight['flight_number']:<10} {flight['airline']:<15} {flight['departure_time']:<10} {flight['arrival_time']:<10} ¥{flight['price']:<7} {flight['available_seats']:<6}")
                 
-                # AI推荐
-                recommendation = azure_client.generate_flight_recommendation(departure, arrival, results)
-                print(f"\n🤖 AI推荐:\n{recommendation}")
+                # AI推荐在后台生成，完成后自动显示
+                job_id = self.recommendation_jobs.submit(
+                    departure, arrival, results,
+                    callback=lambda job: print(f"\n🤖 AI推荐:\n{job.result or '推荐生成失败'}")
+                )
+                job = self.recommendation_jobs.get(job_id)
+                if job and job["status"] != "done":
+                    print(f"\n🤖 AI推荐生成中... (任务ID: {job_id})")
             else:
                 print("❌ 未找到相关航班")
         
@@ -93,15 +217,22 @@ class AirlineAgent:
                 print("❌ 未找到该航班")
         
         elif search_type == "3":
-            results = self.get_all_flights()
-            if results:
-                print(f"✅ 共有 {len(results)} 个航班:")
-                print("-" * 80)
-                print(f"{'ID':<4} {'航班号':<8} {'航空公司':<15} {'航线':<10} {'价格':<8} {'余票':<6} {'状态':<8}")
-                print("-" * 80)
-                for flight in results:
+            # 逐页读取并边读边显示，航班数量不受单页limit限制
+            count = 0
+            try:
+                for flight in self.iter_flights():
+                    if count == 0:
+                        print("-" * 80)
+                        print(f"{'ID':<4} {'航班号':<8} {'航空公司':<15} {'航线':<10} {'价格':<8} {'余票':<6} {'状态':<8}")
+                        print("-" * 80)
+                    count += 1
                     route = f"{flight['departure_airport']}-{flight['arrival_airport']}"
                     print(f"{flight['id']:<4} {flight['flight_number']:<8} {flight['airline']:<15} {route:<10} ¥{flight['price']:<7} {flight['available_seats']:<6} {flight['status']:<8}")
+            except MCPRequestError as e:
+                print(f"❌ 读取中断，以上 {count} 个航班不是完整列表: {e}")
+                return
+            if count:
+                print(f"✅ 共有 {count} 个航班")
             else:
                 print("❌ 暂无航班记录")
         
@@ -201,6 +332,11 @@ class AirlineAgent:
             print(f"统计时间: {stats['timestamp'][:19]}")
         else:
             print("❌ 无法获取统计信息")
+
+        if self.catalog is not None:
+            snapshot = self.catalog.stats()
+            print(f"本地航班快照: {snapshot['flights']} 个航班 / {snapshot['routes']} 条航线，"
+                  f"本地查询 {snapshot['local_queries']} 次，增量同步 {snapshot['delta_syncs']} 次")
     
     def _display_flight(self, flight: Dict[str, Any]) -> None:
         """显示航班详细信息"""
@@ -218,28 +354,48 @@ class AirlineAgent:
    创建时间: {flight['created_at'][:19]}
 """)
     
-    def ai_chat(self, user_input: str) -> str:
-        """AI智能对话"""
+    def get_recommendation(self, job_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """按任务ID获取AI推荐，timeout为等待秒数（None表示一直等待）"""
+        return self.recommendation_jobs.wait(job_id, timeout=timeout)
+    
+    def _recommendation_text(self, departure: str, arrival: str, flights: List[Dict[str, Any]]) -> str:
+        """提交后台推荐任务：已缓存则直接返回推荐，否则返回任务ID供稍后查询"""
+        job_id = self.recommendation_jobs.submit(departure, arrival, flights)
+        job = self.recommendation_jobs.get(job_id)
+        if job and job["status"] == "done":
+            return f"AI推荐: {job['result']}"
+        return f"AI推荐生成中，任务ID: {job_id}（输入 'rec {job_id}' 查看）"
+    
+    def _flight_reply(self, flight: Dict[str, Any]) -> str:
+        return (f"✈️ {flight['flight_number']} ({flight['airline']}) {flight['departure_airport']}→{flight['arrival_airport']} "
+                f"{flight['departure_time']}-{flight['arrival_time']} | ¥{flight['price']} | 余票: {flight['available_seats']}")
+    
+    def _local_reply(self, user_input: str, memory: ConversationMemory) -> Optional[str]:
+        """基于关键词直接处理航班搜索、推荐和统计请求，无法处理时返回None"""
         # 分析用户输入，提取航班查询意图
         user_input_lower = user_input.lower()
+        # 提取出发地和目的地（支持机场代码、中英文城市名和机场别名）
+        departure, arrival = extract_route(user_input)
+        
+        # 引用本会话查到过的航班（"第2个"、"这个航班"、航班号）时直接用记忆中的数据回答
+        if not (departure and arrival):
+            flight = memory.resolve_flight(user_input)
+            if flight is not None:
+                memory.remember(flight=flight)
+                return self._flight_reply(flight)
         
         # 简单的意图识别
         if any(keyword in user_input_lower for keyword in ['搜索', '查找', '航班', '查询']):
-            # 尝试提取机场代码
-            airports = ["pek", "sha", "pvg", "can", "ctu", "kmg", "xiy", "hgh"]
-            found_airports = [airport.upper() for airport in airports if airport in user_input_lower]
-            
-            if len(found_airports) >= 2:
-                departure, arrival = found_airports[0], found_airports[1]
+            if departure and arrival:
                 results = self.search_flights(departure, arrival)
+                memory.remember(route=(departure, arrival), flights=results or [])
                 if results:
                     response = f"为您找到 {len(results)} 个从 {departure} 到 {arrival} 的航班:\n"
                     for flight in results:
                         response += f"- {flight['flight_number']} ({flight['airline']}) - ¥{flight['price']}\n"
                     
                     # 添加AI推荐
-                    recommendation = azure_client.generate_flight_recommendation(departure, arrival, results)
-                    response += f"\n🤖 AI推荐: {recommendation}"
+                    response += f"\n🤖 {self._recommendation_text(departure, arrival, results)}"
                     return response
                 else:
                     return f"抱歉，未找到从 {departure} 到 {arrival} 的航班。"
@@ -248,30 +404,80 @@ class AirlineAgent:
             # 获取一些热门航班进行推荐
             all_flights = self.get_all_flights(limit=5)
             if all_flights:
+                memory.remember(flights=all_flights)
                 flights_text = "以下是一些推荐航班:\n"
                 for flight in all_flights:
                     flights_text += f"- {flight['flight_number']} ({flight['airline']}) {flight['departure_airport']}→{flight['arrival_airport']} ¥{flight['price']}\n"
                 
-                # 使用AI生成个性化推荐
-                recommendation = azure_client.generate_flight_recommendation("热门", "推荐", all_flights)
-                return f"{flights_text}\n🤖 {recommendation}"
+                # 推荐按航线预计算，取列表中第一条航线的推荐
+                departure, arrival = all_flights[0]['departure_airport'], all_flights[0]['arrival_airport']
+                route_flights = [f for f in all_flights
+                                 if (f['departure_airport'], f['arrival_airport']) == (departure, arrival)]
+                return f"{flights_text}\n🤖 {departure}→{arrival} {self._recommendation_text(departure, arrival, route_flights)}"
         
         elif any(keyword in user_input_lower for keyword in ['统计', '数据', '信息']):
             stats = self.get_stats()
             if stats:
                 return f"📊 系统统计:\n- 总航班数: {stats['total_flights']}\n- 总预订数: {stats['total_bookings']}\n- 已确认预订: {stats['confirmed_bookings']}"
         
-        # 默认AI回复
-        messages = [
+        return None
+    
+    def _chat_messages(self, user_input: str, memory: ConversationMemory) -> list:
+        # 会话上下文只包含压缩摘要、已知实体和最近几轮对话
+        return [
             {"role": "system", "content": "你是一个专业的航班查询助手。帮助用户查询航班信息、提供出行建议。"},
+            *memory.context_messages(),
             {"role": "user", "content": user_input}
         ]
-        
-        response = azure_client.chat_completion(messages, max_tokens=300, temperature=0.7)
-        return response or "我可以帮您查询航班信息、搜索航线或提供出行建议。请告诉我您的具体需求。"
     
-    def run_interactive_mode(self) -> None:
-        """运行交互模式"""
+    def ai_chat(self, user_input: str, session_id: Optional[str] = None) -> str:
+        """AI智能对话（session_id为空时使用默认会话）"""
+        memory = self.memory.get(session_id)
+        reply = self._local_reply(user_input, memory)
+        if reply is None:
+            # 默认AI回复
+            reply = azure_client.chat_completion(self._chat_messages(user_input, memory), max_tokens=300,
+                                                 temperature=0.7) or CHAT_FALLBACK
+        memory.add_turn("user", user_input)
+        memory.add_turn("agent", reply)
+        return reply
+    
+    def ai_chat_stream(self, user_input: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """流式AI对话：关键词可直接处理的请求整体产出，其余逐块产出LLM回复"""
+        memory = self.memory.get(session_id)
+        chunks = []
+        try:
+            reply = self._local_reply(user_input, memory)
+            if reply is not None:
+                chunks.append(reply)
+                yield reply
+                return
+            
+            for chunk in azure_client.chat_completion(self._chat_messages(user_input, memory), max_tokens=300,
+                                                      temperature=0.7, stream=True):
+                chunks.append(chunk)
+                yield chunk
+            if not chunks:
+                chunks.append(CHAT_FALLBACK)
+                yield CHAT_FALLBACK
+        finally:
+            memory.add_turn("user", user_input)
+            memory.add_turn("agent", "".join(chunks))
+    
+    def _print_stream(self, chunks: Iterator[str]) -> None:
+        """边接收边打印回复，并分别报告首字延迟和总耗时"""
+        print("🤖 AI助手: ", end="", flush=True)
+        start = perf_counter()
+        first_chunk = None
+        for chunk in chunks:
+            if first_chunk is None:
+                first_chunk = perf_counter() - start
+            print(chunk, end="", flush=True)
+        total = perf_counter() - start
+        print(f"\n⏱️  首字延迟: {(first_chunk or total) * 1000:.0f}ms | 总耗时: {total * 1000:.0f}ms")
+    
+    def run_interactive_mode(self, chat_client: Optional[AgentServiceClient] = None) -> None:
+        """运行交互模式（chat_client为Agent服务的客户端时，AI对话在服务端的会话中进行）"""
         print("✈️ 智能航班查询助手")
         print("=" * 60)
         
@@ -281,7 +487,8 @@ class AirlineAgent:
             print("2. create - 创建航班")
             print("3. delete - 删除航班")
             print("4. stats - 系统统计")
-            print("5. quit - 退出")
+            print("5. rec <任务ID> - 查看AI推荐")
+            print("6. quit - 退出")
             print("或直接输入问题进行AI对话")
             
             user_input = input("\n请输入命令或询问: ").strip()
@@ -300,11 +507,33 @@ class AirlineAgent:
                 self.interactive_delete_flight()
             elif user_input.lower() == 'stats':
                 self.show_stats()
+            elif user_input.lower().startswith('rec '):
+                job_id = user_input[4:].strip()
+                recommendation = self.get_recommendation(job_id, timeout=30)
+                print(f"🤖 AI推荐:\n{recommendation}" if recommendation else f"❌ 未找到推荐任务或生成失败: {job_id}")
             else:
-                # AI对话模式
-                print("🤖 AI助手:", self.ai_chat(user_input))
+                # AI对话模式（流式输出）：连接了Agent服务时由服务处理，否则在本进程中处理
+                if chat_client is None:
+                    self._print_stream(self.ai_chat_stream(user_input))
+                    continue
+                try:
+                    self._print_stream(chat_client.stream(user_input))
+                except (httpx.HTTPError, RuntimeError) as e:
+                    print(f"\n❌ Agent服务请求失败: {e}")
+
+def create_app(agent: Optional[AirlineAgent] = None):
+    """把航班查询助手发布为A2A风格的HTTP服务"""
+    return create_agent_app(agent or AirlineAgent(), "航班查询助手", "航班查询助手：搜索航线、查询航班和提供出行推荐", [
+        {"id": "search_flights", "name": "搜索航班", "description": "按出发地和目的地（机场代码或城市名）搜索航班"},
+        {"id": "recommend", "name": "航线推荐", "description": "根据价格、时间和余票推荐航班"},
+        {"id": "stats", "name": "系统统计", "description": "航班和预订的统计信息"}
+    ])
 
 def main():
+    # 用法: python airline_agent.py [serve | connect [Agent服务地址]]
+    args = sys.argv[1:]
+    mode = args[0] if args else "interactive"
+    
     # 检查MCP服务器连接
     agent = AirlineAgent()
     
@@ -320,8 +549,29 @@ def main():
         print("启动命令: python mcp_server.py")
         return
     
+    if mode == "serve":
+        # 作为Agent服务运行，同时服务多个会话
+        serve_agent(create_app(agent), AIRLINE_AGENT_HOST, AIRLINE_AGENT_PORT)
+        return
+    
+    chat_client = None
+    if mode == "connect":
+        agent_url = args[1] if len(args) > 1 else f"http://{AIRLINE_AGENT_HOST}:{AIRLINE_AGENT_PORT}"
+        chat_client = AgentServiceClient(agent_url)
+        try:
+            print(f"🔗 已连接Agent服务: {chat_client.agent_card()['name']} ({agent_url})")
+        except httpx.HTTPError:
+            print(f"❌ 无法连接到Agent服务: {agent_url}")
+            print(f"启动命令: python airline_agent.py serve")
+            return
+    
     # 启动交互模式
-    agent.run_interactive_mode()
+    try:
+        agent.run_interactive_mode(chat_client)
+    finally:
+        if chat_client is not None:
+            chat_client.end_session()
+            chat_client.close()
 
 if __name__ == "__main__":
     main()
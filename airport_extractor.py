@@ -0,0 +1,217 @@
+"""
+机场/城市实体抽取
+用Aho-Corasick多模式自动机一次线性扫描识别文本中的机场代码、中英文城市名和机场别名，
+再根据"从/到/from/to"等提示词确定出发地和目的地。
+机场词典默认读取项目根目录的 airports.json，可用 AIRPORTS_DATA_PATH 指向更完整的词典；
+自动机在首次使用时构建，每个进程只构建一次
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+AIRPORTS_DATA_PATH = os.getenv("AIRPORTS_DATA_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "airports.json"
+)
+
+# 同时是常见英文单词的机场代码，只在大写书写时识别（避免 "can you..." 被识别为广州）
+AMBIGUOUS_CODES = {"CAN", "SEA", "MAD", "SIN", "SHE", "DEL", "INC", "MEL", "HAN", "BOS", "AMS", "VIE", "HEL"}
+
+# 紧挨在机场前面的提示词，用于判断出发地/目的地
+ORIGIN_CUES = ("从", "由", "自", "from")
+DESTINATION_CUES = ("到", "至", "去", "飞往", "前往", "抵达", "飞", "回", "to", "→", "->", "-", "—")
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机：构建后一次扫描找出所有模式的所有出现位置"""
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态结束的模式：[(模式长度, 值)]，构建时沿失败链合并
+        self._output: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: Any) -> None:
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        # 同一模式只保留第一个值（例如同城多机场时城市名对应词典中排在前面的主机场）
+        if not any(length == len(pattern) for length, _ in self._output[state]):
+            self._output[state].append((len(pattern), value))
+        self._built = False
+
+    def build(self) -> None:
+        """按广度优先计算失败指针"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail if fail != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+
+    def iter(self, text: str):
+        """
+        Yields:
+            (起始位置, 结束位置, 值)
+        """
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield i + 1 - length, i + 1, value
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+class AirportExtractor:
+    """从文本中抽取机场，按出现顺序返回不重叠的最长匹配"""
+    def __init__(self, airports: List[Dict[str, Any]]):
+        self.airports = {airport["iata"].upper(): airport for airport in airports}
+        self._automaton = AhoCorasick()
+        self.pattern_count = 0
+        for airport in airports:
+            code = airport["iata"].upper()
+            # 先加入机场代码和别名，再加入城市名：别名精确指向具体机场，城市名指向该城市的首个机场
+            self._add(code, code, "code")
+            for alias in airport.get("aliases", []):
+                self._add(alias, code, "alias")
+        for airport in airports:
+            code = airport["iata"].upper()
+            for name in (airport.get("city"), airport.get("city_en")):
+                if name:
+                    self._add(name, code, "city")
+        self._automaton.build()
+
+    @classmethod
+    def from_file(cls, path: str = AIRPORTS_DATA_PATH) -> "AirportExtractor":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _add(self, pattern: str, code: str, kind: str) -> None:
+        self._automaton.add(pattern.lower(), (code, kind))
+        self.pattern_count += 1
+
+    @staticmethod
+    def _valid(text: str, lowered: str, start: int, end: int, code: str, kind: str) -> bool:
+        matched = lowered[start:end]
+        if matched.isascii():
+            # 英文模式需完整单词匹配，避免 "sha" 匹配到 "shanghai" 或 "washington" 内部
+            if start > 0 and _is_word_char(lowered[start - 1]):
+                return False
+            if end < len(lowered) and _is_word_char(lowered[end]):
+                return False
+            if kind == "code" and code in AMBIGUOUS_CODES and not text[start:end].isupper():
+                return False
+        return True
+
+    def extract(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            [{"iata": 机场代码, "text": 原文, "start": 起始位置, "end": 结束位置, "kind": code/alias/city}]
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # 个别Unicode字符小写后长度改变，位置无法与原文对应，退回逐字符小写
+            lowered = "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+        candidates = [
+            (start, end, code, kind)
+            for start, end, (code, kind) in self._automaton.iter(lowered)
+            if self._valid(text, lowered, start, end, code, kind)
+        ]
+        # 最左最长：按起始位置、长度降序排序后贪心选取不重叠的匹配
+        candidates.sort(key=lambda match: (match[0], match[0] - match[1]))
+        matches, last_end = [], 0
+        for start, end, code, kind in candidates:
+            if start >= last_end:
+                matches.append({"iata": code, "text": text[start:end], "start": start, "end": end, "kind": kind})
+                last_end = end
+        return matches
+
+    def extract_route(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        识别出发地和目的地
+
+        带"从/from"提示的机场作为出发地，带"到/去/飞往/to"提示的作为目的地，
+        其余按出现顺序补位（"北京 上海"、"PEK-SHA" 即北京出发到上海）
+
+        Returns:
+            (出发机场代码, 到达机场代码)，未识别的一方为None
+        """
+        matches = self.extract(text)
+        # 相邻重复（如"上海虹桥"之后又写了"SHA"）只保留一次
+        airports = []
+        for match in matches:
+            if not airports or airports[-1]["iata"] != match["iata"]:
+                airports.append(match)
+
+        origin = destination = None
+        previous_end = 0
+        roles = []
+        for match in airports:
+            between = text[previous_end:match["start"]].strip().lower()
+            if between.endswith(DESTINATION_CUES) and not between.endswith(ORIGIN_CUES):
+                roles.append("destination")
+            elif between.endswith(ORIGIN_CUES):
+                roles.append("origin")
+            else:
+                roles.append(None)
+            previous_end = match["end"]
+
+        for match, role in zip(airports, roles):
+            if role == "origin" and origin is None:
+                origin = match["iata"]
+            elif role == "destination" and destination is None and match["iata"] != origin:
+                destination = match["iata"]
+        for match, role in zip(airports, roles):
+            if match["iata"] in (origin, destination):
+                continue
+            if origin is None:
+                origin = match["iata"]
+            elif destination is None:
+                destination = match["iata"]
+        return origin, destination
+
+_extractor: Optional[AirportExtractor] = None
+_extractor_lock = threading.Lock()
+
+def get_airport_extractor() -> AirportExtractor:
+    """获取进程内共享的抽取器，首次调用时加载词典并构建自动机"""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = AirportExtractor.from_file()
+    return _extractor
+
+def extract_airports(text: str) -> List[Dict[str, Any]]:
+    return get_airport_extractor().extract(text)
+
+def extract_route(text: str) -> Tuple[Optional[str], Optional[str]]:
+    return get_airport_extractor().extract_route(text)
@@ -4,16 +4,384 @@ Azure OpenAI客户端
 """
 
 import os
+import re
 import json
-import requests
-from typing import Optional, Dict, Any
+import time
+import random
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import httpx
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Tuple, Iterator, AsyncIterator, Callable, Union
 from dotenv import load_dotenv
 
+from rate_limiter import RateLimiter
+from recommendation_prompt import build_recommendation_prompt, estimate_tokens
+
 # 加载环境变量
 load_dotenv()
 
+# 连接池配置
+AZURE_OPENAI_TIMEOUT = float(os.getenv("AZURE_OPENAI_TIMEOUT", 30))
+AZURE_OPENAI_MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", 20))
+AZURE_OPENAI_MAX_KEEPALIVE = int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE", 10))
+AZURE_OPENAI_HTTP2 = os.getenv("AZURE_OPENAI_HTTP2", "0") == "1"
+
+# 重试、熔断与延迟预算配置
+AZURE_OPENAI_DEADLINE = float(os.getenv("AZURE_OPENAI_DEADLINE", 30))
+AZURE_OPENAI_MAX_RETRIES = int(os.getenv("AZURE_OPENAI_MAX_RETRIES", 3))
+AZURE_OPENAI_RETRY_BASE_DELAY = float(os.getenv("AZURE_OPENAI_RETRY_BASE_DELAY", 0.5))
+AZURE_OPENAI_RETRY_MAX_DELAY = float(os.getenv("AZURE_OPENAI_RETRY_MAX_DELAY", 8))
+AZURE_OPENAI_BREAKER_THRESHOLD = int(os.getenv("AZURE_OPENAI_BREAKER_THRESHOLD", 5))
+AZURE_OPENAI_BREAKER_COOLDOWN = float(os.getenv("AZURE_OPENAI_BREAKER_COOLDOWN", 30))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# AZURE_OPENAI_LOG_USAGE=1 时每次调用打印token用量
+AZURE_OPENAI_LOG_USAGE = os.getenv("AZURE_OPENAI_LOG_USAGE", "0") == "1"
+
+# 响应缓存配置
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", 512))
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", 0.7))
+# 各调用类型的缓存有效期（秒）
+LLM_CACHE_TTLS = {
+    "analyze": int(os.getenv("LLM_CACHE_TTL_ANALYZE", 24 * 3600)),
+    "recommendation": int(os.getenv("LLM_CACHE_TTL_RECOMMENDATION", 1800)),
+    "chat": int(os.getenv("LLM_CACHE_TTL_CHAT", 300)),
+}
+
+class LLMResponseCache:
+    """
+    LLM响应缓存：内存LRU + SQLite磁盘层（进程重启后仍有效）
+
+    键为规范化后的消息与参数的哈希；温度高于阈值的调用输出随机性大，不走缓存。
+    """
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, memory_size: int = LLM_CACHE_MEMORY_SIZE,
+                 ttls: Optional[Dict[str, int]] = None, max_temperature: float = LLM_CACHE_MAX_TEMPERATURE):
+        self.memory_size = memory_size
+        self.ttls = dict(LLM_CACHE_TTLS, **(ttls or {}))
+        self.max_temperature = max_temperature
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, call_type TEXT, value TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+    
+    @staticmethod
+    def make_key(endpoint: str, messages: list, max_tokens: int, temperature: float) -> str:
+        """规范化消息（合并空白）后计算缓存键"""
+        normalized = [
+            {"role": m.get("role"), "content": re.sub(r"\s+", " ", str(m.get("content", ""))).strip()}
+            for m in messages
+        ]
+        raw = json.dumps(
+            {"endpoint": endpoint, "messages": normalized, "max_tokens": max_tokens, "temperature": round(temperature, 3)},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def cacheable(self, call_type: str, temperature: float) -> bool:
+        if temperature > self.max_temperature or self.ttls.get(call_type, 0) <= 0:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return False
+        return True
+    
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+            if entry:
+                del self._memory[key]
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    self._remember(key, row[0], row[1])
+                    self._stats["disk_hits"] += 1
+                    return row[0]
+            
+            self._stats["misses"] += 1
+            return None
+    
+    def set(self, key: str, call_type: str, value: str) -> None:
+        expires_at = time.time() + self.ttls.get(call_type, 0)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, call_type, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, call_type, value, expires_at)
+                )
+                self._db.commit()
+    
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+    
+    def purge_expired(self) -> int:
+        """清理磁盘层中已过期的条目"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            self._db.commit()
+        return deleted
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，冷却期内直接拒绝调用（调用方走降级回复）；
+    冷却期过后放行一次试探调用（半开），成功则关闭，失败则重新打开
+    """
+    def __init__(self, failure_threshold: int = AZURE_OPENAI_BREAKER_THRESHOLD,
+                 cooldown: float = AZURE_OPENAI_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def release(self) -> None:
+        """已放行的调用最终没有发出请求（如本地限流拒绝）：归还半开状态的试探名额，不改变熔断状态"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+                print(f"⚠️  Azure OpenAI连续失败 {self.consecutive_failures} 次，熔断 {self.cooldown:g} 秒")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened
+            }
+
+def _retry_after_seconds(response: Optional[httpx.Response]) -> Optional[float]:
+    """读取429/503响应中的重试等待时间（Azure会返回retry-after-ms）"""
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return max(float(value) * scale, 0.0)
+            except ValueError:
+                continue
+    return None
+
+# SSE流结束标记
+_STREAM_DONE = object()
+
+async def _aiter(items: list) -> AsyncIterator:
+    for item in items:
+        yield item
+
+def _parse_sse_line(line: str):
+    """解析一行SSE数据，返回文本增量、_STREAM_DONE或None（非内容行）"""
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    payload = line[len("data:"):].strip()
+    if payload == "[DONE]":
+        return _STREAM_DONE
+    chunk = json.loads(payload)
+    # Azure的首个数据块可能只有prompt_filter_results，choices为空
+    if not chunk.get("choices"):
+        return None
+    return chunk["choices"][0].get("delta", {}).get("content") or None
+
+class ChatStream:
+    """
+    流式响应：逐块迭代文本增量，记录首字延迟(TTFT)和总耗时
+
+    迭代结束后 text 为完整回复，completed 表示是否正常收到结束标记。
+    """
+    def __init__(self, chunks: Iterator[str], on_complete: Optional[Callable[["ChatStream"], None]] = None):
+        self._chunks = chunks
+        self._on_complete = on_complete
+        self._parts = []
+        self.completed = False
+        self.ttft: Optional[float] = None
+        self.total_latency: Optional[float] = None
+    
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        for chunk in self._chunks:
+            if chunk is _STREAM_DONE:
+                self.completed = True
+                continue
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - start
+            self._parts.append(chunk)
+            yield chunk
+        self.total_latency = time.perf_counter() - start
+        if self._on_complete:
+            self._on_complete(self)
+    
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+class AsyncChatStream(ChatStream):
+    """ChatStream的异步版本，使用 async for 迭代"""
+    def __init__(self, chunks: AsyncIterator[str], on_complete: Optional[Callable[["ChatStream"], None]] = None):
+        super().__init__(iter(()), on_complete)
+        self._achunks = chunks
+    
+    async def __aiter__(self) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        async for chunk in self._achunks:
+            if chunk is _STREAM_DONE:
+                self.completed = True
+                continue
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - start
+            self._parts.append(chunk)
+            yield chunk
+        self.total_latency = time.perf_counter() - start
+        if self._on_complete:
+            self._on_complete(self)
+
+class JSONFieldStreamer:
+    """
+    从流式生成的JSON中增量提取某个字符串字段的内容
+
+    LLM按提示输出 {"intent": ..., "response": "..."} 时，可以在JSON尚未生成完毕时
+    就把response字段逐字交给用户；若输出不是JSON，则原样透传。
+    """
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+    
+    def __init__(self, field: str):
+        self._pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = 0
+        self._mode = None  # None: 未确定, "json": 查找/读取字段, "text": 透传
+        self._in_value = False
+        self._finished = False
+    
+    def feed(self, chunk: str) -> str:
+        """输入一个文本增量，返回本次可以输出的字段内容"""
+        self._buffer += chunk
+        if self._mode is None:
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                return ""
+            self._mode = "json" if stripped[0] == "{" else "text"
+            if self._mode == "text":
+                return self._buffer
+        elif self._mode == "text":
+            return chunk
+        
+        if self._finished:
+            return ""
+        if not self._in_value:
+            match = self._pattern.search(self._buffer, self._pos)
+            if not match:
+                return ""
+            self._in_value = True
+            self._pos = match.end()
+        
+        output = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if char == '"':
+                self._finished = True
+                break
+            if char == "\\":
+                if self._pos + 1 >= len(buffer):
+                    break
+                escape = buffer[self._pos + 1]
+                if escape == "u":
+                    if self._pos + 6 > len(buffer):
+                        break
+                    output.append(chr(int(buffer[self._pos + 2:self._pos + 6], 16)))
+                    self._pos += 6
+                    continue
+                output.append(self._ESCAPES.get(escape, escape))
+                self._pos += 2
+                continue
+            output.append(char)
+            self._pos += 1
+        return "".join(output)
+
+def _http2_supported() -> bool:
+    """HTTP/2需要安装h2 (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def fallback_recommendation(flights: list) -> str:
+    """LLM调用失败时的降级推荐文本"""
+    return f"为您找到 {len(flights)} 个航班选择，请根据时间和价格需求选择。"
+
 class AzureOpenAIClient:
-    def __init__(self):
+    def __init__(self, max_connections: int = AZURE_OPENAI_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = AZURE_OPENAI_MAX_KEEPALIVE,
+                 timeout: float = AZURE_OPENAI_TIMEOUT,
+                 http2: bool = AZURE_OPENAI_HTTP2,
+                 cache: Optional[LLMResponseCache] = None,
+                 max_retries: int = AZURE_OPENAI_MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
         self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
         
@@ -23,8 +391,313 @@ class AzureOpenAIClient:
             self.available = False
         else:
             self.available = True
+        
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.timeout = timeout
+        self.http2 = http2 and _http2_supported()
+        # 长连接客户端按需创建：同步客户端全局共享，异步客户端与事件循环绑定
+        self._client: Optional[httpx.Client] = None
+        self._client_lock = threading.Lock()
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop = None
+        
+        if cache is None and LLM_CACHE_ENABLED and self.available:
+            cache = LLMResponseCache()
+        self.cache = cache
+        self._stream_stats = {"streams": 0, "ttft_total": 0.0, "latency_total": 0.0}
+        self._stream_lock = threading.Lock()
+        
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._call_stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0, "throttled": 0}
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._latencies = deque(maxlen=1000)
+        self._token_usage: Dict[str, Dict[str, int]] = {}
+    
+    def _get_client(self) -> httpx.Client:
+        # 推荐任务等会在多个线程中并发调用，连接池只创建一次
+        with self._client_lock:
+            if self._client is None:
+                self._client = httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            return self._client
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            self._async_loop = loop
+        return self._async_client
     
-    def chat_completion(self, messages: list, max_tokens: int = 1000, temperature: float = 0.7) -> Optional[str]:
+    def _build_request(self, messages: list, max_tokens: int, temperature: float) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        headers = {
+            "Content-Type": "application/json",
+            "api-key": self.api_key
+        }
+        
+        data = {
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        return headers, data
+    
+    def _parse_response(self, response: httpx.Response, call_type: str = "chat") -> Optional[str]:
+        if response.status_code == 200:
+            result = response.json()
+            self._record_usage(call_type, result.get("usage"))
+            return result["choices"][0]["message"]["content"]
+        print(f"❌ Azure OpenAI API错误: {response.status_code}")
+        print(f"错误详情: {response.text}")
+        return None
+    
+    def _record_usage(self, call_type: str, usage: Optional[Dict[str, Any]]) -> None:
+        """按调用类型累计响应中的prompt/completion token用量"""
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        with self._stream_lock:
+            totals = self._token_usage.setdefault(call_type, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+        if AZURE_OPENAI_LOG_USAGE:
+            print(f"🧮 [{call_type}] token用量: prompt {prompt_tokens} / completion {completion_tokens}")
+    
+    def _cache_lookup(self, messages: list, max_tokens: int, temperature: float, call_type: str) -> Tuple[Optional[str], Optional[str]]:
+        """返回 (缓存键, 缓存内容)；不可缓存时缓存键为None"""
+        if self.cache is None or not self.cache.cacheable(call_type, temperature):
+            return None, None
+        key = self.cache.make_key(self.endpoint, messages, max_tokens, temperature)
+        return key, self.cache.get(key)
+    
+    def _cache_store(self, key: Optional[str], call_type: str, content: Optional[str]) -> None:
+        if key is not None and content is not None:
+            self.cache.set(key, call_type, content)
+    
+    def _stream_finished(self, key: Optional[str], call_type: str) -> Callable[[ChatStream], None]:
+        """流结束回调：记录延迟统计，完整收到的回复写入缓存"""
+        def finished(stream: ChatStream) -> None:
+            with self._stream_lock:
+                self._stream_stats["streams"] += 1
+                self._stream_stats["ttft_total"] += stream.ttft or 0.0
+                self._stream_stats["latency_total"] += stream.total_latency or 0.0
+            if stream.completed and stream.text:
+                self._cache_store(key, call_type, stream.text)
+        return finished
+    
+    def _next_retry_delay(self, attempt: int, response: Optional[httpx.Response], deadline_at: float) -> Optional[float]:
+        """计算下一次重试前的等待时间；不应再重试（次数用尽或超出预算）时返回None"""
+        if attempt >= self.max_retries:
+            return None
+        delay = _retry_after_seconds(response)
+        if delay is None:
+            # 指数退避 + 全抖动
+            delay = random.uniform(0, min(AZURE_OPENAI_RETRY_MAX_DELAY, AZURE_OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+        delay = min(delay, AZURE_OPENAI_RETRY_MAX_DELAY)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        with self._stream_lock:
+            self._call_stats["retries"] += 1
+        return delay
+    
+    def _finish_call(self, start: float, success: Optional[bool]) -> None:
+        """记录一次调用的结果；success为None表示被熔断器拒绝"""
+        with self._stream_lock:
+            if success is None:
+                self._call_stats["rejected"] += 1
+                return
+            self._call_stats["calls"] += 1
+            self._call_stats["successes" if success else "failures"] += 1
+            self._latencies.append(time.monotonic() - start)
+    
+    def _request_tokens(self, data: Dict[str, Any]) -> int:
+        """估算请求计入TPM配额的token数（Azure按prompt + max_tokens计算）"""
+        return sum(estimate_tokens(str(m.get("content", ""))) for m in data["messages"]) + data.get("max_tokens", 0)
+    
+    def _quota_wait(self, tokens: int, deadline_at: float) -> Optional[float]:
+        """预约本地限流配额，返回需要等待的秒数；在耗时预算内拿不到配额时返回None"""
+        if not self.rate_limiter.enabled:
+            return 0.0
+        wait = self.rate_limiter.reserve(tokens, max_wait=deadline_at - time.monotonic())
+        if wait is None:
+            with self._stream_lock:
+                self._call_stats["throttled"] += 1
+            print("⚠️  本地限流: 等待配额的时间超出耗时预算")
+        return wait
+    
+    def _on_retryable_response(self, response: Optional[httpx.Response]) -> None:
+        """服务端返回429时让共享同一限流器的所有调用方一起暂停"""
+        if response is not None and response.status_code == 429 and self.rate_limiter.enabled:
+            self.rate_limiter.penalize(_retry_after_seconds(response) or AZURE_OPENAI_RETRY_BASE_DELAY)
+    
+    def _send_with_retries(self, send: Callable[[float], httpx.Response], deadline: Optional[float],
+                           tokens: int = 0) -> Optional[httpx.Response]:
+        """
+        发送请求：每次尝试前先按本地限流配额排队；429/5xx和网络错误按抖动指数退避重试
+        （优先遵循Retry-After），整个过程不超过deadline秒；熔断器打开时直接返回None
+        """
+        if not self.breaker.allow():
+            self._finish_call(0.0, None)
+            return None
+        
+        try:
+            start = time.monotonic()
+            deadline_at = start + (deadline if deadline is not None else AZURE_OPENAI_DEADLINE)
+            response = None
+            attempt = 0
+            while True:
+                wait = self._quota_wait(tokens, deadline_at)
+                if wait is None:
+                    if attempt == 0:
+                        # 请求没有发出，不计成功或失败
+                        self.breaker.release()
+                        return None
+                    break
+                time.sleep(wait)
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    response = send(min(self.timeout, remaining))
+                except httpx.HTTPError as e:
+                    print(f"❌ 请求异常: {e}")
+                    response = None
+                else:
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        # 4xx等非重试类错误说明服务本身可达，不计入熔断
+                        self.breaker.record_success()
+                        self._finish_call(start, response.status_code == 200)
+                        return response
+                    self._on_retryable_response(response)
+                delay = self._next_retry_delay(attempt, response, deadline_at)
+                if delay is None:
+                    break
+                time.sleep(delay)
+                attempt += 1
+        
+            self.breaker.record_failure()
+            self._finish_call(start, False)
+            return response
+        except BaseException:
+            # 异常或取消时归还试探名额，否则半开的熔断器会一直拒绝调用
+            self.breaker.release()
+            raise
+    
+    async def _asend_with_retries(self, send: Callable[[float], Any], deadline: Optional[float],
+                                  tokens: int = 0) -> Optional[httpx.Response]:
+        """_send_with_retries的异步版本"""
+        if not self.breaker.allow():
+            self._finish_call(0.0, None)
+            return None
+        
+        try:
+            start = time.monotonic()
+            deadline_at = start + (deadline if deadline is not None else AZURE_OPENAI_DEADLINE)
+            response = None
+            attempt = 0
+            while True:
+                wait = self._quota_wait(tokens, deadline_at)
+                if wait is None:
+                    if attempt == 0:
+                        # 请求没有发出，不计成功或失败
+                        self.breaker.release()
+                        return None
+                    break
+                await asyncio.sleep(wait)
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    response = await send(min(self.timeout, remaining))
+                except httpx.HTTPError as e:
+                    print(f"❌ 请求异常: {e}")
+                    response = None
+                else:
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        self.breaker.record_success()
+                        self._finish_call(start, response.status_code == 200)
+                        return response
+                    self._on_retryable_response(response)
+                delay = self._next_retry_delay(attempt, response, deadline_at)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                attempt += 1
+        
+            self.breaker.record_failure()
+            self._finish_call(start, False)
+            return response
+        except BaseException:
+            # 异常或取消时归还试探名额，否则半开的熔断器会一直拒绝调用
+            self.breaker.release()
+            raise
+    
+    def _stream_chunks(self, headers: Dict[str, str], data: Dict[str, Any], deadline: Optional[float]) -> Iterator[str]:
+        client = self._get_client()
+        
+        def send(timeout: float) -> httpx.Response:
+            request = client.build_request("POST", self.endpoint, headers=headers, json=data, timeout=timeout)
+            response = client.send(request, stream=True)
+            if response.status_code != 200:
+                response.read()
+                response.close()
+            return response
+        
+        # 只有建立流之前的失败会重试，开始产出内容后不再重试
+        response = self._send_with_retries(send, deadline, self._request_tokens(data))
+        if response is None:
+            return
+        if response.status_code != 200:
+            self._parse_response(response)
+            return
+        try:
+            for line in response.iter_lines():
+                content = _parse_sse_line(line)
+                if content is not None:
+                    yield content
+        except httpx.HTTPError as e:
+            print(f"❌ 请求异常: {e}")
+        except Exception as e:
+            print(f"❌ 未知错误: {e}")
+        finally:
+            response.close()
+    
+    async def _astream_chunks(self, headers: Dict[str, str], data: Dict[str, Any], deadline: Optional[float]) -> AsyncIterator[str]:
+        client = self._get_async_client()
+        
+        async def send(timeout: float) -> httpx.Response:
+            request = client.build_request("POST", self.endpoint, headers=headers, json=data, timeout=timeout)
+            response = await client.send(request, stream=True)
+            if response.status_code != 200:
+                await response.aread()
+                await response.aclose()
+            return response
+        
+        response = await self._asend_with_retries(send, deadline, self._request_tokens(data))
+        if response is None:
+            return
+        if response.status_code != 200:
+            self._parse_response(response)
+            return
+        try:
+            async for line in response.aiter_lines():
+                content = _parse_sse_line(line)
+                if content is not None:
+                    yield content
+        except httpx.HTTPError as e:
+            print(f"❌ 请求异常: {e}")
+        except Exception as e:
+            print(f"❌ 未知错误: {e}")
+        finally:
+            await response.aclose()
+    
+    def chat_completion(self, messages: list, max_tokens: int = 1000, temperature: float = 0.7,
+                        call_type: str = "chat", stream: bool = False,
+                        deadline: Optional[float] = None) -> Union[Optional[str], ChatStream]:
         """
         发送聊天完成请求到Azure OpenAI
         
@@ -32,60 +705,135 @@ class AzureOpenAIClient:
             messages: 消息列表
             max_tokens: 最大令牌数
             temperature: 温度参数
+            call_type: 调用类型(analyze/recommendation/chat)，决定缓存有效期
+            stream: 是否流式返回
+            deadline: 本次调用（含重试）的耗时预算（秒），默认AZURE_OPENAI_DEADLINE
             
         Returns:
-            AI回复内容或None
+            AI回复内容或None；stream=True时返回逐块产出文本的ChatStream
         """
         if not self.available:
-            return "抱歉，AI功能暂时不可用。请配置Azure OpenAI设置。"
+            unavailable = "抱歉，AI功能暂时不可用。请配置Azure OpenAI设置。"
+            return ChatStream(iter([unavailable, _STREAM_DONE])) if stream else unavailable
         
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.api_key
-        }
+        key, cached = self._cache_lookup(messages, max_tokens, temperature, call_type)
+        if cached is not None:
+            return ChatStream(iter([cached, _STREAM_DONE])) if stream else cached
         
-        data = {
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature
-        }
+        headers, data = self._build_request(messages, max_tokens, temperature)
+        if stream:
+            data["stream"] = True
+            return ChatStream(self._stream_chunks(headers, data, deadline), self._stream_finished(key, call_type))
         
+        client = self._get_client()
         try:
-            response = requests.post(
-                self.endpoint,
-                headers=headers,
-                json=data,
-                timeout=30
+            response = self._send_with_retries(
+                lambda timeout: client.post(self.endpoint, headers=headers, json=data, timeout=timeout), deadline,
+                self._request_tokens(data)
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
-            else:
-                print(f"❌ Azure OpenAI API错误: {response.status_code}")
-                print(f"错误详情: {response.text}")
+            if response is None:
                 return None
-                
-        except requests.exceptions.RequestException as e:
-            print(f"❌ 请求异常: {e}")
-            return None
+            content = self._parse_response(response, call_type)
+            self._cache_store(key, call_type, content)
+            return content
         except Exception as e:
             print(f"❌ 未知错误: {e}")
             return None
     
-    def analyze_booking_request(self, user_input: str) -> Dict[str, Any]:
+    async def achat_completion(self, messages: list, max_tokens: int = 1000, temperature: float = 0.7,
+                               call_type: str = "chat", stream: bool = False,
+                               deadline: Optional[float] = None) -> Union[Optional[str], AsyncChatStream]:
         """
-        分析用户的预订请求
+        chat_completion的异步版本，共享连接池，适合并发发起多个LLM调用
         
         Args:
-            user_input: 用户输入
+            messages: 消息列表
+            max_tokens: 最大令牌数
+            temperature: 温度参数
+            call_type: 调用类型(analyze/recommendation/chat)，决定缓存有效期
+            stream: 是否流式返回
+            deadline: 本次调用（含重试）的耗时预算（秒），默认AZURE_OPENAI_DEADLINE
             
         Returns:
-            分析结果字典
+            AI回复内容或None；stream=True时返回可 async for 迭代的AsyncChatStream
         """
         if not self.available:
-            return {"intent": "unknown", "entities": {}}
+            unavailable = "抱歉，AI功能暂时不可用。请配置Azure OpenAI设置。"
+            return AsyncChatStream(_aiter([unavailable, _STREAM_DONE])) if stream else unavailable
         
+        key, cached = self._cache_lookup(messages, max_tokens, temperature, call_type)
+        if cached is not None:
+            return AsyncChatStream(_aiter([cached, _STREAM_DONE])) if stream else cached
+        
+        headers, data = self._build_request(messages, max_tokens, temperature)
+        if stream:
+            data["stream"] = True
+            return AsyncChatStream(self._astream_chunks(headers, data, deadline), self._stream_finished(key, call_type))
+        
+        client = self._get_async_client()
+        try:
+            response = await self._asend_with_retries(
+                lambda timeout: client.post(self.endpoint, headers=headers, json=data, timeout=timeout), deadline,
+                self._request_tokens(data)
+            )
+            if response is None:
+                return None
+            content = self._parse_response(response, call_type)
+            self._cache_store(key, call_type, content)
+            return content
+        except Exception as e:
+            print(f"❌ 未知错误: {e}")
+            return None
+    
+    def resilience_stats(self) -> Dict[str, Any]:
+        """熔断器状态与调用耗时统计（毫秒）"""
+        with self._stream_lock:
+            stats = dict(self._call_stats)
+            latencies = sorted(self._latencies)
+        stats["breaker"] = self.breaker.snapshot()
+        if self.rate_limiter.enabled:
+            stats["rate_limiter"] = self.rate_limiter.stats()
+        if latencies:
+            stats["avg_latency_ms"] = sum(latencies) / len(latencies) * 1000
+            stats["p95_latency_ms"] = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+            stats["max_latency_ms"] = latencies[-1] * 1000
+        else:
+            stats["avg_latency_ms"] = stats["p95_latency_ms"] = stats["max_latency_ms"] = 0.0
+        return stats
+    
+    def stream_stats(self) -> Dict[str, Any]:
+        """流式调用的平均首字延迟和平均总耗时（毫秒）"""
+        with self._stream_lock:
+            streams = self._stream_stats["streams"]
+            return {
+                "streams": streams,
+                "avg_ttft_ms": self._stream_stats["ttft_total"] / streams * 1000 if streams else 0.0,
+                "avg_total_ms": self._stream_stats["latency_total"] / streams * 1000 if streams else 0.0
+            }
+    
+    def token_usage(self) -> Dict[str, Dict[str, int]]:
+        """按调用类型统计的累计token用量（流式调用的响应不含用量，不计入）"""
+        with self._stream_lock:
+            return {call_type: dict(totals) for call_type, totals in self._token_usage.items()}
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """响应缓存命中统计"""
+        return self.cache.stats() if self.cache else {"enabled": False}
+    
+    def close(self) -> None:
+        """关闭同步连接池"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+    
+    async def aclose(self) -> None:
+        """关闭异步连接池"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+    
+    def _analysis_messages(self, user_input: str) -> list:
         system_message = """
         你是一个智能的机票预订助手。请分析用户的输入，识别意图和实体。
         
@@ -103,13 +851,12 @@ class AzureOpenAIClient:
         - response: 建议的回复
         """
         
-        messages = [
+        return [
             {"role": "system", "content": system_message},
             {"role": "user", "content": user_input}
         ]
-        
-        response = self.chat_completion(messages, max_tokens=500, temperature=0.3)
-        
+    
+    def _parse_analysis(self, response: Optional[str]) -> Dict[str, Any]:
         try:
             # 尝试解析JSON响应
             if response and response.strip().startswith('{'):
@@ -129,42 +876,155 @@ class AzureOpenAIClient:
                 "response": response or "抱歉，我遇到了一些技术问题。"
             }
     
-    def generate_flight_recommendation(self, departure: str, arrival: str, flights: list) -> str:
+    def analyze_booking_request(self, user_input: str, deadline: Optional[float] = None) -> Dict[str, Any]:
         """
-        生成航班推荐
+        分析用户的预订请求
         
         Args:
-            departure: 出发地
-            arrival: 目的地
-            flights: 航班列表
+            user_input: 用户输入
+            deadline: 耗时预算（秒）
             
         Returns:
-            推荐文本
+            分析结果字典
         """
         if not self.available:
-            return f"找到 {len(flights)} 个从 {departure} 到 {arrival} 的航班。"
+            return {"intent": "unknown", "entities": {}}
         
-        flight_info = []
-        for flight in flights:
-            flight_info.append(f"航班 {flight.flight_number} ({flight.airline}) - 价格: ¥{flight.price}")
+        messages = self._analysis_messages(user_input)
+        response = self.chat_completion(messages, max_tokens=500, temperature=0.3, call_type="analyze", deadline=deadline)
+        return self._parse_analysis(response)
+    
+    def stream_booking_analysis(self, user_input: str, deadline: Optional[float] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        流式分析用户的预订请求
+        
+        边生成边产出 ("token", 文本)，内容为分析结果中的建议回复；
+        生成结束后产出一次 ("analysis", 分析结果字典)。
+        """
+        if not self.available:
+            yield "analysis", {"intent": "unknown", "entities": {}}
+            return
+        
+        messages = self._analysis_messages(user_input)
+        stream = self.chat_completion(messages, max_tokens=500, temperature=0.3, call_type="analyze", stream=True,
+                                      deadline=deadline)
+        streamer = JSONFieldStreamer("response")
+        for chunk in stream:
+            text = streamer.feed(chunk)
+            if text:
+                yield "token", text
+        yield "analysis", self._parse_analysis(stream.text or None)
+    
+    def _batch_analysis_messages(self, user_inputs: List[str]) -> list:
+        system_message = """
+        你是一个智能的机票预订助手。用户消息是一个JSON数组，每个元素包含id和text，
+        分别来自不同的用户。请逐条独立分析text，识别意图和实体。
+        
+        可能的意图包括:
+        - create_booking: 创建预订
+        - search_booking: 查询预订
+        - update_booking: 更新预订
+        - cancel_booking: 取消预订
+        - general_question: 一般问题
+        
+        请以JSON格式回复 {"results": [...]}，每条输入对应一个元素，包含:
+        - id: 对应输入的id
+        - intent: 意图
+        - entities: 提取的实体（如姓名、航班号、日期等）
+        - confidence: 置信度(0-1)
+        - response: 建议的回复
+        """
+        items = [{"id": i, "text": text} for i, text in enumerate(user_inputs)]
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": json.dumps(items, ensure_ascii=False)}
+        ]
+    
+    def analyze_booking_requests(self, user_inputs: List[str],
+                                 deadline: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        在一次LLM请求中批量分析多条用户输入
         
-        system_message = f"""
-        你是一个专业的航班推荐助手。请根据以下航班信息，为用户提供个性化的推荐建议。
+        已缓存的输入不进入批量请求；批量结果按单条分析的缓存键写回缓存。
         
-        航线: {departure} → {arrival}
-        可用航班:
-        {chr(10).join(flight_info)}
+        Returns:
+            与输入一一对应的分析结果；批量回复中缺失或无法解析的条目为None，由调用方单独分析
+        """
+        if not self.available:
+            return [{"intent": "unknown", "entities": {}} for _ in user_inputs]
         
-        请提供简洁、实用的推荐建议，包括性价比分析和选择建议。
+        results: List[Optional[Dict[str, Any]]] = [None] * len(user_inputs)
+        pending = []
+        for i, user_input in enumerate(user_inputs):
+            key, cached = self._cache_lookup(self._analysis_messages(user_input), 500, 0.3, "analyze")
+            if cached is not None:
+                results[i] = self._parse_analysis(cached)
+            else:
+                pending.append((i, key))
+        if not pending:
+            return results
+        
+        messages = self._batch_analysis_messages([user_inputs[i] for i, _ in pending])
+        response = self.chat_completion(messages, max_tokens=min(300 * len(pending), 4000), temperature=0.3,
+                                        call_type="batch_analyze", deadline=deadline)
+        try:
+            parsed = json.loads(response) if response else None
+        except json.JSONDecodeError:
+            parsed = None
+        items = parsed.get("results") if isinstance(parsed, dict) else parsed
+        if not isinstance(items, list):
+            return results
+        
+        for item in items:
+            if not isinstance(item, dict) or "intent" not in item:
+                continue
+            n = item.pop("id", None)
+            if not isinstance(n, int) or not 0 <= n < len(pending):
+                continue
+            i, key = pending[n]
+            results[i] = item
+            self._cache_store(key, "analyze", json.dumps(item, ensure_ascii=False))
+        return results
+    
+    def recommend_flights(self, departure: str, arrival: str, flights: list,
+                          deadline: Optional[float] = None) -> Optional[str]:
+        """
+        生成航班推荐，LLM调用失败时返回None（需要区分降级文本时使用，如缓存推荐）
+        
+        未配置Azure OpenAI时返回航班数量摘要
         """
+        if not self.available:
+            return f"找到 {len(flights)} 个从 {departure} 到 {arrival} 的航班。"
+        
+        # 预排序后只保留排名靠前的航班和航线汇总，控制提示词token数
+        system_message, prompt_info = build_recommendation_prompt(departure, arrival, flights)
+        if AZURE_OPENAI_LOG_USAGE:
+            print(f"🧮 推荐提示词: 保留 {prompt_info['included']}/{prompt_info['total']} 个航班，"
+                  f"估算 {prompt_info['estimated_tokens']} tokens")
         
         messages = [
             {"role": "system", "content": system_message},
             {"role": "user", "content": f"请推荐从{departure}到{arrival}的航班"}
         ]
         
-        response = self.chat_completion(messages, max_tokens=300, temperature=0.6)
-        return response or f"为您找到 {len(flights)} 个航班选择，请根据时间和价格需求选择。"
+        return self.chat_completion(messages, max_tokens=300, temperature=0.6, call_type="recommendation",
+                                    deadline=deadline) or None
+    
+    def generate_flight_recommendation(self, departure: str, arrival: str, flights: list,
+                                       deadline: Optional[float] = None) -> str:
+        """
+        生成航班推荐
+        
+        Args:
+            departure: 出发地
+            arrival: 目的地
+            flights: 航班列表
+            deadline: 耗时预算（秒）
+            
+        Returns:
+            推荐文本，LLM调用失败时为降级文本
+        """
+        return self.recommend_flights(departure, arrival, flights, deadline) or fallback_recommendation(flights)
 
 # 创建全局客户端实例
 azure_client = AzureOpenAIClient()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Agent消息总线基准测试
+测量发布/订阅的投递吞吐量（消息/秒）和请求/应答的吞吐量（次/秒）：
+进程内总线，以及经Unix域套接字、本机TCP连接的两个总线（两端在同一进程中，测的是传输本身的开销）
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import ClassVar
+
+from agent_bus import BusMessage, MessageBus, connect_bus, register_message, serve_bus
+
+MESSAGES = int(os.getenv("BENCH_MESSAGES", 20000))
+
+@register_message
+class BenchMessage(BusMessage):
+    topic: ClassVar[str] = "bench.message"
+    seq: int
+    payload: str = ""
+
+class Counter:
+    """订阅者：收满预期条数后通知"""
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.count = 0
+        self.done = asyncio.Event()
+
+    def __call__(self, envelope) -> None:
+        self.count += 1
+        if self.count >= self.expected:
+            self.done.set()
+
+def echo(envelope) -> BenchMessage:
+    return envelope.message
+
+async def _linked_buses(address: str):
+    """返回 (服务端总线, 客户端总线, server, link)：客户端发布 bench.message，由服务端处理"""
+    server_bus, client_bus = MessageBus("server"), MessageBus("client")
+    server = await serve_bus(server_bus, address, topics=[BenchMessage])
+    link = await connect_bus(client_bus, address)
+    return server_bus, client_bus, server, link
+
+async def bench_pubsub(subscribers: int, max_queue: int, address: str = "") -> float:
+    """发布MESSAGES条消息，返回每秒投递给订阅者的消息数"""
+    if address:
+        server_bus, bus, server, link = await _linked_buses(address)
+    else:
+        server_bus = bus = MessageBus(max_queue=max_queue)
+    counters = [Counter(MESSAGES) for _ in range(subscribers)]
+    for counter in counters:
+        server_bus.subscribe(BenchMessage, counter, max_queue=max_queue)
+    message = BenchMessage(seq=0, payload="x" * 64)
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        await bus.publish(message)
+    await asyncio.gather(*(counter.done.wait() for counter in counters))
+    elapsed = time.perf_counter() - start
+    if address:
+        await link.close()
+        server.close()
+    await bus.close()
+    await server_bus.close()
+    return MESSAGES * subscribers / elapsed
+
+async def bench_request(concurrency: int, address: str = "") -> float:
+    """concurrency个请求方并发发送请求，返回每秒完成的请求/应答次数"""
+    if address:
+        server_bus, bus, server, link = await _linked_buses(address)
+    else:
+        server_bus = bus = MessageBus()
+    server_bus.subscribe(BenchMessage, echo)
+    per_worker = max(1, MESSAGES // 4 // concurrency)
+
+    async def worker():
+        for seq in range(per_worker):
+            await bus.request(BenchMessage(seq=seq))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    if address:
+        await link.close()
+        server.close()
+    await bus.close()
+    await server_bus.close()
+    return per_worker * concurrency / elapsed
+
+async def main():
+    transports = [("进程内", ""), ("Unix套接字", os.path.join(tempfile.mkdtemp(), "bench_bus.sock")),
+                  ("本机TCP", "127.0.0.1:8766")]
+
+    print("📊 Agent消息总线基准测试")
+    print(f"发布/订阅每项 {MESSAGES} 条消息，单位: 消息/秒（按订阅者收到的条数计）")
+    print("-" * 72)
+    print(f"{'传输方式':<10} {'1订阅 队列10':<14} {'1订阅 队列1000':<14} {'4订阅 队列1000':<14} {'请求/应答x1':<12} {'请求/应答x32':<12}")
+    print("-" * 72)
+    for label, address in transports:
+        results = [
+            await bench_pubsub(1, 10, address),
+            await bench_pubsub(1, 1000, address),
+            await bench_pubsub(4, 1000, address),
+            await bench_request(1, address),
+            await bench_request(32, address),
+        ]
+        print(f"{label:<12}" + "".join(f"{value:<18,.0f}" for value in results))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        MESSAGES = int(sys.argv[1])
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Azure OpenAI客户端基准测试
+在本地模拟端点（注入固定延迟）上对比：每次新建连接的requests.post、
+长连接同步客户端、以及并发的异步客户端
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+LATENCY_MS = float(os.getenv("BENCH_LATENCY_MS", 50))
+CALLS = int(os.getenv("BENCH_CALLS", 100))
+CONCURRENCY_LEVELS = [1, 16, 64]
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    """最小的chat completions模拟端点，统计新建的TCP连接数"""
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体合并为一次写入，避免Nagle/延迟ACK带来的额外40ms
+    wbufsize = 64 * 1024
+    connections = set()
+
+    def do_POST(self):
+        MockChatHandler.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LATENCY_MS / 1000)
+        body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockServer(ThreadingHTTPServer):
+    request_queue_size = 256
+    daemon_threads = True
+
+def start_mock_server() -> str:
+    server = MockServer(("127.0.0.1", 0), MockChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/openai/deployments/mock/chat/completions"
+
+MESSAGES = [{"role": "user", "content": "请推荐从PEK到SHA的航班"}]
+
+def report(name: str, calls: int, elapsed: float) -> None:
+    connections = len(MockChatHandler.connections)
+    MockChatHandler.connections = set()
+    print(f"{name:<28} {calls / elapsed:>10.1f} {elapsed / calls * 1000:>12.1f} {connections:>8}")
+
+def bench_requests_post(endpoint: str) -> None:
+    """改造前的实现：每次调用模块级requests.post"""
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        requests.post(endpoint, headers={"api-key": "bench"},
+                      json={"messages": MESSAGES, "max_tokens": 10, "temperature": 0.7}, timeout=30)
+    report("requests.post (串行)", CALLS, time.perf_counter() - start)
+
+def bench_pooled_sync(client) -> None:
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        client.chat_completion(MESSAGES, max_tokens=10)
+    report("连接池同步 (串行)", CALLS, time.perf_counter() - start)
+
+async def bench_async(client, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            await client.achat_completion(MESSAGES, max_tokens=10)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(CALLS)))
+    report(f"异步 (并发 {concurrency})", CALLS, time.perf_counter() - start)
+    await client.aclose()
+
+def main():
+    endpoint = start_mock_server()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = endpoint
+    os.environ["AZURE_OPENAI_API_KEY"] = "bench"
+    # 基准测试测量的是网络路径，关闭响应缓存
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    from azure_openai_client import AzureOpenAIClient
+
+    print(f"📊 Azure OpenAI客户端基准测试 (模拟延迟 {LATENCY_MS:.0f}ms, 每组 {CALLS} 次调用)")
+    print("-" * 62)
+    print(f"{'模式':<28} {'调用/秒':>10} {'平均耗时(ms)':>12} {'TCP连接':>8}")
+    print("-" * 62)
+
+    bench_requests_post(endpoint)
+    pool_size = max(CONCURRENCY_LEVELS)
+    client = AzureOpenAIClient(max_connections=pool_size, max_keepalive_connections=pool_size)
+    bench_pooled_sync(client)
+    client.close()
+    for concurrency in CONCURRENCY_LEVELS:
+        asyncio.run(bench_async(client, concurrency))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        CALLS = int(sys.argv[1])
+    main()
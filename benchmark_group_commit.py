@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+组提交基准测试
+对比逐条commit与组提交在1/16/128个并发客户端下的写入吞吐(writes/sec)
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime
+from decimal import Decimal
+
+# 使用临时SQLite数据库，必须在导入database之前设置
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/benchmark.db"
+
+from database import create_tables, SessionLocal
+from group_commit import GroupCommitter, stage_bookings
+
+WRITES_PER_CLIENT = int(os.getenv("BENCH_WRITES_PER_CLIENT", 20))
+CONCURRENCY_LEVELS = [1, 16, 128]
+
+def make_booking(client: int, n: int) -> dict:
+    return {
+        "title": f"基准测试 {client}-{n}",
+        "passenger_name": f"乘客{client}",
+        "flight_number": "CA1001",
+        "departure_date": date(2024, 8, 15),
+        "departure_time": dtime(8, 30),
+        "arrival_date": date(2024, 8, 15),
+        "arrival_time": dtime(10, 45),
+        "departure_airport": "PEK",
+        "arrival_airport": "SHA",
+        "seat_number": None,
+        "price": Decimal("680.00")
+    }
+
+def commit_one(data: dict) -> None:
+    """与默认create_booking端点相同：每个预订一个事务"""
+    db = SessionLocal()
+    try:
+        stage_bookings(db, [data])
+        db.commit()
+    finally:
+        db.close()
+
+async def run_clients(clients: int, write) -> float:
+    async def client(c: int):
+        for n in range(WRITES_PER_CLIENT):
+            await write(make_booking(c, n))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return clients * WRITES_PER_CLIENT / (time.perf_counter() - start)
+
+async def per_request_commit(data: dict) -> None:
+    # 默认端点在事件循环中同步执行数据库调用，写入天然串行
+    commit_one(data)
+
+async def main():
+    create_tables()
+    print("📊 组提交基准测试 (SQLite)")
+    print(f"每个客户端写入 {WRITES_PER_CLIENT} 条预订")
+    print("-" * 60)
+    print(f"{'并发客户端':<12} {'逐条commit (w/s)':<20} {'组提交 (w/s)':<16} {'平均批大小':<10}")
+    print("-" * 60)
+
+    for clients in CONCURRENCY_LEVELS:
+        baseline = await run_clients(clients, per_request_commit)
+        committer = GroupCommitter()
+        grouped = await run_clients(clients, committer.submit)
+        avg_batch = committer.committed / max(committer.batches, 1)
+        await committer.close()
+        print(f"{clients:<12} {baseline:<20.0f} {grouped:<16.0f} {avg_batch:<10.1f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        WRITES_PER_CLIENT = int(sys.argv[1])
+    asyncio.run(main())
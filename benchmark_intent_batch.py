@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+意图分析微批基准测试
+在本地模拟端点上对比逐条调用与不同窗口的微批处理：吞吐、单条延迟和LLM请求数。
+模拟端点按 基础延迟 + 每条输入的生成延迟 计时，并限制同时处理的请求数（模拟部署的并发/速率上限）
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_LATENCY_MS = float(os.getenv("BENCH_BASE_LATENCY_MS", 200))
+PER_ITEM_LATENCY_MS = float(os.getenv("BENCH_PER_ITEM_LATENCY_MS", 15))
+MOCK_MAX_CONCURRENT = int(os.getenv("BENCH_MOCK_MAX_CONCURRENT", 8))
+UTTERANCES_PER_USER = int(os.getenv("BENCH_UTTERANCES_PER_USER", 3))
+CONCURRENCY_LEVELS = [1, 16, 64]
+BATCH_WINDOWS_MS = [10, 50]
+
+def _analysis(text: str) -> dict:
+    return {"intent": "general_question", "entities": {}, "confidence": 0.9, "response": f"已收到: {text}"}
+
+class MockAnalyzeHandler(BaseHTTPRequestHandler):
+    """返回脚本化JSON的chat completions模拟端点：用户消息为JSON数组时按批量格式回复"""
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024
+    slots = threading.Semaphore(MOCK_MAX_CONCURRENT)
+    requests_served = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        content = body["messages"][-1]["content"]
+        try:
+            items = json.loads(content)
+        except json.JSONDecodeError:
+            items = None
+
+        with MockAnalyzeHandler.slots:
+            MockAnalyzeHandler.requests_served += 1
+            if isinstance(items, list):
+                time.sleep((BASE_LATENCY_MS + PER_ITEM_LATENCY_MS * len(items)) / 1000)
+                reply = {"results": [dict(_analysis(item["text"]), id=item["id"]) for item in items]}
+            else:
+                time.sleep((BASE_LATENCY_MS + PER_ITEM_LATENCY_MS) / 1000)
+                reply = _analysis(content)
+
+        payload = json.dumps({"choices": [{"message": {"role": "assistant",
+                                                       "content": json.dumps(reply, ensure_ascii=False)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockServer(ThreadingHTTPServer):
+    request_queue_size = 256
+    daemon_threads = True
+
+def start_mock_server() -> str:
+    server = MockServer(("127.0.0.1", 0), MockAnalyzeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/openai/deployments/mock/chat/completions"
+
+def run_users(users: int, analyze) -> tuple:
+    """每个用户串行发送若干条输入，返回 (吞吐, p50毫秒, p95毫秒)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def user(u: int):
+        for n in range(UTTERANCES_PER_USER):
+            start = time.perf_counter()
+            analyze(f"用户{u}的第{n}个问题")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000)
+
+def report(name: str, users: int, result: tuple) -> None:
+    requests_served, MockAnalyzeHandler.requests_served = MockAnalyzeHandler.requests_served, 0
+    throughput, p50, p95 = result
+    print(f"{name:<16} {users:>6} {throughput:>12.1f} {p50:>10.0f} {p95:>10.0f} {requests_served:>8}")
+
+def main():
+    endpoint = start_mock_server()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = endpoint
+    os.environ["AZURE_OPENAI_API_KEY"] = "bench"
+    # 基准测试测量的是LLM调用路径，关闭响应缓存
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    from azure_openai_client import AzureOpenAIClient
+    from intent_batcher import IntentBatcher
+
+    pool_size = max(CONCURRENCY_LEVELS)
+    client = AzureOpenAIClient(max_connections=pool_size, max_keepalive_connections=pool_size)
+
+    print(f"📊 意图分析微批基准测试 (模拟延迟 {BASE_LATENCY_MS:.0f}ms + {PER_ITEM_LATENCY_MS:.0f}ms/条, "
+          f"端点并发上限 {MOCK_MAX_CONCURRENT}, 每用户 {UTTERANCES_PER_USER} 条)")
+    print("-" * 68)
+    print(f"{'模式':<16} {'并发用户':>6} {'条/秒':>12} {'p50(ms)':>10} {'p95(ms)':>10} {'LLM请求':>8}")
+    print("-" * 68)
+
+    for users in CONCURRENCY_LEVELS:
+        report("逐条调用", users, run_users(users, client.analyze_booking_request))
+        for window_ms in BATCH_WINDOWS_MS:
+            batcher = IntentBatcher(window_ms=window_ms, client=client)
+            report(f"微批 {window_ms:.0f}ms", users, run_users(users, batcher.analyze))
+            batcher.close()
+    client.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        UTTERANCES_PER_USER = int(sys.argv[1])
+    main()
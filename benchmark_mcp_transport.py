@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+MCP访问方式基准测试
+Agent与MCP服务器在同一进程中时，对比三种访问方式的单次调用延迟：
+http（经本机TCP访问uvicorn）、asgi（进程内调用ASGI应用）、direct（直接调用接口函数）
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# 使用临时SQLite数据库，必须在导入database之前设置
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/benchmark.db"
+
+import uvicorn
+
+from airline_agent import AirlineAgent
+from booking_agent import BookingAgent
+from init_db import init_database
+from mcp_client import MCP_TRANSPORTS
+from mcp_server import app
+
+CALLS_PER_OPERATION = int(os.getenv("BENCH_CALLS", 200))
+HTTP_PORT = int(os.getenv("BENCH_MCP_PORT", 8765))
+
+def start_http_server() -> None:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=HTTP_PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+def measure(call) -> float:
+    """返回平均每次调用耗时(ms)"""
+    call()  # 预热：建立连接、填充缓存
+    start = time.perf_counter()
+    for _ in range(CALLS_PER_OPERATION):
+        call()
+    return (time.perf_counter() - start) * 1000 / CALLS_PER_OPERATION
+
+def main():
+    init_database()
+    start_http_server()
+    url = f"http://127.0.0.1:{HTTP_PORT}"
+
+    print("📊 MCP访问方式基准测试 (SQLite)")
+    print(f"每项操作调用 {CALLS_PER_OPERATION} 次，单位: ms/次")
+    print("-" * 60)
+    print(f"{'访问方式':<10} {'按航班号查询':<12} {'航线搜索':<12} {'航班列表':<12} {'预订列表':<12}")
+    print("-" * 60)
+
+    for transport in MCP_TRANSPORTS:
+        # 关闭航班快照，保证每次调用都到达MCP服务器
+        airline = AirlineAgent(url, use_snapshot=False, transport=transport)
+        booking = BookingAgent(url, transport=transport)
+        results = [
+            measure(lambda: airline.get_flight_by_number("CA1001")),
+            measure(lambda: airline.search_flights("PEK", "SHA")),
+            measure(lambda: airline.get_all_flights()),
+            measure(lambda: booking.get_all_bookings()),
+        ]
+        print(f"{transport:<14}" + "".join(f"{value:<16.3f}" for value in results))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        CALLS_PER_OPERATION = int(sys.argv[1])
+    main()
@@ -4,55 +4,147 @@
 处理所有预订相关操作，提供智能对话接口
 """
 
+import asyncio
+import httpx
 import requests
 import json
+import sys
 from datetime import datetime, date, time
 from decimal import Decimal
-from typing import Dict, Any, Optional
+from time import perf_counter
+from typing import Dict, Any, Optional, Iterator, AsyncIterator, List
 import os
 from azure_openai_client import azure_client
+from intent_rules import intent_rules, merge_context
+from intent_batcher import intent_batcher
+from mcp_client import MCP_CLIENT_PAGE_SIZE, MCP_TRANSPORT, AsyncMCPClient, MCPRequestError, aiter_pages, iter_pages, run_sync
+from agent_service import AgentServiceClient, create_agent_app, serve_agent
+from conversation_memory import ConversationMemory, ConversationStore, conversation_store
 
-class BookingAgent:
-    def __init__(self, mcp_server_url: str = "http://localhost:8000"):
-        self.mcp_server_url = mcp_server_url
-        self.session = requests.Session()
+BOOKING_AGENT_HOST = os.getenv("BOOKING_AGENT_HOST", "localhost")
+BOOKING_AGENT_PORT = int(os.getenv("BOOKING_AGENT_PORT", 8001))
+
+CHAT_FALLBACK = "我理解您的需求，请告诉我更多详细信息，或者使用命令菜单进行操作。"
+
+class AsyncBookingAgent(AsyncMCPClient):
+    """预订管理助手的异步接口：各方法可以用 asyncio.gather 并发调用"""
+    async def create_booking(self, booking_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """创建新预订"""
+        return await self._make_request("POST", "/bookings", json=booking_data)
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[Any, Any]]:
-        """发送HTTP请求到MCP服务器"""
-        url = f"{self.mcp_server_url}{endpoint}"
-        try:
-            response = self.session.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"❌ 请求失败: {e}")
+    async def get_all_bookings(self, skip: int = 0, limit: int = 100) -> Optional[list]:
+        """获取所有预订"""
+        params = {"skip": skip, "limit": limit}
+        return await self._make_request("GET", "/bookings", params=params)
+    
+    def iter_bookings(self, page_size: int = MCP_CLIENT_PAGE_SIZE, prefetch: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """逐页读取全部预订（async for），prefetch时处理当前页的同时请求下一页"""
+        return aiter_pages(self.get_all_bookings, page_size, prefetch)
+    
+    async def get_booking_by_id(self, booking_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取预订"""
+        return await self._make_request("GET", f"/bookings/{booking_id}")
+    
+    async def search_bookings_by_passenger(self, passenger_name: str) -> Optional[list]:
+        """根据乘客姓名搜索预订"""
+        return await self._make_request("GET", f"/bookings/search/{passenger_name}")
+    
+    async def update_booking(self, booking_id: int, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新预订"""
+        return await self._make_request("PUT", f"/bookings/{booking_id}", json=update_data)
+    
+    async def delete_booking(self, booking_id: int) -> bool:
+        """删除预订"""
+        result = await self._make_request("DELETE", f"/bookings/{booking_id}")
+        return result is not None
+    
+    async def get_route_recommendation(self, departure: str, arrival: str) -> Optional[Dict[str, Any]]:
+        """获取服务器预计算的航线推荐"""
+        return await self._make_request("GET", f"/recommendations/{departure}/{arrival}")
+    
+    async def auto_book(self, passenger_name: str, departure: str, arrival: str, departure_date: str,
+                        policy: str = "cheapest", **extra) -> Optional[Dict[str, Any]]:
+        """
+        搜索并预订（一次请求）：服务器按策略选择航班，在同一事务中确认当天余票并创建预订
+        
+        Args:
+            policy: cheapest / earliest / most_seats
+            extra: title、seat_number
+        
+        Returns:
+            {"booking": 预订, "flight": 选中的航班（available_seats为预订后当天的余票）}
+        """
+        return await self._make_request("POST", "/bookings/auto", json={
+            "passenger_name": passenger_name, "departure_airport": departure, "arrival_airport": arrival,
+            "departure_date": departure_date, "policy": policy, **extra
+        })
+    
+    async def get_bookings(self, booking_ids: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """并发获取多个预订，结果与booking_ids一一对应"""
+        return list(await asyncio.gather(*(self.get_booking_by_id(booking_id) for booking_id in booking_ids)))
+    
+    async def get_booking_details(self, booking_id: int) -> Optional[Dict[str, Any]]:
+        """获取预订及其航班信息、航线推荐和系统统计（预订之后的三个请求并发发出）"""
+        booking = await self.get_booking_by_id(booking_id)
+        if not booking:
             return None
+        flight, recommendation, stats = await asyncio.gather(
+            self._make_request("GET", f"/flights/number/{booking['flight_number']}"),
+            self.get_route_recommendation(booking['departure_airport'], booking['arrival_airport']),
+            self._make_request("GET", "/stats")
+        )
+        return {"booking": booking, "flight": flight, "recommendation": recommendation, "stats": stats}
+
+class BookingAgent:
+    def __init__(self, mcp_server_url: str = "http://localhost:8000", transport: str = MCP_TRANSPORT,
+                 memory: ConversationStore = conversation_store):
+        self.mcp_server_url = mcp_server_url
+        # 同步接口是异步Agent的薄封装，请求在后台事件循环中执行并复用其连接池；
+        # transport为asgi/direct时在进程内调用MCP服务器
+        self.async_agent = AsyncBookingAgent(mcp_server_url, transport=transport)
+        # AI对话的会话记忆：解析"那个预订"、"订第2个航班"这类指代
+        self.memory = memory
     
     def create_booking(self, booking_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """创建新预订"""
-        return self._make_request("POST", "/bookings", json=booking_data)
+        return run_sync(self.async_agent.create_booking(booking_data))
     
     def get_all_bookings(self, skip: int = 0, limit: int = 100) -> Optional[list]:
         """获取所有预订"""
-        params = {"skip": skip, "limit": limit}
-        return self._make_request("GET", "/bookings", params=params)
+        return run_sync(self.async_agent.get_all_bookings(skip, limit))
+    
+    def iter_bookings(self, page_size: int = MCP_CLIENT_PAGE_SIZE, prefetch: bool = True) -> Iterator[Dict[str, Any]]:
+        """逐页读取全部预订，不受单页limit限制；prefetch时在后台线程预取下一页"""
+        return iter_pages(self.get_all_bookings, page_size, prefetch)
     
     def get_booking_by_id(self, booking_id: int) -> Optional[Dict[str, Any]]:
         """根据ID获取预订"""
-        return self._make_request("GET", f"/bookings/{booking_id}")
+        return run_sync(self.async_agent.get_booking_by_id(booking_id))
     
     def search_bookings_by_passenger(self, passenger_name: str) -> Optional[list]:
         """根据乘客姓名搜索预订"""
-        return self._make_request("GET", f"/bookings/search/{passenger_name}")
+        return run_sync(self.async_agent.search_bookings_by_passenger(passenger_name))
     
     def update_booking(self, booking_id: int, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """更新预订"""
-        return self._make_request("PUT", f"/bookings/{booking_id}", json=update_data)
+        return run_sync(self.async_agent.update_booking(booking_id, update_data))
     
     def delete_booking(self, booking_id: int) -> bool:
         """删除预订"""
-        result = self._make_request("DELETE", f"/bookings/{booking_id}")
-        return result is not None
+        return run_sync(self.async_agent.delete_booking(booking_id))
+    
+    def get_route_recommendation(self, departure: str, arrival: str) -> Optional[Dict[str, Any]]:
+        """获取服务器预计算的航线推荐"""
+        return run_sync(self.async_agent.get_route_recommendation(departure, arrival))
+    
+    def get_booking_details(self, booking_id: int) -> Optional[Dict[str, Any]]:
+        """获取预订及其航班信息、航线推荐和系统统计"""
+        return run_sync(self.async_agent.get_booking_details(booking_id))
+    
+    def auto_book(self, passenger_name: str, departure: str, arrival: str, departure_date: str,
+                  policy: str = "cheapest", **extra) -> Optional[Dict[str, Any]]:
+        """搜索并预订（一次请求），返回 {"booking", "flight"}"""
+        return run_sync(self.async_agent.auto_book(passenger_name, departure, arrival, departure_date, policy, **extra))
     
     def interactive_create_booking(self) -> None:
         """交互式创建预订"""
@@ -136,11 +228,17 @@ class BookingAgent:
                 print("❌ 未找到相关预订")
         
         elif search_type == "3":
-            results = self.get_all_bookings()
-            if results:
-                print(f"✅ 共有 {len(results)} 个预订:")
-                for booking in results:
+            # 逐页读取并边读边显示，预订数量不受单页limit限制
+            count = 0
+            try:
+                for booking in self.iter_bookings():
+                    count += 1
                     self._display_booking(booking, brief=True)
+            except MCPRequestError as e:
+                print(f"❌ 读取中断，以上 {count} 个预订不是完整列表: {e}")
+                return
+            if count:
+                print(f"✅ 共有 {count} 个预订")
             else:
                 print("❌ 暂无预订记录")
         
@@ -241,20 +339,43 @@ class BookingAgent:
    创建时间: {booking['created_at'][:19]}
 """)
     
-    def ai_chat(self, user_input: str) -> str:
-        """AI智能对话"""
-        # 使用Azure OpenAI分析用户输入
-        analysis = azure_client.analyze_booking_request(user_input)
-        
+    def _session_context(self, user_input: str, memory: ConversationMemory) -> Dict[str, Any]:
+        """从会话记忆中解析输入里的指代（"那个预订"、"第2个航班"），作为意图分析的上下文实体"""
+        context: Dict[str, Any] = {}
+        booking = memory.resolve_booking(user_input)
+        if booking is not None:
+            context["booking_id"] = booking["id"]
+        flight = memory.resolve_flight(user_input)
+        route = (flight["departure_airport"], flight["arrival_airport"]) if flight else memory.recall("route")
+        if flight is not None:
+            context["flight_number"] = flight["flight_number"]
+        if route:
+            context["departure_airport"], context["arrival_airport"] = route
+        return context
+    
+    def _context_note(self, analysis: Dict[str, Any]) -> Optional[str]:
+        """说明回复中引用了会话里的哪个预订或航班"""
+        filled = analysis.get("context_entities") or []
+        entities = analysis.get("entities", {})
+        intent = analysis.get("intent")
+        if "booking_id" in filled and intent in ("search_booking", "update_booking", "cancel_booking"):
+            return f"📌 指的是预订 ID {entities['booking_id']}"
+        if "flight_number" in filled and intent == "create_booking":
+            return f"📌 指的是航班 {entities['flight_number']}（{entities.get('departure_airport')}→{entities.get('arrival_airport')}）"
+        return None
+    
+    def _action_reply(self, analysis: Dict[str, Any], memory: ConversationMemory) -> Optional[str]:
+        """根据分析出的意图执行相应操作，无需操作时返回None"""
         intent = analysis.get("intent", "general_question")
         entities = analysis.get("entities", {})
-        response = analysis.get("response", "")
         
-        # 根据意图执行相应操作
         if intent == "search_booking":
             passenger_name = entities.get("passenger_name")
             if passenger_name:
                 results = self.search_bookings_by_passenger(passenger_name)
+                memory.remember(bookings=results or [])
+                if results and len(results) == 1:
+                    memory.remember(booking=results[0])
                 if results:
                     result_text = f"找到 {len(results)} 个预订:\n"
                     for booking in results:
@@ -262,14 +383,131 @@ class BookingAgent:
                     return result_text
                 else:
                     return f"未找到 {passenger_name} 的预订记录。"
+            booking_id = entities.get("booking_id")
+            if booking_id is not None:
+                # 本会话已查询过的预订直接从记忆中回答
+                booking = memory.find_booking(int(booking_id)) or self.get_booking_by_id(int(booking_id))
+                if booking:
+                    memory.remember(booking=booking)
+                    return (f"预订 {booking['id']}: {booking['passenger_name']} | 航班: {booking['flight_number']} | "
+                            f"{booking['departure_date']} {booking['departure_airport']}→{booking['arrival_airport']} | "
+                            f"状态: {booking['status']}")
+                return f"未找到预订 {booking_id}。"
+        return None
+    
+    def _route_hint(self, analysis: Dict[str, Any]) -> Optional[str]:
+        """预订意图中带有航线时，附上服务器预计算的航线推荐"""
+        entities = analysis.get("entities", {})
+        departure, arrival = entities.get("departure_airport"), entities.get("arrival_airport")
+        if analysis.get("intent") != "create_booking" or not departure or not arrival:
+            return None
+        result = self.get_route_recommendation(departure, arrival)
+        if result and result.get("recommendation"):
+            return f"🤖 {departure}→{arrival} 航线推荐: {result['recommendation']}"
+        return None
+    
+    def _analyze(self, user_input: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        先用本地规则识别意图，置信度不足时再调用Azure OpenAI分析
         
-        elif intent == "general_question":
-            return response
+        会话上下文补全了指代的实体时，规则通常即可命中，不必调用LLM
+        """
+        analysis = intent_rules.match(user_input, context)
+        if analysis is not None:
+            return analysis
+        start = perf_counter()
+        if intent_batcher is not None:
+            # 与其他并发用户的请求合并为一次LLM调用
+            analysis = intent_batcher.analyze(user_input)
+        else:
+            analysis = azure_client.analyze_booking_request(user_input)
+        intent_rules.record_llm_call(perf_counter() - start)
+        return self._with_context(analysis, context)
+    
+    def _with_context(self, analysis: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """把上下文实体补入LLM的分析结果（分析结果可能来自缓存，不直接修改）"""
+        entities = dict(analysis.get("entities") or {})
+        filled = merge_context(entities, context)
+        return {**analysis, "entities": entities, "context_entities": filled}
+    
+    def _reply(self, analysis: Dict[str, Any], memory: ConversationMemory) -> str:
+        """根据意图执行操作并组织回复"""
+        intent = analysis.get("intent", "general_question")
+        response = analysis.get("response", "")
         
-        return response or "我理解您的需求，请告诉我更多详细信息，或者使用命令菜单进行操作。"
+        # 根据意图执行相应操作
+        reply = self._action_reply(analysis, memory)
+        if reply is None and intent == "general_question":
+            reply = response
+        elif reply is None:
+            hint = self._route_hint(analysis)
+            reply = f"{response or CHAT_FALLBACK}\n{hint}" if hint else response or CHAT_FALLBACK
+        note = self._context_note(analysis)
+        return f"{note}\n{reply}" if note else reply
+    
+    def ai_chat(self, user_input: str, session_id: Optional[str] = None) -> str:
+        """AI智能对话（session_id为空时使用默认会话）"""
+        memory = self.memory.get(session_id)
+        analysis = self._analyze(user_input, self._session_context(user_input, memory))
+        reply = self._reply(analysis, memory)
+        memory.add_turn("user", user_input)
+        memory.add_turn("agent", reply)
+        return reply
+    
+    def ai_chat_stream(self, user_input: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """流式AI对话：分析结果中的建议回复边生成边产出，随后产出意图对应的操作结果（流式请求不参与微批）"""
+        memory = self.memory.get(session_id)
+        context = self._session_context(user_input, memory)
+        chunks = []
+        try:
+            analysis = intent_rules.match(user_input, context)
+            if analysis is not None:
+                # 本地规则命中，无需调用LLM
+                chunks.append(self._reply(analysis, memory))
+                yield chunks[-1]
+                return
+            
+            analysis = {}
+            start = perf_counter()
+            for kind, value in azure_client.stream_booking_analysis(user_input):
+                if kind == "token":
+                    chunks.append(value)
+                    yield value
+                else:
+                    analysis = value
+            intent_rules.record_llm_call(perf_counter() - start)
+            analysis = self._with_context(analysis, context)
+            
+            streamed = bool(chunks)
+            parts = [self._context_note(analysis)]
+            reply = self._action_reply(analysis, memory)
+            if reply is not None:
+                parts.append(reply)
+            else:
+                if not streamed:
+                    parts.append(analysis.get("response") or CHAT_FALLBACK)
+                parts.append(self._route_hint(analysis))
+            for part in filter(None, parts):
+                chunks.append(f"\n{part}" if chunks else part)
+                yield chunks[-1]
+        finally:
+            memory.add_turn("user", user_input)
+            memory.add_turn("agent", "".join(chunks))
     
-    def run_interactive_mode(self) -> None:
-        """运行交互模式"""
+    def _print_stream(self, chunks: Iterator[str]) -> None:
+        """边接收边打印回复，并分别报告首字延迟和总耗时"""
+        print("🤖 AI助手: ", end="", flush=True)
+        start = perf_counter()
+        first_chunk = None
+        for chunk in chunks:
+            if first_chunk is None:
+                first_chunk = perf_counter() - start
+            print(chunk, end="", flush=True)
+        total = perf_counter() - start
+        print(f"\n⏱️  首字延迟: {(first_chunk or total) * 1000:.0f}ms | 总耗时: {total * 1000:.0f}ms")
+    
+    def run_interactive_mode(self, chat_client: Optional[AgentServiceClient] = None) -> None:
+        """运行交互模式（chat_client为Agent服务的客户端时，AI对话在服务端的会话中进行）"""
         print("🎫 智能预订管理助手")
         print("=" * 60)
         
@@ -288,6 +526,10 @@ class BookingAgent:
                 continue
             
             if user_input.lower() in ['quit', 'exit', 'q']:
+                stats = intent_rules.stats()
+                if stats["calls"]:
+                    print(f"📊 本地意图识别命中 {stats['rule_hits']}/{stats['calls']} ({stats['hit_rate']:.0%})，"
+                          f"约节省 {stats['saved_ms']:.0f}ms")
                 print("👋 再见!")
                 break
             elif user_input.lower() == 'create':
@@ -299,10 +541,29 @@ class BookingAgent:
             elif user_input.lower() == 'delete':
                 self.interactive_delete_booking()
             else:
-                # AI对话模式
-                print("🤖 AI助手:", self.ai_chat(user_input))
+                # AI对话模式（流式输出）：连接了Agent服务时由服务处理，否则在本进程中处理
+                if chat_client is None:
+                    self._print_stream(self.ai_chat_stream(user_input))
+                    continue
+                try:
+                    self._print_stream(chat_client.stream(user_input))
+                except (httpx.HTTPError, RuntimeError) as e:
+                    print(f"\n❌ Agent服务请求失败: {e}")
+
+def create_app(agent: Optional[BookingAgent] = None):
+    """把预订管理助手发布为A2A风格的HTTP服务"""
+    return create_agent_app(agent or BookingAgent(), "预订管理助手", "预订管理助手：创建、查询、修改和取消机票预订", [
+        {"id": "create_booking", "name": "创建预订", "description": "为乘客预订航班"},
+        {"id": "search_booking", "name": "查询预订", "description": "按乘客姓名或预订ID查询预订"},
+        {"id": "update_booking", "name": "修改预订", "description": "修改座位等预订信息"},
+        {"id": "cancel_booking", "name": "取消预订", "description": "取消已有预订"}
+    ])
 
 def main():
+    # 用法: python booking_agent.py [serve | connect [Agent服务地址]]
+    args = sys.argv[1:]
+    mode = args[0] if args else "interactive"
+    
     # 检查MCP服务器连接
     agent = BookingAgent()
     
@@ -318,8 +579,29 @@ def main():
         print("启动命令: python mcp_server.py")
         return
     
+    if mode == "serve":
+        # 作为Agent服务运行，同时服务多个会话
+        serve_agent(create_app(agent), BOOKING_AGENT_HOST, BOOKING_AGENT_PORT)
+        return
+    
+    chat_client = None
+    if mode == "connect":
+        agent_url = args[1] if len(args) > 1 else f"http://{BOOKING_AGENT_HOST}:{BOOKING_AGENT_PORT}"
+        chat_client = AgentServiceClient(agent_url)
+        try:
+            print(f"🔗 已连接Agent服务: {chat_client.agent_card()['name']} ({agent_url})")
+        except httpx.HTTPError:
+            print(f"❌ 无法连接到Agent服务: {agent_url}")
+            print(f"启动命令: python booking_agent.py serve")
+            return
+    
     # 启动交互模式
-    agent.run_interactive_mode()
+    try:
+        agent.run_interactive_mode(chat_client)
+    finally:
+        if chat_client is not None:
+            chat_client.end_session()
+            chat_client.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,150 @@
+"""
+预订归档
+将出发日期早于N天前的历史预订从热表(bookings)迁移到冷存储(bookings_archive)，
+并提供跨热/冷数据的查询辅助函数
+"""
+
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, ArchiveSessionLocal, Booking, ArchivedBooking
+from fare_calendar import invalidate_fares
+
+# 后台归档任务配置：ARCHIVE_AFTER_DAYS<=0 表示不自动归档
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 0))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+
+ARCHIVED_COLUMNS = [column.name for column in Booking.__table__.columns]
+# 判断冷存储中同ID的记录是否就是同一预订（上次归档中断后留下的副本）；其余字段可能已被修改
+IDENTITY_COLUMNS = ("id", "created_at")
+
+def _ensure_partitions(archive_db: Session, days: List[date]) -> None:
+    """PostgreSQL: 为涉及的月份创建归档表的RANGE分区"""
+    if archive_db.get_bind().dialect.name != "postgresql":
+        return
+    for month_start in sorted({day.replace(day=1) for day in days}):
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        archive_db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS bookings_archive_{month_start:%Y_%m} "
+            f"PARTITION OF bookings_archive "
+            f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{next_month.isoformat()}')"
+        ))
+
+def archive_bookings(older_than_days: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    归档出发日期早于 today - older_than_days 的预订
+
+    按ID顺序分批执行：先把读到的版本写入冷存储并提交，再从热表删除。
+    删除带条件（ID、读到的updated_at、出发日期仍早于截止日期），读取之后被修改的预订不删除，
+    并撤回刚写入的副本，下次归档时按新内容处理。
+    冷存储中已有同一预订的副本（上次中途失败）时用热表的当前内容覆盖，因此重跑是安全的；
+    同ID的副本属于另一个预订时跳过该预订并报告ID，不影响其他预订
+
+    Returns:
+        {"archived": 归档的预订数, "changed": 归档期间被修改而保留的预订数, "conflicts": 跳过的预订ID}
+    """
+    cutoff = date.today() - timedelta(days=older_than_days)
+    hot_db = SessionLocal()
+    archive_db = ArchiveSessionLocal()
+    result = {"archived": 0, "changed": 0, "conflicts": []}
+    last_id = 0
+    try:
+        while True:
+            rows = hot_db.query(Booking).filter(
+                Booking.departure_date < cutoff,
+                Booking.id > last_id
+            ).order_by(Booking.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            existing = {}
+            for copy in archive_db.query(ArchivedBooking).filter(ArchivedBooking.id.in_([row.id for row in rows])).all():
+                existing.setdefault(copy.id, []).append(copy)
+            batch = []
+            for row in rows:
+                copies = existing.get(row.id, [])
+                if not all(all(getattr(copy, name) == getattr(row, name) for name in IDENTITY_COLUMNS) for copy in copies):
+                    print(f"⚠️  预订ID {row.id} 在归档中已属于另一个预订，跳过")
+                    result["conflicts"].append(row.id)
+                    continue
+                batch.append(row)
+            if not batch:
+                continue
+
+            # 同一预订的旧副本换成热表的当前内容
+            replaced = [row.id for row in batch if row.id in existing]
+            if replaced:
+                archive_db.query(ArchivedBooking).filter(ArchivedBooking.id.in_(replaced)).delete()
+            _ensure_partitions(archive_db, [row.departure_date for row in batch])
+            now = datetime.utcnow()
+            archive_db.add_all([
+                ArchivedBooking(archived_at=now, **{name: getattr(row, name) for name in ARCHIVED_COLUMNS})
+                for row in batch
+            ])
+            archive_db.commit()
+
+            # 只删除与写入冷存储的版本相同的预订
+            changed = []
+            for row in batch:
+                deleted = hot_db.query(Booking).filter(
+                    Booking.id == row.id,
+                    Booking.updated_at == row.updated_at,
+                    Booking.departure_date < cutoff
+                ).delete(synchronize_session=False)
+                if deleted:
+                    invalidate_fares(hot_db, row.departure_airport, row.arrival_airport, row.departure_date)
+                else:
+                    changed.append((row.id, row.departure_date))
+            archived = len(batch) - len(changed)
+            hot_db.commit()
+
+            for booking_id, departure_date in changed:
+                archive_db.query(ArchivedBooking).filter(
+                    ArchivedBooking.id == booking_id,
+                    ArchivedBooking.departure_date == departure_date
+                ).delete(synchronize_session=False)
+            archive_db.commit()
+            result["archived"] += archived
+            result["changed"] += len(changed)
+    except Exception:
+        hot_db.rollback()
+        archive_db.rollback()
+        raise
+    finally:
+        hot_db.close()
+        archive_db.close()
+    return result
+
+async def run_archive_job(older_than_days: int = ARCHIVE_AFTER_DAYS, interval: int = ARCHIVE_INTERVAL_SECONDS) -> None:
+    """后台归档任务：周期性地在线程池中执行归档，不阻塞事件循环"""
+    while True:
+        try:
+            result = await asyncio.to_thread(archive_bookings, older_than_days)
+            if result["archived"]:
+                print(f"🗄️  已归档 {result['archived']} 个历史预订")
+        except Exception as e:
+            print(f"❌ 预订归档失败: {e}")
+        await asyncio.sleep(interval)
+
+def get_archived_booking(archive_db: Session, booking_id: int) -> Optional[ArchivedBooking]:
+    """根据原预订ID获取归档预订"""
+    return archive_db.query(ArchivedBooking).filter(ArchivedBooking.id == booking_id).first()
+
+def get_bookings_page(hot_db: Session, archive_db: Session, skip: int, limit: int) -> list:
+    """
+    跨热/冷数据分页：先返回热表数据，不足一页时从归档数据续接
+    """
+    rows = hot_db.query(Booking).order_by(Booking.id).offset(skip).limit(limit).all()
+    if len(rows) >= limit:
+        return rows
+    # 热表已翻完：只有本页为空时才需要热表总数来计算归档偏移
+    archive_skip = 0 if rows else max(skip - hot_db.query(Booking).count(), 0)
+    rows += archive_db.query(ArchivedBooking).order_by(ArchivedBooking.id).offset(archive_skip).limit(limit - len(rows)).all()
+    return rows
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+批量预订工作流引擎
+并发执行大量 搜索 → 选择 → 预订 流程（旅行团、航班取消后的批量改签等）：
+- 流程由固定数量的asyncio工作任务执行（BOOKING_WORKFLOW_CONCURRENCY），共享Agent的连接池
+- 每个步骤单独重试：连接失败、超时、429和5xx按指数退避重试，429优先按Retry-After等待；
+  创建预订不是幂等的，只在请求确定未被处理（未发出、429、503）时重试，避免重复预订
+- 按 BOOKING_WORKFLOW_RPS 对MCP请求限流，收到429时所有流程一起暂停
+- 定期打印进度，结束后汇总吞吐量、各步骤耗时、重试次数和失败原因
+同一批次中相同航线的搜索只请求一次。
+BOOKING_WORKFLOW_COMPOSITE=1 时每个流程只发一个请求（POST /bookings/auto），由服务器在同一事务中选择航班、确认当天余票并创建预订
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+from airline_agent import AsyncAirlineAgent
+from booking_agent import AsyncBookingAgent
+from mcp_client import MCP_TRANSPORT, MCPRequestError, run_sync
+from rate_limiter import RateLimiter
+
+# 同时执行的流程数（默认低于MCP客户端连接池大小）
+BOOKING_WORKFLOW_CONCURRENCY = int(os.getenv("BOOKING_WORKFLOW_CONCURRENCY", 8))
+# 每个步骤的最大重试次数和首次退避秒数（之后每次翻倍，并加随机抖动）
+BOOKING_WORKFLOW_RETRIES = int(os.getenv("BOOKING_WORKFLOW_RETRIES", 3))
+BOOKING_WORKFLOW_BACKOFF = float(os.getenv("BOOKING_WORKFLOW_BACKOFF", 0.2))
+# 每秒发往MCP服务器的请求数上限（0表示不限制）
+BOOKING_WORKFLOW_RPS = float(os.getenv("BOOKING_WORKFLOW_RPS", 0))
+# 进度报告间隔（秒，0表示不报告）
+BOOKING_WORKFLOW_PROGRESS_INTERVAL = float(os.getenv("BOOKING_WORKFLOW_PROGRESS_INTERVAL", 2))
+# 使用服务器的搜索并预订接口（一次请求完成整个流程）
+BOOKING_WORKFLOW_COMPOSITE = os.getenv("BOOKING_WORKFLOW_COMPOSITE", "0") == "1"
+# 收到没有Retry-After的429时所有流程暂停的秒数
+BOOKING_WORKFLOW_THROTTLE_PAUSE = 1.0
+
+WORKFLOW_STEPS = ("search", "select", "book", "auto_book")
+STEP_NAMES = {"search": "搜索航班", "select": "选择航班", "book": "创建预订", "auto_book": "搜索并预订"}
+
+# 航班选择策略：按排序键取最小值（与服务器 POST /bookings/auto 的策略一致）
+SELECTION_POLICIES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "cheapest": lambda flight: (float(flight["price"]), flight["departure_time"]),
+    "earliest": lambda flight: (flight["departure_time"], float(flight["price"])),
+    "most_seats": lambda flight: (-flight["available_seats"], float(flight["price"])),
+}
+
+class WorkflowStepError(Exception):
+    """流程中某个步骤最终失败"""
+    def __init__(self, step: str, message: str, attempts: int = 1):
+        super().__init__(message)
+        self.step = step
+        self.attempts = attempts
+
+def select_flight(flights: List[Dict[str, Any]], policy: str = "cheapest") -> Optional[Dict[str, Any]]:
+    """按策略从有余票的航班中选择一个，没有可选航班时返回None"""
+    available = [flight for flight in flights if flight.get("available_seats", 0) > 0]
+    return min(available, key=SELECTION_POLICIES[policy]) if available else None
+
+def _departure_date(request: Dict[str, Any]) -> date:
+    return date.fromisoformat(str(request.get("departure_date") or date.today().isoformat()))
+
+def build_booking(request: Dict[str, Any], flight: Dict[str, Any]) -> Dict[str, Any]:
+    """根据流程请求和选中的航班构造预订数据（到达时间早于出发时间时按次日到达）"""
+    departure_date = _departure_date(request)
+    arrival_date = departure_date + timedelta(days=1) \
+        if flight["arrival_time"] < flight["departure_time"] else departure_date
+    return {
+        "title": request.get("title") or f"{request['passenger_name']}的航班预订",
+        "passenger_name": request["passenger_name"],
+        "flight_number": flight["flight_number"],
+        "departure_date": departure_date.isoformat(),
+        "departure_time": flight["departure_time"],
+        "arrival_date": arrival_date.isoformat(),
+        "arrival_time": flight["arrival_time"],
+        "departure_airport": flight["departure_airport"],
+        "arrival_airport": flight["arrival_airport"],
+        "seat_number": request.get("seat_number"),
+        "price": str(flight["price"])
+    }
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * percent), len(ordered) - 1)]
+
+class BookingWorkflowEngine:
+    """
+    批量预订工作流引擎
+
+    流程请求格式: {"passenger_name", "departure", "arrival", "departure_date"(可选, 默认今天),
+    "policy"(可选, cheapest/earliest/most_seats), "seat_number"(可选), "title"(可选)}
+    """
+    def __init__(self, mcp_server_url: str = "http://localhost:8000",
+                 concurrency: int = BOOKING_WORKFLOW_CONCURRENCY,
+                 retries: int = BOOKING_WORKFLOW_RETRIES,
+                 backoff: float = BOOKING_WORKFLOW_BACKOFF,
+                 requests_per_second: float = BOOKING_WORKFLOW_RPS,
+                 progress_interval: float = BOOKING_WORKFLOW_PROGRESS_INTERVAL,
+                 transport: str = MCP_TRANSPORT,
+                 composite: bool = BOOKING_WORKFLOW_COMPOSITE,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.progress_interval = progress_interval
+        self.composite = composite
+        self.on_progress = on_progress or self._print_progress
+        # 失败时抛出MCPRequestError，由引擎按步骤决定是否重试
+        self.airline = AsyncAirlineAgent(mcp_server_url, transport=transport, raise_errors=True)
+        self.booking = AsyncBookingAgent(mcp_server_url, transport=transport, raise_errors=True)
+        # 复用LLM调用的令牌桶：每秒requests_per_second个请求，突发量为1秒的配额
+        self.limiter = RateLimiter(requests_per_minute=int(requests_per_second * 60), tokens_per_minute=0,
+                                   state_file="", burst_seconds=1)
+        self._searches: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._searches.clear()
+        self._total = 0
+        self._done = 0
+        self._succeeded = 0
+        self._started = time.perf_counter()
+        self._step_ms: Dict[str, List[float]] = {step: [] for step in WORKFLOW_STEPS}
+        self._retries: Counter = Counter()
+        self._throttled = 0
+
+    async def _throttle(self) -> None:
+        wait = self.limiter.reserve(0)
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def _call(self, step: str, make_call: Callable, idempotent: bool = True) -> Any:
+        """执行一个步骤的MCP请求，暂时性错误按退避重试"""
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._throttle()
+            start = time.perf_counter()
+            try:
+                result = await make_call()
+                self._step_ms[step].append((time.perf_counter() - start) * 1000)
+                return result
+            except MCPRequestError as e:
+                # 非幂等请求只在服务器确定没有处理时重试
+                safe = idempotent or not e.sent or e.status_code in (429, 503)
+                if not e.retryable or not safe or attempt > self.retries:
+                    raise WorkflowStepError(step, str(e), attempt) from e
+                delay = self.backoff * 2 ** (attempt - 1) * (0.5 + random.random())
+                if e.status_code == 429:
+                    self._throttled += 1
+                    # 服务器限流时暂停所有流程，而不是只让当前流程等待
+                    delay = e.retry_after if e.retry_after is not None else max(delay, BOOKING_WORKFLOW_THROTTLE_PAUSE)
+                    self.limiter.penalize(delay)
+                self._retries[step] += 1
+                await asyncio.sleep(delay)
+
+    async def _search(self, departure: str, arrival: str) -> List[Dict[str, Any]]:
+        """搜索航线；同一批次中相同航线共用一次请求，失败的搜索不缓存"""
+        key = (departure, arrival)
+        future = self._searches.get(key)
+        if future is None:
+            future = self._searches[key] = asyncio.ensure_future(
+                self._call("search", lambda: self.airline.search_flights(departure, arrival)))
+        try:
+            return await asyncio.shield(future)
+        except WorkflowStepError:
+            if self._searches.get(key) is future:
+                del self._searches[key]
+            raise
+
+    async def run_flow(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """执行一个 搜索 → 选择 → 预订 流程，返回流程结果（不抛出异常）"""
+        departure, arrival = request["departure"].upper(), request["arrival"].upper()
+        result = {"passenger_name": request["passenger_name"], "route": f"{departure}→{arrival}",
+                  "status": "failed", "step": None, "error": None, "flight": None, "booking": None}
+        start = time.perf_counter()
+        try:
+            if self.composite:
+                # 服务器在同一事务中选择航班、确认当天余票并创建预订
+                created = await self._call("auto_book", lambda: self.booking.auto_book(
+                    request["passenger_name"], departure, arrival, _departure_date(request).isoformat(),
+                    request.get("policy", "cheapest"), title=request.get("title"),
+                    seat_number=request.get("seat_number")), idempotent=False)
+                result.update(flight=created["flight"], booking=created["booking"], status="booked")
+                return result
+
+            flights = await self._search(departure, arrival)
+
+            select_start = time.perf_counter()
+            flight = select_flight(flights or [], request.get("policy", "cheapest"))
+            self._step_ms["select"].append((time.perf_counter() - select_start) * 1000)
+            if flight is None:
+                raise WorkflowStepError("select", "没有可预订的航班")
+            result["flight"] = flight
+
+            booking_data = build_booking(request, flight)
+            result["booking"] = await self._call("book", lambda: self.booking.create_booking(booking_data),
+                                                 idempotent=False)
+            result["status"] = "booked"
+        except WorkflowStepError as e:
+            result.update(step=e.step, error=str(e))
+        except Exception as e:
+            result.update(step="unknown", error=f"{type(e).__name__}: {e}")
+        finally:
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def _worker(self, requests, results: List[Optional[Dict[str, Any]]]) -> None:
+        # 所有工作任务共享同一个请求迭代器，按顺序领取下一个流程
+        for index, request in requests:
+            result = await self.run_flow(request)
+            result["index"] = index
+            results[index] = result
+            self._done += 1
+            self._succeeded += result["status"] == "booked"
+
+    def progress(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        rate = self._done / elapsed if elapsed > 0 else 0.0
+        return {
+            "done": self._done, "total": self._total, "succeeded": self._succeeded,
+            "failed": self._done - self._succeeded, "elapsed_seconds": round(elapsed, 2),
+            "flows_per_second": round(rate, 1),
+            "eta_seconds": round((self._total - self._done) / rate, 1) if rate > 0 else None
+        }
+
+    def _print_progress(self, progress: Dict[str, Any]) -> None:
+        eta = f"{progress['eta_seconds']:.0f}s" if progress["eta_seconds"] is not None else "-"
+        print(f"⏳ 进度: {progress['done']}/{progress['total']} (成功 {progress['succeeded']}, 失败 {progress['failed']}) | "
+              f"{progress['flows_per_second']:.1f} 流程/秒 | 预计剩余 {eta}")
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.on_progress(self.progress())
+
+    async def run(self, requests: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        并发执行一批流程
+
+        Returns:
+            汇总报告：成功/失败数、吞吐量、各步骤耗时与重试次数、失败原因和每个流程的结果（与请求顺序一致）
+        """
+        requests = list(requests)
+        self._reset()
+        self._total = len(requests)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        shared = iter(enumerate(requests))
+        reporter = asyncio.ensure_future(self._report_progress()) if self.progress_interval > 0 else None
+        try:
+            await asyncio.gather(*(self._worker(shared, results) for _ in range(min(self.concurrency, len(requests)))))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        if reporter is not None and requests:
+            self.on_progress(self.progress())
+        return self._report(results)
+
+    def _report(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        failures = Counter(f"{STEP_NAMES.get(r['step'], r['step'])}: {r['error']}"
+                           for r in results if r["status"] != "booked")
+        return {
+            "total": len(results),
+            "succeeded": self._succeeded,
+            "failed": len(results) - self._succeeded,
+            "elapsed_seconds": round(elapsed, 3),
+            "flows_per_second": round(len(results) / elapsed, 1) if elapsed > 0 else 0.0,
+            "steps": {step: {"calls": len(values), "retries": self._retries[step],
+                             "avg_ms": round(sum(values) / len(values), 2) if values else 0.0,
+                             "p95_ms": round(_percentile(values, 0.95), 2)}
+                      for step, values in self._step_ms.items()},
+            "throttled": self._throttled,
+            "failures": dict(failures.most_common(10)),
+            "finished_at": datetime.utcnow().isoformat(),
+            "results": results
+        }
+
+    async def aclose(self) -> None:
+        await self.airline.aclose()
+        await self.booking.aclose()
+
+def run_booking_batch(requests: Iterable[Dict[str, Any]], **options) -> Dict[str, Any]:
+    """同步执行一批流程（在MCP客户端的后台事件循环中运行），参数同 BookingWorkflowEngine"""
+    async def run():
+        engine = BookingWorkflowEngine(**options)
+        try:
+            return await engine.run(requests)
+        finally:
+            await engine.aclose()
+    return run_sync(run())
+
+def print_report(report: Dict[str, Any]) -> None:
+    """打印批量预订汇总报告"""
+    total = report["total"]
+    print("\n📊 批量预订汇总")
+    print("=" * 60)
+    print(f"流程总数: {total}")
+    print(f"成功预订: {report['succeeded']}")
+    print(f"失败: {report['failed']}")
+    print(f"成功率: {report['succeeded'] / total * 100 if total else 0:.1f}%")
+    print(f"总耗时: {report['elapsed_seconds']:.2f}s | 吞吐量: {report['flows_per_second']:.1f} 流程/秒")
+    if report["throttled"]:
+        print(f"服务器限流(429)次数: {report['throttled']}")
+    print(f"\n{'步骤':<10} {'调用次数':<10} {'重试':<8} {'平均(ms)':<10} {'P95(ms)':<10}")
+    for step, stats in report["steps"].items():
+        if not stats["calls"] and not stats["retries"]:
+            continue
+        print(f"{STEP_NAMES[step]:<8} {stats['calls']:<12} {stats['retries']:<8} {stats['avg_ms']:<12.2f} {stats['p95_ms']:<10.2f}")
+    if report["failures"]:
+        print("\n❌ 失败原因:")
+        for reason, count in report["failures"].items():
+            print(f"  - {reason} ({count})")
+
+def main():
+    # 用法: python booking_workflow.py [流程数]，在示例航线上为虚构乘客批量预订
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    routes = [("PEK", "SHA"), ("SHA", "CAN"), ("CAN", "CTU"), ("CTU", "KMG"), ("XIY", "HGH")]
+    policies = list(SELECTION_POLICIES)
+    requests = [{"passenger_name": f"批量乘客{i + 1}", "departure": routes[i % len(routes)][0],
+                 "arrival": routes[i % len(routes)][1], "policy": policies[i % len(policies)]}
+                for i in range(count)]
+    print(f"🚀 批量预订: {count} 个流程，并发 {BOOKING_WORKFLOW_CONCURRENCY}")
+    print_report(run_booking_batch(requests))
+
+if __name__ == "__main__":
+    main()
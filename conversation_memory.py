@@ -0,0 +1,235 @@
+"""
+Agent的会话记忆
+每个会话保存最近几轮对话原文、更早对话的压缩摘要，以及已解析的实体（上次查询的航班列表、上次查看的预订等）：
+- "第2个航班"、"那个预订" 这类指代直接从会话中解析，不必重新查询MCP服务器
+- 发给LLM的上下文只包含摘要、实体和最近几轮对话，长度有上限
+- 会话数有上限，超出时淘汰最久未活动的会话；空闲超时的会话自动清除
+航班查询助手和预订管理助手默认共用全局的 conversation_store，同一会话中可以引用另一个助手的查询结果
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+
+from intent_rules import FLIGHT_NUMBER_RE
+
+# 会话记忆配置：会话数上限、空闲超时（秒）、保留原文的最近对话条数、压缩摘要的字符上限
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", 10000))
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", 1800))
+CONVERSATION_RECENT_TURNS = int(os.getenv("CONVERSATION_RECENT_TURNS", 6))
+CONVERSATION_SUMMARY_CHARS = int(os.getenv("CONVERSATION_SUMMARY_CHARS", 800))
+# 摘要中每条对话保留的字符数；列表实体（航班、预订）保留的条数
+CONVERSATION_SUMMARY_LINE_CHARS = 80
+CONVERSATION_MAX_ITEMS = 10
+# 未指定会话ID时（如本地交互模式）使用的会话
+DEFAULT_SESSION_ID = "default"
+
+ROLE_LABELS = {"user": "用户", "agent": "助手"}
+CHINESE_NUMERALS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+ORDINAL_RE = re.compile(r"第\s*([一二两三四五六七八九十]|\d{1,2})\s*(?:个|班|条|趟|项)")
+BOOKING_ID_REF_RE = re.compile(r"(?:预订|订单|ID|id|booking)\s*(?:ID|id|号|编号)?\s*[#:：]?\s*(\d+)")
+REFERENCE_WORDS = ("这个", "那个", "这班", "那班", "这趟", "那趟", "该航班", "该预订", "它", "刚才", "上面", "最后一个",
+                   "this", "that")
+
+def _mentions_reference(text: str) -> bool:
+    return any(word in text for word in REFERENCE_WORDS)
+
+def _ordinal(text: str) -> Optional[int]:
+    """序号引用转为列表下标：第N个 → N-1，最后一个 → -1，没有序号时返回None"""
+    if "最后一个" in text:
+        return -1
+    match = ORDINAL_RE.search(text)
+    if match is None:
+        return None
+    value = match.group(1)
+    number = int(value) if value.isdigit() else CHINESE_NUMERALS[value]
+    return number - 1 if number > 0 else None
+
+class ConversationMemory:
+    """单个会话的记忆：最近对话原文 + 压缩摘要 + 已解析的实体"""
+    def __init__(self, session_id: str, recent_turns: int = CONVERSATION_RECENT_TURNS,
+                 summary_chars: int = CONVERSATION_SUMMARY_CHARS):
+        self.session_id = session_id
+        self.recent_turns = recent_turns
+        self.summary_chars = summary_chars
+        self.turns: deque = deque()
+        self._summary: deque = deque()
+        self._summary_length = 0
+        # flights/bookings: 上次查询的结果列表；flight/booking: 最近一次单独提到的航班/预订；route: (出发, 到达)
+        self.entities: Dict[str, Any] = {}
+        self.turn_count = 0
+        self.last_active = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_turn(self, role: str, text: str) -> None:
+        """记录一条对话，超出最近条数的旧对话压缩进摘要"""
+        with self._lock:
+            self.turns.append((role, text))
+            self.turn_count += 1
+            self.last_active = time.monotonic()
+            while len(self.turns) > self.recent_turns:
+                self._fold(*self.turns.popleft())
+
+    def _fold(self, role: str, text: str) -> None:
+        text = " ".join(text.split())
+        if len(text) > CONVERSATION_SUMMARY_LINE_CHARS:
+            text = text[:CONVERSATION_SUMMARY_LINE_CHARS - 1] + "…"
+        line = f"{ROLE_LABELS.get(role, role)}: {text}"
+        self._summary.append(line)
+        self._summary_length += len(line) + 1
+        # 摘要超出上限时丢弃最早的内容
+        while self._summary_length > self.summary_chars and len(self._summary) > 1:
+            self._summary_length -= len(self._summary.popleft()) + 1
+
+    @property
+    def summary(self) -> str:
+        with self._lock:
+            return "\n".join(self._summary)
+
+    def remember(self, **entities: Any) -> None:
+        """记录已解析的实体，列表只保留前 CONVERSATION_MAX_ITEMS 条"""
+        with self._lock:
+            for key, value in entities.items():
+                self.entities[key] = value[:CONVERSATION_MAX_ITEMS] if isinstance(value, list) else value
+            self.last_active = time.monotonic()
+
+    def recall(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self.entities.get(key, default)
+
+    def resolve_flight(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        解析对会话中已有航班的引用：航班号、"第N个"、"这个/那个航班"
+
+        Returns:
+            引用的航班，无法解析时返回None
+        """
+        flights = self.recall("flights") or []
+        for match in FLIGHT_NUMBER_RE.finditer(text.upper()):
+            for flight in flights:
+                if flight.get("flight_number") == match.group(1):
+                    return flight
+        index = _ordinal(text)
+        if index is not None:
+            return flights[index] if -len(flights) <= index < len(flights) else None
+        if _mentions_reference(text):
+            if len(flights) == 1:
+                return flights[0]
+            return self.recall("flight")
+        return None
+
+    def resolve_booking(self, text: str) -> Optional[Dict[str, Any]]:
+        """解析对会话中已有预订的引用：预订ID、"第N个"、"这个/那个预订"（规则与resolve_flight相同）"""
+        bookings = self.recall("bookings") or []
+        match = BOOKING_ID_REF_RE.search(text)
+        if match:
+            return self.find_booking(int(match.group(1)))
+        index = _ordinal(text)
+        if index is not None:
+            return bookings[index] if -len(bookings) <= index < len(bookings) else None
+        if _mentions_reference(text):
+            if len(bookings) == 1:
+                return bookings[0]
+            return self.recall("booking")
+        return None
+
+    def find_booking(self, booking_id: int) -> Optional[Dict[str, Any]]:
+        """会话中已查询过的预订"""
+        candidates = (self.recall("bookings") or []) + [self.recall("booking") or {}]
+        return next((booking for booking in candidates if booking.get("id") == booking_id), None)
+
+    def _entity_lines(self) -> List[str]:
+        lines = []
+        route = self.entities.get("route")
+        if route:
+            lines.append(f"上次查询的航线: {route[0]}→{route[1]}")
+        flights = self.entities.get("flights")
+        if flights:
+            lines.append("上次查询的航班: " + "; ".join(
+                f"{i}. {f['flight_number']} {f['departure_airport']}→{f['arrival_airport']} ¥{f['price']}"
+                for i, f in enumerate(flights, 1)))
+        booking = self.entities.get("booking")
+        if booking:
+            lines.append(f"当前预订: ID {booking['id']} {booking['passenger_name']} {booking['flight_number']} "
+                         f"{booking['departure_date']} 状态 {booking['status']}")
+        return lines
+
+    def context_messages(self) -> List[Dict[str, str]]:
+        """发给LLM的会话上下文：摘要和已知实体合并为一条系统消息，随后是最近几轮对话"""
+        with self._lock:
+            notes = []
+            if self._summary:
+                notes.append("此前对话摘要:\n" + "\n".join(self._summary))
+            notes.extend(self._entity_lines())
+            messages = [{"role": "system", "content": "\n".join(notes)}] if notes else []
+            messages.extend({"role": "user" if role == "user" else "assistant", "content": text}
+                            for role, text in self.turns)
+            return messages
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "session_id": self.session_id,
+                "turns": self.turn_count,
+                "recent": [{"role": role, "text": text} for role, text in self.turns],
+                "summary": "\n".join(self._summary),
+                "entities": sorted(self.entities),
+                "idle_seconds": round(time.monotonic() - self.last_active, 1)
+            }
+
+class ConversationStore:
+    """会话记忆表：按最近活动时间排序（LRU），清除空闲超时和超出上限的会话"""
+    def __init__(self, max_sessions: int = CONVERSATION_MAX_SESSIONS, ttl: int = CONVERSATION_TTL,
+                 recent_turns: int = CONVERSATION_RECENT_TURNS, summary_chars: int = CONVERSATION_SUMMARY_CHARS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.recent_turns = recent_turns
+        self.summary_chars = summary_chars
+        self._sessions: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "evicted": 0, "expired": 0}
+
+    def get(self, session_id: Optional[str] = None) -> ConversationMemory:
+        """获取会话记忆，不存在时创建"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        with self._lock:
+            self._expire()
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = ConversationMemory(session_id, self.recent_turns, self.summary_chars)
+                self._sessions[session_id] = memory
+                self._stats["created"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats["evicted"] += 1
+            self._sessions.move_to_end(session_id)
+            memory.last_active = time.monotonic()
+            return memory
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            memory = next(iter(self._sessions.values()))
+            if now - memory.last_active < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._stats["expired"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._sessions)
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+# 全局会话记忆
+conversation_store = ConversationStore()
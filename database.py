@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, DECIMAL, DateTime, text
+from sqlalchemy import create_engine, Column, Integer, String, Date, Time, DECIMAL, DateTime, Text, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -26,17 +27,33 @@ except Exception as e:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 归档库：PostgreSQL默认与主库同库（归档表按出发日期原生分区），SQLite默认使用独立的归档库文件
+def _default_archive_url(url: str) -> str:
+    if url.startswith("sqlite:///") and url.endswith(".db"):
+        return url[:-len(".db")] + "_archive.db"
+    return url
+
+ARCHIVE_DATABASE_URL = os.getenv("ARCHIVE_DATABASE_URL", _default_archive_url(DATABASE_URL))
+if "postgresql://" in ARCHIVE_DATABASE_URL and "+asyncpg" not in ARCHIVE_DATABASE_URL:
+    ARCHIVE_DATABASE_URL = ARCHIVE_DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://")
+
+archive_engine = engine if ARCHIVE_DATABASE_URL == DATABASE_URL else create_engine(ARCHIVE_DATABASE_URL)
+ArchiveSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=archive_engine)
+
 # 创建基类
 Base = declarative_base()
+ArchiveBase = declarative_base()
 
 class Booking(Base):
     __tablename__ = "bookings"
+    # SQLite默认会复用已删除的最大ID；预订归档后ID在冷存储中继续使用，热表不能再分配同一ID
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     passenger_name = Column(String(100), nullable=False)
     flight_number = Column(String(20), nullable=False)
-    departure_date = Column(Date, nullable=False)
+    departure_date = Column(Date, nullable=False, index=True)
     departure_time = Column(Time, nullable=False)
     arrival_date = Column(Date, nullable=False)
     arrival_time = Column(Time, nullable=False)
@@ -63,11 +80,105 @@ class Flight(Base):
     aircraft_type = Column(String(50), nullable=True)
     status = Column(String(20), default="active")
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class DeletedFlight(Base):
+    """已删除航班的记录，供客户端的航班目录增量同步删除操作"""
+    __tablename__ = "deleted_flights"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    flight_id = Column(Integer, nullable=False)
+    flight_number = Column(String(20), nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class FareCalendar(Base):
+    """票价日历聚合表：每条航线每天的最低票价（预计算，按需增量刷新），computed_version落后于version即为过期"""
+    __tablename__ = "fare_calendar"
+    __table_args__ = (
+        UniqueConstraint("departure_airport", "arrival_airport", "fare_date", name="uq_fare_calendar_route_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    departure_airport = Column(String(10), nullable=False)
+    arrival_airport = Column(String(10), nullable=False)
+    fare_date = Column(Date, nullable=False)
+    min_price = Column(DECIMAL(10, 2), nullable=True)
+    flight_number = Column(String(20), nullable=True)
+    available_flights = Column(Integer, default=0)
+    version = Column(Integer, nullable=False, default=0)
+    computed_version = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RouteRecommendation(Base):
+    """航线推荐缓存：version在航线的航班变更时递增，computed_version落后于version即为过期"""
+    __tablename__ = "route_recommendations"
+    __table_args__ = (
+        UniqueConstraint("departure_airport", "arrival_airport", name="uq_route_recommendations_route"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    departure_airport = Column(String(10), nullable=False)
+    arrival_airport = Column(String(10), nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+    computed_version = Column(Integer, nullable=True)
+    recommendation = Column(Text, nullable=True)
+    flight_count = Column(Integer, default=0)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class OutboxEvent(Base):
+    """事务性发件箱：预订变更事件，与业务写入同一事务落库；sequence按提交可见顺序分配，即事件日志偏移量"""
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    aggregate_type = Column(String(50), nullable=False)
+    aggregate_id = Column(Integer, nullable=False)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    published_at = Column(DateTime, nullable=True, index=True)
+    sequence = Column(Integer, nullable=True, unique=True, index=True)
+
+class ArchivedBooking(ArchiveBase):
+    """已归档的历史预订（冷数据），保留原预订ID"""
+    __tablename__ = "bookings_archive"
+    # PostgreSQL上按出发日期做RANGE分区，分区键必须包含在主键中
+    __table_args__ = {"postgresql_partition_by": "RANGE (departure_date)"}
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    departure_date = Column(Date, primary_key=True)
+    title = Column(String(200), nullable=False)
+    passenger_name = Column(String(100), nullable=False, index=True)
+    flight_number = Column(String(20), nullable=False)
+    departure_time = Column(Time, nullable=False)
+    arrival_date = Column(Date, nullable=False)
+    arrival_time = Column(Time, nullable=False)
+    departure_airport = Column(String(10), nullable=False)
+    arrival_airport = Column(String(10), nullable=False)
+    seat_number = Column(String(10), nullable=True)
+    price = Column(DECIMAL(10, 2), nullable=False)
+    status = Column(String(20), default="confirmed")
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+# 同时持有数据库会话的请求数上限：连接池默认容量为5+10，归档与主库同库时一个请求最多占用两个连接
+DB_MAX_CONCURRENT_SESSIONS = int(os.getenv("DB_MAX_CONCURRENT_SESSIONS", 7))
+_session_slots = asyncio.Semaphore(DB_MAX_CONCURRENT_SESSIONS)
+
 # 获取数据库会话
-def get_db():
-    db = SessionLocal()
+# 接口在线程池中查询数据库，线程池（默认40个线程）大于连接池：若线程都在等待连接，
+# 已完成的请求没有线程做响应序列化和会话清理，连接无法归还，所有请求一起等到连接池超时。
+# 因此超出上限的请求在事件循环中排队、不占用线程；会话的创建和关闭也在事件循环中执行
+async def get_db():
+    async with _session_slots:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+async def get_archive_db():
+    db = ArchiveSessionLocal()
     try:
         yield db
     finally:
@@ -76,3 +187,4 @@ def get_db():
 # 创建所有表
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    ArchiveBase.metadata.create_all(bind=archive_engine)
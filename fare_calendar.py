@@ -0,0 +1,207 @@
+"""
+票价日历
+预计算每条航线每天的最低票价，写操作时按航线/日期增量失效
+每行带版本号：失效递增版本号，补算结果只在版本号未变时写回，不会覆盖计算期间发生的失效
+"""
+
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import Booking, Flight, FareCalendar
+
+# 不计入占座的预订状态
+INACTIVE_BOOKING_STATUSES = ("cancelled",)
+# 航线标记行的日期：整条航线失效时递增它的版本号，任何查询区间都不会包含它
+ROUTE_MARKER_DATE = date(1, 1, 1)
+# 可查询的最早年份
+MIN_FARE_YEAR = 1900
+
+def parse_month(month: str) -> Tuple[date, date]:
+    """
+    解析YYYY-MM格式的月份
+
+    Returns:
+        (当月第一天, 当月最后一天)
+    """
+    first_day = datetime.strptime(month, "%Y-%m").date()
+    if first_day.year < MIN_FARE_YEAR:
+        # 也保证查询区间不会包含航线标记行的日期
+        raise ValueError(f"月份不能早于 {MIN_FARE_YEAR} 年: {month}")
+    last_day = first_day.replace(day=calendar.monthrange(first_day.year, first_day.month)[1])
+    return first_day, last_day
+
+def booked_seats(db: Session, flight_numbers: List[str], first_day: date, last_day: date) -> Dict[Tuple[str, date], int]:
+    """
+    按航班和出发日期统计占座的预订数
+
+    航班的 available_seats 是每天的座位数，预订不修改它；某天的余票 = available_seats - 当天占座的预订数
+    """
+    rows = db.query(
+        Booking.flight_number, Booking.departure_date, func.count(Booking.id)
+    ).filter(
+        Booking.flight_number.in_(flight_numbers),
+        Booking.departure_date >= first_day,
+        Booking.departure_date <= last_day,
+        Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+    ).group_by(Booking.flight_number, Booking.departure_date).all()
+    return {(flight_number, day): count for flight_number, day, count in rows}
+
+def _compute_days(db: Session, departure: str, arrival: str, days: List[date]) -> List[FareCalendar]:
+    """一次性计算多天的最低票价（一次航班查询 + 一次分组计数）"""
+    flights = db.query(Flight).filter(
+        Flight.departure_airport == departure,
+        Flight.arrival_airport == arrival,
+        Flight.status == "active"
+    ).all()
+
+    booked = booked_seats(db, [f.flight_number for f in flights], min(days), max(days)) if flights and days else {}
+
+    # 航班按价格升序，第一个仍有余票的即为当天最低价
+    flights.sort(key=lambda f: f.price)
+    entries = []
+    for day in days:
+        open_flights = [
+            f for f in flights
+            if (f.available_seats or 0) - booked.get((f.flight_number, day), 0) > 0
+        ]
+        cheapest = open_flights[0] if open_flights else None
+        entries.append(FareCalendar(
+            departure_airport=departure,
+            arrival_airport=arrival,
+            fare_date=day,
+            min_price=cheapest.price if cheapest else None,
+            flight_number=cheapest.flight_number if cheapest else None,
+            available_flights=len(open_flights)
+        ))
+    return entries
+
+def _to_dict(entry: FareCalendar) -> Dict[str, Any]:
+    return {
+        "date": entry.fare_date.isoformat(),
+        "min_price": entry.min_price,
+        "flight_number": entry.flight_number,
+        "available_flights": entry.available_flights
+    }
+
+def _route(departure: str, arrival: str) -> tuple:
+    return (FareCalendar.departure_airport == departure, FareCalendar.arrival_airport == arrival)
+
+def _bump_version(db: Session, departure: str, arrival: str, fare_date: date) -> None:
+    """递增航线某天（或航线标记行）的版本号，记录不存在时插入只有版本号的记录"""
+    row = (*_route(departure, arrival), FareCalendar.fare_date == fare_date)
+    bump = {FareCalendar.version: FareCalendar.version + 1}
+    if db.query(FareCalendar).filter(*row).update(bump, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(FareCalendar(departure_airport=departure, arrival_airport=arrival, fare_date=fare_date, version=1))
+    except IntegrityError:
+        # 并发请求已插入该日期的记录
+        db.query(FareCalendar).filter(*row).update(bump, synchronize_session=False)
+
+def _claim_days(db: Session, departure: str, arrival: str, days: List[date]) -> Dict[date, int]:
+    """
+    为要计算的日期和航线标记行占位并提交，返回计算前各记录的版本号
+
+    占位记录提交之后，任何失效都会递增这些记录的版本号，写回时据此判断计算期间是否发生过失效。
+    """
+    existing = {
+        fare_date for (fare_date,) in db.query(FareCalendar.fare_date).filter(
+            *_route(departure, arrival), FareCalendar.fare_date.in_(days)
+        ).all()
+    }
+    for day in days:
+        if day in existing:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(FareCalendar(departure_airport=departure, arrival_airport=arrival, fare_date=day, version=0))
+        except IntegrityError:
+            # 并发请求（或失效操作）已插入该日期的记录
+            pass
+    db.commit()
+    return dict(db.query(FareCalendar.fare_date, FareCalendar.version).filter(
+        *_route(departure, arrival), FareCalendar.fare_date.in_(days)
+    ).all())
+
+def _store_days(db: Session, departure: str, arrival: str, versions: Dict[date, int], entries: List[FareCalendar]) -> None:
+    """
+    条件写回：版本号仍等于计算前的版本号时才写入
+
+    先检查航线标记行（整条航线失效时递增），再逐日检查；
+    计算期间发生过失效的日期保持过期状态，下次查询时重新计算。
+    """
+    route = _route(departure, arrival)
+    try:
+        unchanged = db.query(FareCalendar).filter(
+            *route, FareCalendar.fare_date == ROUTE_MARKER_DATE, FareCalendar.version == versions[ROUTE_MARKER_DATE]
+        ).update({FareCalendar.version: FareCalendar.version}, synchronize_session=False)
+        if unchanged:
+            for entry in entries:
+                version = versions[entry.fare_date]
+                db.query(FareCalendar).filter(
+                    *route, FareCalendar.fare_date == entry.fare_date, FareCalendar.version == version
+                ).update({
+                    FareCalendar.min_price: entry.min_price,
+                    FareCalendar.flight_number: entry.flight_number,
+                    FareCalendar.available_flights: entry.available_flights,
+                    FareCalendar.computed_version: version
+                }, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def get_fare_calendar(db: Session, departure: str, arrival: str, first_day: date, last_day: date) -> List[Dict[str, Any]]:
+    """
+    获取日期区间内每天的最低票价
+
+    已预计算且未过期的日期直接读聚合表，缺失或已失效的日期一次性补算并条件写回。
+    """
+    if first_day <= ROUTE_MARKER_DATE:
+        raise ValueError(f"日期区间包含航线标记行的日期: {first_day}")
+    departure, arrival = departure.upper(), arrival.upper()
+    cached = {
+        row.fare_date: row
+        for row in db.query(FareCalendar).filter(
+            *_route(departure, arrival),
+            FareCalendar.fare_date >= first_day,
+            FareCalendar.fare_date <= last_day,
+            FareCalendar.computed_version == FareCalendar.version
+        ).all()
+    }
+
+    all_days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    missing = [day for day in all_days if day not in cached]
+    # 提交前先转换，避免commit后逐行刷新过期属性
+    results = {day: _to_dict(row) for day, row in cached.items()}
+
+    if missing:
+        versions = _claim_days(db, departure, arrival, [ROUTE_MARKER_DATE] + missing)
+        entries = _compute_days(db, departure, arrival, missing)
+        results.update({entry.fare_date: _to_dict(entry) for entry in entries})
+        _store_days(db, departure, arrival, versions, entries)
+
+    return [results[day] for day in all_days]
+
+def invalidate_fares(db: Session, departure: str, arrival: str, fare_date: Optional[date] = None) -> None:
+    """
+    使聚合表中的航线（或航线某天）失效，下次查询时重新计算
+
+    只递增版本号、不删除记录：正在计算的查询写回时发现版本号变化，就不会用旧结果覆盖。
+    在写操作的同一事务中调用，由调用方负责commit。
+    """
+    departure, arrival = departure.upper(), arrival.upper()
+    if fare_date is not None:
+        _bump_version(db, departure, arrival, fare_date)
+        return
+    # 标记行覆盖尚无记录的日期，先递增标记行，与写回时的加锁顺序一致
+    _bump_version(db, departure, arrival, ROUTE_MARKER_DATE)
+    db.query(FareCalendar).filter(
+        *_route(departure, arrival), FareCalendar.fare_date != ROUTE_MARKER_DATE
+    ).update({FareCalendar.version: FareCalendar.version + 1}, synchronize_session=False)
@@ -0,0 +1,139 @@
+"""
+客户端航班目录快照
+首次使用时拉取完整航班目录，按ID、航班号和航线建立索引，之后通过服务器的增量接口
+（GET /flights/changes?updated_since=...）只同步变更和删除的航班；
+航线查询和按航班号查询直接在本地回答
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+# 快照配置：FLIGHT_SNAPSHOT_ENABLED=1 时航班查询助手使用本地快照
+FLIGHT_SNAPSHOT_ENABLED = os.getenv("FLIGHT_SNAPSHOT_ENABLED", "0") == "1"
+# 距上次同步超过N秒时，下次查询前先增量同步
+FLIGHT_SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("FLIGHT_SNAPSHOT_REFRESH_INTERVAL", 30))
+# 增量查询的时间回退量：覆盖查询时尚未提交、但更新时间早于server_time的事务
+FLIGHT_SNAPSHOT_OVERLAP_SECONDS = 5
+
+class FlightCatalog:
+    """
+    航班目录快照
+
+    每个航班只保存一份，航班号索引和航线索引只保存航班ID；
+    fetch_changes(updated_since) 返回服务器增量接口的响应，updated_since为None时返回完整目录
+    """
+    def __init__(self, fetch_changes: Callable[[Optional[str]], Optional[Dict[str, Any]]],
+                 refresh_interval: float = FLIGHT_SNAPSHOT_REFRESH_INTERVAL):
+        self.fetch_changes = fetch_changes
+        self.refresh_interval = refresh_interval
+        self._flights: Dict[int, Dict[str, Any]] = {}
+        self._by_number: Dict[str, int] = {}
+        self._by_route: Dict[Tuple[str, str], List[int]] = {}
+        self._server_time: Optional[datetime] = None
+        self._synced_at = 0.0
+        # _lock保护索引，_refresh_lock保证同一时间只有一个同步请求（网络请求期间查询不受阻塞）
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stats = {"full_loads": 0, "delta_syncs": 0, "changes_applied": 0, "local_queries": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._server_time is not None
+
+    def _index(self, flight: Dict[str, Any]) -> None:
+        self._flights[flight["id"]] = flight
+        self._by_number[flight["flight_number"]] = flight["id"]
+        if flight.get("status") == "active":
+            route = (flight["departure_airport"].upper(), flight["arrival_airport"].upper())
+            self._by_route.setdefault(route, []).append(flight["id"])
+
+    def _unindex(self, flight_id: int) -> None:
+        flight = self._flights.pop(flight_id, None)
+        if flight is None:
+            return
+        if self._by_number.get(flight["flight_number"]) == flight_id:
+            del self._by_number[flight["flight_number"]]
+        route = (flight["departure_airport"].upper(), flight["arrival_airport"].upper())
+        ids = self._by_route.get(route)
+        if ids and flight_id in ids:
+            ids.remove(flight_id)
+            if not ids:
+                del self._by_route[route]
+
+    def upsert(self, flight: Dict[str, Any]) -> None:
+        """写入或替换一个航班（本地创建航班后可直接写入，无需等待下次同步）"""
+        with self._lock:
+            self._unindex(flight["id"])
+            self._index(flight)
+
+    def remove(self, flight_id: int) -> None:
+        with self._lock:
+            self._unindex(flight_id)
+
+    def refresh(self, full: bool = False) -> bool:
+        """
+        与服务器同步：尚未加载或full=True时拉取完整目录，否则只拉取增量
+
+        Returns:
+            同步是否成功（失败时保留现有快照）
+        """
+        with self._refresh_lock:
+            since = None
+            if self._server_time is not None and not full:
+                since = (self._server_time - timedelta(seconds=FLIGHT_SNAPSHOT_OVERLAP_SECONDS)).isoformat()
+            result = self.fetch_changes(since)
+            if result is None:
+                return False
+
+            with self._lock:
+                if since is None:
+                    self._flights, self._by_number, self._by_route = {}, {}, {}
+                    self._stats["full_loads"] += 1
+                else:
+                    self._stats["delta_syncs"] += 1
+                # 先处理删除：SQLite可能复用已删除航班的ID
+                for deleted in result.get("deleted", []):
+                    self._unindex(deleted["id"])
+                for flight in result.get("flights", []):
+                    self._unindex(flight["id"])
+                    self._index(flight)
+                self._stats["changes_applied"] += len(result.get("flights", [])) + len(result.get("deleted", []))
+                self._server_time = datetime.fromisoformat(result["server_time"])
+                self._synced_at = time.monotonic()
+            return True
+
+    def ensure_fresh(self) -> bool:
+        """快照未加载或已超过刷新间隔时同步；返回快照是否可用"""
+        if not self.loaded or time.monotonic() - self._synced_at >= self.refresh_interval:
+            self.refresh()
+        return self.loaded
+
+    def search(self, departure: str, arrival: str) -> List[Dict[str, Any]]:
+        """航线上的有效航班，按ID排序"""
+        with self._lock:
+            self._stats["local_queries"] += 1
+            ids = self._by_route.get((departure.upper(), arrival.upper()), [])
+            return [self._flights[flight_id] for flight_id in sorted(ids)]
+
+    def get_by_number(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._stats["local_queries"] += 1
+            flight_id = self._by_number.get(flight_number)
+            return self._flights.get(flight_id) if flight_id is not None else None
+
+    def list_active(self, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """与 GET /flights 一致：有效航班按ID排序后分页"""
+        with self._lock:
+            self._stats["local_queries"] += 1
+            active = [flight for flight_id, flight in sorted(self._flights.items()) if flight.get("status") == "active"]
+        return active[skip:skip + limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(flights=len(self._flights), routes=len(self._by_route),
+                     server_time=self._server_time.isoformat() if self._server_time else None)
+        return stats
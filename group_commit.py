@@ -0,0 +1,127 @@
+"""
+预订写入的组提交（group commit）
+在很短的时间窗口内到达的并发创建请求合并为一个事务提交，摊薄每次commit的fsync开销；
+每个调用方仍然得到各自的结果或错误
+"""
+
+import asyncio
+import os
+from typing import Dict, Any, List, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Booking
+from fare_calendar import invalidate_fares
+from outbox import record_booking_event
+
+# 组提交配置：BOOKING_GROUP_COMMIT=1 时启用
+BOOKING_GROUP_COMMIT = os.getenv("BOOKING_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", 2))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", 64))
+
+def stage_bookings(db: Session, bookings_data: List[Dict[str, Any]]) -> List[Booking]:
+    """
+    在当前事务中写入预订及其附带数据（票价日历失效、发件箱事件），由调用方负责commit
+    """
+    bookings = [Booking(**data) for data in bookings_data]
+    db.add_all(bookings)
+    db.flush()
+    for departure, arrival, departure_date in {
+        (b.departure_airport, b.arrival_airport, b.departure_date) for b in bookings
+    }:
+        invalidate_fares(db, departure, arrival, departure_date)
+    for booking in bookings:
+        record_booking_event(db, "booking.created", booking)
+    return bookings
+
+def commit_bookings(bookings_data: List[Dict[str, Any]]) -> List[Union[Booking, Exception]]:
+    """
+    在一个事务中提交一批预订
+
+    整批失败时逐条重试，使一条坏数据只影响它自己的调用方。
+    """
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        bookings = stage_bookings(db, bookings_data)
+        db.commit()
+        return bookings
+    except Exception as e:
+        db.rollback()
+        if len(bookings_data) == 1:
+            return [e]
+    finally:
+        db.close()
+    return [commit_bookings([data])[0] for data in bookings_data]
+
+class GroupCommitter:
+    """
+    组提交调度器
+
+    第一个请求到达后最多等待window秒（或攒满max_batch条）再统一提交；
+    提交进行期间新到达的请求自然累积为下一批。
+    """
+    def __init__(self, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._worker = None
+        self.batches = 0
+        self.committed = 0
+
+    async def submit(self, booking_data: Dict[str, Any]) -> Booking:
+        """提交一个预订，等待所在批次提交完成后返回该预订或抛出其错误"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((booking_data, future))
+        self._has_pending.set()
+        if len(self._pending) >= self.max_batch:
+            self._batch_full.set()
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            if len(self._pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if not self._pending:
+                self._has_pending.clear()
+            if len(self._pending) < self.max_batch:
+                self._batch_full.clear()
+
+            try:
+                results = await asyncio.to_thread(commit_bookings, [data for data, _ in batch])
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("组提交调度器已关闭"))
+                raise
+            except Exception as e:
+                results = [e] * len(batch)
+
+            self.batches += 1
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    self.committed += 1
+                    future.set_result(result)
+
+    async def close(self) -> None:
+        """停止调度器，未提交的请求以错误返回"""
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        for _, future in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("组提交调度器已关闭"))
+        self._pending = []
@@ -0,0 +1,122 @@
+"""
+意图分析微批处理
+并发用户在很短的时间窗口内到达的分析请求合并为一次结构化输出的LLM请求，再把结果分发回各调用方；
+批量回复中缺失或无法解析的条目回退为单独调用
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from azure_openai_client import azure_client, AzureOpenAIClient
+
+# 微批配置：INTENT_BATCH_ENABLED=1 时启用
+INTENT_BATCH_ENABLED = os.getenv("INTENT_BATCH_ENABLED", "0") == "1"
+INTENT_BATCH_WINDOW_MS = float(os.getenv("INTENT_BATCH_WINDOW_MS", 20))
+INTENT_BATCH_MAX_SIZE = int(os.getenv("INTENT_BATCH_MAX_SIZE", 16))
+INTENT_BATCH_WORKERS = int(os.getenv("INTENT_BATCH_WORKERS", 4))
+
+class IntentBatcher:
+    """
+    意图分析微批调度器
+
+    第一条请求到达后最多等待window秒（或攒满max_batch条）再发出批量请求；
+    最多workers个批量请求同时进行，等待期间新到达的请求累积为下一批。
+    窗口越大批次越大、LLM请求越少，但每条请求的额外延迟也越高。
+    """
+    def __init__(self, window_ms: float = INTENT_BATCH_WINDOW_MS, max_batch: int = INTENT_BATCH_MAX_SIZE,
+                 workers: int = INTENT_BATCH_WORKERS, client: Optional[AzureOpenAIClient] = None):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.client = client or azure_client
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="intent-batch")
+        self._pending: List[Tuple[str, Future]] = []
+        self._cond = threading.Condition()
+        self._collector: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"requests": 0, "batches": 0, "batched": 0, "fallbacks": 0}
+
+    def submit(self, user_input: str) -> Future:
+        """提交一条分析请求，返回结果为分析字典的Future"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("意图微批调度器已关闭")
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name="intent-batch-collector", daemon=True)
+                self._collector.start()
+            self._pending.append((user_input, future))
+            self._stats["requests"] += 1
+            self._cond.notify()
+        return future
+
+    def analyze(self, user_input: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """与azure_client.analyze_booking_request相同的阻塞接口"""
+        return self.submit(user_input).result(timeout=timeout)
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                window_end = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = window_end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: List[Tuple[str, Future]]) -> None:
+        if len(batch) == 1:
+            self._analyze_one(*batch[0])
+            return
+
+        try:
+            results = self.client.analyze_booking_requests([user_input for user_input, _ in batch])
+        except Exception as e:
+            print(f"⚠️  批量意图分析失败，改为逐条分析: {e}")
+            results = [None] * len(batch)
+
+        with self._cond:
+            self._stats["batches"] += 1
+            self._stats["batched"] += len(batch)
+        for (user_input, future), result in zip(batch, results):
+            if result is not None:
+                future.set_result(result)
+                continue
+            with self._cond:
+                self._stats["fallbacks"] += 1
+            self._executor.submit(self._analyze_one, user_input, future)
+
+    def _analyze_one(self, user_input: str, future: Future) -> None:
+        try:
+            future.set_result(self.client.analyze_booking_request(user_input))
+        except Exception as e:
+            future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["batched"] / stats["batches"] if stats["batches"] else 0.0
+        # 每个批次一次请求，加上单条批次和回退的单独请求
+        stats["llm_requests"] = stats["requests"] - stats["batched"] + stats["batches"] + stats["fallbacks"]
+        return stats
+
+    def close(self) -> None:
+        """停止调度器，未发出的请求以错误返回"""
+        with self._cond:
+            self._closed = True
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+        for _, future in pending:
+            future.set_exception(RuntimeError("意图微批调度器已关闭"))
+        self._executor.shutdown(wait=False)
+
+# 创建全局微批调度器实例（未启用时为None）
+intent_batcher = IntentBatcher() if INTENT_BATCH_ENABLED else None
@@ -0,0 +1,269 @@
+"""
+本地规则意图识别
+用关键词前缀树 + 预编译正则识别意图和实体（乘客姓名、航班号、日期、机场代码、预订ID），
+置信度达到阈值的请求直接在本地回答，其余交给LLM分析
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from airport_extractor import extract_airports
+
+# 规则识别配置：INTENT_RULES_ENABLED=0 时所有请求都交给LLM
+INTENT_RULES_ENABLED = os.getenv("INTENT_RULES_ENABLED", "1") == "1"
+INTENT_RULES_THRESHOLD = float(os.getenv("INTENT_RULES_THRESHOLD", 0.85))
+
+INTENT_KEYWORDS = {
+    "search_booking": ["查询", "查看", "查一下", "查找", "查", "搜索", "找一下", "看看", "search"],
+    "create_booking": ["订票", "订机票", "订一张", "帮我订", "我要订", "想订", "买票", "买机票", "预订机票",
+                       "预订航班", "创建预订", "新建预订", "book"],
+    "update_booking": ["修改", "更改", "改签", "换座", "换个座位", "update", "change"],
+    "cancel_booking": ["取消", "退票", "退订", "不要了", "cancel"],
+}
+
+FLIGHT_NUMBER_RE = re.compile(r"(?<![A-Za-z0-9])((?:[A-Z]{2}|[A-Z]\d|\d[A-Z])\d{3,4})(?![A-Za-z0-9])")
+AIRPORT_RE = re.compile(r"(?<![A-Za-z0-9])([A-Z]{3})(?![A-Za-z0-9])")
+BOOKING_ID_RE = re.compile(r"(?:预订|订单|ID|id|booking)\s*(?:ID|id|号|编号)?\s*[#:：]?\s*(\d+)")
+ISO_DATE_RE = re.compile(r"(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})日?")
+MONTH_DAY_RE = re.compile(r"(?<!\d)(\d{1,2})月(\d{1,2})[日号]")
+RELATIVE_DAYS = {"今天": 0, "明天": 1, "后天": 2}
+# 姓名识别：(正则, 是否为强提示)。"乘客：XX" 是强提示；"XX的预订" 是弱提示，XX不以常见姓氏开头时置信度低于阈值，交给LLM
+PASSENGER_NAME_RES = [
+    (re.compile(r"(?:乘客|旅客|姓名|passenger)\s*[:：]?\s*([一-龥]{2,4}?(?=的|[^一-龥]|$)|[A-Za-z][A-Za-z ]{0,30}[A-Za-z])"), True),
+    (re.compile(r"(?:^|[\s，,。：:、]|为|给|帮)([一-龥]{2,4})(?:名下)?的(?:所有)?(?:预订|订单|机票|航班)"), False),
+]
+# 不会出现在姓名中的词：时间词、代词、数量/范围词
+NAME_STOPWORDS = (
+    "今天", "明天", "后天", "昨天", "前天", "最近", "近期", "本周", "这周", "上周", "下周", "周末", "本月", "这个月",
+    "上个月", "下个月", "今年", "去年", "明年", "早上", "上午", "中午", "下午", "晚上", "现在", "目前", "当前",
+    "之前", "以前", "之后", "以后", "刚才", "将来", "未来", "历史",
+    "我", "你", "您", "他", "她", "它", "咱", "自己", "大家", "别人", "人家",
+    "全部", "所有", "一下", "一些", "这些", "那些", "这个", "那个", "哪个", "每个", "其他", "其它", "有效", "已有", "最新",
+)
+COMMON_SURNAMES = set(
+    "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔"
+    "钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤常温康施文牛樊葛"
+    "邢安齐易乔伍庞颜倪庄聂章鲁岳翟殷詹申欧耿关兰焦俞左柳甘祝包宁尚符舒阮柯纪梅童凌毕单季裴霍涂成苗谷盛曲翁冉骆蓝"
+    "路游辛靳管柴蒙鲍华喻祁蒲房滕屈饶解牟艾尤阳时穆农司卓古吉缪简车项连芦麦褚娄窦戚岑景党宫费卜冷晏席卫米柏宗瞿桂"
+    "全佟应臧闵苟邬边卞姬师和仇栾隋商刁沙荣巫寇桑郎甄丛仲虞敖巩佘池查麻苑迟邝"
+)
+COMPOUND_SURNAMES = ("欧阳", "司马", "上官", "诸葛", "东方", "皇甫", "尉迟", "公孙", "慕容", "令狐", "长孙", "宇文", "司徒", "夏侯")
+
+class KeywordTrie:
+    """关键词前缀树：一次扫描找出文本中所有不重叠的最长关键词（英文关键词需完整单词匹配）"""
+    def __init__(self):
+        self._root: Dict[str, Any] = {}
+
+    def add(self, keyword: str, value: str) -> None:
+        node = self._root
+        for char in keyword.lower():
+            node = node.setdefault(char, {})
+        node[None] = value
+
+    @staticmethod
+    def _at_boundary(text: str, start: int, end: int) -> bool:
+        if not text[start:end].isascii():
+            return True
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not (before.isascii() and before.isalpha()) and not (after.isascii() and after.isalpha())
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Returns:
+            [(起始位置, 结束位置, 关键词对应的值)]
+        """
+        text = text.lower()
+        matches = []
+        i = 0
+        while i < len(text):
+            node, match = self._root, None
+            j = i
+            while j < len(text) and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if None in node and self._at_boundary(text, i, j):
+                    match = (i, j, node[None])
+            if match:
+                matches.append(match)
+                i = match[1]
+            else:
+                i += 1
+        return matches
+
+def _extract_date(text: str) -> Optional[str]:
+    match = ISO_DATE_RE.search(text)
+    if match:
+        try:
+            return date(*map(int, match.groups())).isoformat()
+        except ValueError:
+            return None
+    match = MONTH_DAY_RE.search(text)
+    if match:
+        try:
+            return date(date.today().year, *map(int, match.groups())).isoformat()
+        except ValueError:
+            return None
+    for word, offset in RELATIVE_DAYS.items():
+        if word in text:
+            return (date.today() + timedelta(days=offset)).isoformat()
+    return None
+
+def _plausible_name(name: str) -> bool:
+    """排除时间词、代词、数量词（"明天的预订"、"我们的订单"）和城市/机场名（"北京的航班"）"""
+    if any(word in name for word in NAME_STOPWORDS):
+        return False
+    return not any(match["kind"] != "code" for match in extract_airports(name))
+
+def _has_surname(name: str) -> bool:
+    return name[:2] in COMPOUND_SURNAMES or name[:1] in COMMON_SURNAMES
+
+def _reply_for(intent: str, entities: Dict[str, Any]) -> str:
+    """本地命中时的建议回复（与LLM分析结果中的response字段对应）"""
+    booking_id = entities.get("booking_id")
+    if intent == "search_booking":
+        target = entities.get("passenger_name") or f"预订 {booking_id} "
+        return f"正在为您查询{target}的信息。"
+    if intent == "create_booking":
+        flight = f"航班 {entities['flight_number']} " if entities.get("flight_number") else ""
+        day = f"{entities['departure_date']} " if entities.get("departure_date") else ""
+        return f"好的，将为您预订{day}{flight}的机票。请输入 create 命令，按提示填写乘客和航班信息完成预订。"
+    if intent == "update_booking":
+        return f"如需修改预订 {booking_id}，请输入 update 命令，可修改座位号和状态。"
+    return f"如需取消预订 {booking_id}，请输入 delete 命令并按提示确认。"
+
+def merge_context(entities: Dict[str, Any], context: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    把会话上下文中已解析的实体（如"那个预订"对应的预订ID）补入文本中没有出现的实体
+
+    Returns:
+        从上下文补入的实体名
+    """
+    filled = []
+    # 航线的两端一起补入：文本中已出现任一端时不使用上下文中的航线
+    has_route = "departure_airport" in entities or "arrival_airport" in entities
+    for key, value in (context or {}).items():
+        if has_route and key in ("departure_airport", "arrival_airport"):
+            continue
+        if entities.get(key) is None and value is not None:
+            entities[key] = value
+            filled.append(key)
+    return filled
+
+class IntentRuleEngine:
+    """规则意图识别器，同时统计命中率和节省的LLM耗时"""
+    def __init__(self, threshold: float = INTENT_RULES_THRESHOLD, enabled: bool = INTENT_RULES_ENABLED):
+        self.threshold = threshold
+        self.enabled = enabled
+        self._trie = KeywordTrie()
+        for intent, keywords in INTENT_KEYWORDS.items():
+            for keyword in keywords:
+                self._trie.add(keyword, intent)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "rule_hits": 0, "llm_calls": 0, "rule_seconds": 0.0, "llm_seconds": 0.0}
+
+    def analyze(self, text: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        规则分析，返回与LLM分析结果格式相同的字典（intent/entities/confidence/response）
+
+        Args:
+            context: 会话中已解析的实体，文本中没有出现时补入（补入的实体名见结果的context_entities）
+        """
+        keyword_spans = self._trie.find_all(text)
+        intents = {intent for _, _, intent in keyword_spans}
+
+        # 把意图关键词替换为空格，避免被当作姓名的一部分
+        masked = list(text)
+        for start, end, _ in keyword_spans:
+            masked[start:end] = " " * (end - start)
+        masked = "".join(masked)
+
+        entities: Dict[str, Any] = {}
+        weak_name = False
+        for pattern, strong in PASSENGER_NAME_RES:
+            name = next((match.group(1).strip() for match in pattern.finditer(masked)
+                         if _plausible_name(match.group(1).strip())), None)
+            if name:
+                entities["passenger_name"] = name
+                weak_name = not strong and not _has_surname(name)
+                break
+        flight_match = FLIGHT_NUMBER_RE.search(text)
+        if flight_match:
+            entities["flight_number"] = flight_match.group(1)
+        booking_match = BOOKING_ID_RE.search(text)
+        if booking_match:
+            entities["booking_id"] = int(booking_match.group(1))
+        departure_date = _extract_date(text)
+        if departure_date:
+            entities["departure_date"] = departure_date
+        airports = [code for code in AIRPORT_RE.findall(text) if not flight_match or code not in flight_match.group(1)]
+        if len(airports) >= 2:
+            entities["departure_airport"], entities["arrival_airport"] = airports[0], airports[1]
+        filled = merge_context(entities, context)
+
+        if len(intents) != 1:
+            # 没有关键词或多个意图冲突
+            intent, confidence = "general_question", 0.4 if intents else 0.0
+        else:
+            intent = intents.pop()
+            if intent == "search_booking":
+                has_target = ("passenger_name" in entities and not weak_name) or "booking_id" in entities
+            elif intent == "create_booking":
+                has_target = "flight_number" in entities
+            else:
+                has_target = "booking_id" in entities
+            confidence = 0.95 if has_target else 0.6
+
+        return {
+            "intent": intent,
+            "entities": entities,
+            "confidence": confidence,
+            "response": _reply_for(intent, entities) if confidence >= self.threshold else "",
+            "source": "rules",
+            "context_entities": filled
+        }
+
+    def match(self, text: str, context: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """置信度达到阈值时返回分析结果，否则返回None（应交给LLM）"""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        analysis = self.analyze(text, context)
+        elapsed = time.perf_counter() - start
+        hit = analysis["confidence"] >= self.threshold
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["rule_seconds"] += elapsed
+            if hit:
+                self._stats["rule_hits"] += 1
+        return analysis if hit else None
+
+    def record_llm_call(self, seconds: float) -> None:
+        """记录一次回退到LLM的分析耗时，用于估算规则命中节省的时间"""
+        with self._lock:
+            self._stats["llm_calls"] += 1
+            self._stats["llm_seconds"] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        calls, hits, llm_calls = stats["calls"], stats["rule_hits"], stats["llm_calls"]
+        avg_llm_ms = stats["llm_seconds"] / llm_calls * 1000 if llm_calls else 0.0
+        avg_rule_ms = stats["rule_seconds"] / calls * 1000 if calls else 0.0
+        return {
+            "calls": calls,
+            "rule_hits": hits,
+            "llm_calls": llm_calls,
+            "hit_rate": hits / calls if calls else 0.0,
+            "avg_rule_ms": avg_rule_ms,
+            "avg_llm_ms": avg_llm_ms,
+            # 按回退到LLM的平均耗时估算
+            "saved_ms": hits * max(avg_llm_ms - avg_rule_ms, 0.0)
+        }
+
+# 创建全局规则识别器实例
+intent_rules = IntentRuleEngine()
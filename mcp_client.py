@@ -0,0 +1,247 @@
+"""
+MCP服务器异步HTTP客户端
+Agent通过带连接池的 httpx.AsyncClient 访问MCP服务器，多个请求可以用 asyncio.gather 并发发出；
+同步Agent通过后台事件循环线程复用同一个连接池。
+列表接口通过分页迭代器逐页读取，可在处理当前页时预取下一页。
+Agent与MCP服务器在同一进程中运行时，可以改为进程内调用（MCP_TRANSPORT=asgi/direct）
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+import httpx
+
+# 单个客户端的并发连接数上限（MCP服务器在线程池中查询数据库，超出其连接池容量的请求在服务器端排队）
+MCP_CLIENT_MAX_CONNECTIONS = int(os.getenv("MCP_CLIENT_MAX_CONNECTIONS", 10))
+MCP_CLIENT_MAX_KEEPALIVE = int(os.getenv("MCP_CLIENT_MAX_KEEPALIVE", 10))
+MCP_CLIENT_TIMEOUT = float(os.getenv("MCP_CLIENT_TIMEOUT", 10))
+MCP_CLIENT_CONNECT_TIMEOUT = float(os.getenv("MCP_CLIENT_CONNECT_TIMEOUT", 3))
+# 分页迭代器每页条数（服务器单页上限为1000）
+MCP_CLIENT_PAGE_SIZE = int(os.getenv("MCP_CLIENT_PAGE_SIZE", 100))
+# 访问MCP服务器的方式：http 经TCP访问mcp_server_url；asgi 在进程内调用 mcp_server.app（仍有HTTP协议处理和JSON编解码）；
+# direct 在进程内直接调用接口函数（无HTTP和JSON）
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "http")
+MCP_TRANSPORTS = ("http", "asgi", "direct")
+
+_in_process_lock = threading.Lock()
+_in_process = {}
+
+def _in_process_server() -> dict:
+    """导入同进程的MCP服务器应用（首次调用时补齐数据表；应用的生命周期后台任务不会启动）"""
+    with _in_process_lock:
+        if not _in_process:
+            from database import create_tables
+            from mcp_server import app
+            from mcp_direct import DirectDispatcher
+            create_tables()
+            _in_process.update(app=app, dispatcher=DirectDispatcher(app))
+        return _in_process
+
+class MCPRequestError(Exception):
+    """
+    MCP服务器请求失败
+
+    status_code为None表示没有收到响应（连接失败或超时）；sent为False表示请求没有发出，
+    非幂等的请求（如创建预订）只有在这种情况下重试才不会重复执行
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 sent: bool = True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.sent = sent
+
+    @property
+    def retryable(self) -> bool:
+        """网络错误、超时、429和5xx是暂时性错误，可以重试"""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
+
+def _error_detail(response: httpx.Response) -> str:
+    """FastAPI错误响应中的detail，没有时使用状态描述"""
+    try:
+        detail = response.json().get("detail")
+    except (ValueError, AttributeError):
+        detail = None
+    return str(detail) if detail else response.reason_phrase
+
+class AsyncMCPClient:
+    """
+    带连接池的MCP服务器异步客户端，是异步Agent的基类
+
+    请求失败时默认打印错误并返回None；raise_errors=True时抛出MCPRequestError，由调用方决定是否重试
+    """
+    def __init__(self, mcp_server_url: str = "http://localhost:8000",
+                 max_connections: int = MCP_CLIENT_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = MCP_CLIENT_MAX_KEEPALIVE,
+                 timeout: float = MCP_CLIENT_TIMEOUT,
+                 connect_timeout: float = MCP_CLIENT_CONNECT_TIMEOUT,
+                 transport: str = MCP_TRANSPORT, raise_errors: bool = False):
+        if transport not in MCP_TRANSPORTS:
+            raise ValueError(f"未知的MCP访问方式: {transport}，可选 {', '.join(MCP_TRANSPORTS)}")
+        self.mcp_server_url = mcp_server_url
+        self.transport = transport
+        self.raise_errors = raise_errors
+        self._dispatcher = _in_process_server()["dispatcher"] if transport == "direct" else None
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        # 客户端与事件循环绑定，在首次请求时于当前循环中创建
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self.transport == "asgi":
+                self._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_in_process_server()["app"]),
+                                                 base_url="http://mcp-server", timeout=self.timeout)
+            else:
+                self._client = httpx.AsyncClient(base_url=self.mcp_server_url, limits=self.limits, timeout=self.timeout)
+            self._loop = loop
+        return self._client
+
+    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Any]:
+        """发送HTTP请求到MCP服务器，失败时打印错误并返回None（raise_errors=True时抛出MCPRequestError）"""
+        try:
+            return await self.request(method, endpoint, **kwargs)
+        except MCPRequestError as e:
+            if self.raise_errors:
+                raise
+            print(f"❌ 请求失败: {e}")
+            return None
+
+    async def request(self, method: str, endpoint: str, **kwargs) -> Any:
+        """
+        发送请求到MCP服务器并返回响应数据
+
+        Raises:
+            MCPRequestError: 请求失败
+        """
+        if self._dispatcher is not None:
+            return await self._call_direct(method, endpoint, **kwargs)
+        try:
+            response = await self._get_client().request(method, endpoint, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            response = e.response
+            raise MCPRequestError(f"{response.status_code} {_error_detail(response)}", response.status_code,
+                                  _retry_after(response.headers.get("Retry-After"))) from e
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            raise MCPRequestError(str(e) or type(e).__name__, sent=False) from e
+        except httpx.HTTPError as e:
+            raise MCPRequestError(str(e) or type(e).__name__) from e
+
+    async def _call_direct(self, method: str, endpoint: str, **kwargs) -> Any:
+        from fastapi import HTTPException
+        try:
+            return await self._dispatcher.request(method, endpoint, params=kwargs.get("params"), json=kwargs.get("json"))
+        except HTTPException as e:
+            raise MCPRequestError(f"{e.status_code} {e.detail}", e.status_code,
+                                  _retry_after((e.headers or {}).get("Retry-After"))) from e
+        except Exception as e:
+            raise MCPRequestError(str(e), 500) from e
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+class _BackgroundLoop:
+    """在守护线程中运行的事件循环，供同步代码提交协程"""
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="mcp-client-loop", daemon=True).start()
+            return self._loop
+
+    def run(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+_background_loop = _BackgroundLoop()
+
+def run_sync(coro) -> Any:
+    """在后台事件循环中执行协程并等待结果（同步Agent方法的实现方式，调用方可以在任意线程中）"""
+    return _background_loop.run(coro)
+
+def _checked_page(page: Optional[List[Any]], skip: int) -> List[Any]:
+    if page is None:
+        raise MCPRequestError(f"读取分页失败（skip={skip}），列表不完整")
+    return page
+
+def iter_pages(fetch_page: Callable[[int, int], Optional[List[Any]]], page_size: int = MCP_CLIENT_PAGE_SIZE,
+               prefetch: bool = True) -> Iterator[Any]:
+    """
+    逐页读取列表接口并逐条产出，内存中最多保留当前页和预取的下一页
+
+    只有返回空页或不满一页时才算读完；某一页请求失败时抛出异常，调用方不会把读到一半的列表当作完整列表
+
+    Args:
+        fetch_page: fetch_page(skip, limit) 返回一页数据，请求失败时返回None
+        prefetch: 产出当前页时在后台线程中请求下一页
+
+    Raises:
+        MCPRequestError: 某一页请求失败，已产出的条目不是完整列表
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mcp-prefetch") if prefetch else None
+    skip = 0
+    try:
+        page = _checked_page(fetch_page(skip, page_size), skip)
+        while page:
+            skip += len(page)
+            more = len(page) >= page_size
+            next_page = executor.submit(fetch_page, skip, page_size) if more and executor else None
+            yield from page
+            if not more:
+                return
+            page = _checked_page(next_page.result() if next_page else fetch_page(skip, page_size), skip)
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+async def aiter_pages(fetch_page: Callable[[int, int], Awaitable[Optional[List[Any]]]],
+                      page_size: int = MCP_CLIENT_PAGE_SIZE, prefetch: bool = True) -> AsyncIterator[Any]:
+    """iter_pages的异步版本：预取的下一页作为任务与当前页的处理并发执行"""
+    skip = 0
+    next_page = None
+    try:
+        page = _checked_page(await fetch_page(skip, page_size), skip)
+        while page:
+            skip += len(page)
+            more = len(page) >= page_size
+            if more and prefetch:
+                next_page = asyncio.ensure_future(fetch_page(skip, page_size))
+            for item in page:
+                yield item
+            if not more:
+                return
+            if next_page is not None:
+                page, next_page = await next_page, None
+            else:
+                page = await fetch_page(skip, page_size)
+            page = _checked_page(page, skip)
+    finally:
+        if next_page is not None:
+            next_page.cancel()
@@ -0,0 +1,107 @@
+"""
+MCP服务器的进程内直接调用
+Agent与MCP服务器运行在同一进程时（演示、测试、单机部署），按路径匹配到接口函数后直接调用：
+跳过TCP、HTTP解析和JSON编解码，数据库会话等依赖由本模块按接口声明创建，
+返回值按接口的response_model转换为与HTTP响应相同的Python数据（dict/list/str/数字）
+"""
+
+import asyncio
+import inspect
+from typing import Annotated, Dict, Any, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Depends as DependsParam
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic.fields import FieldInfo
+from pydantic_core import PydanticUndefined
+from starlette.routing import Match
+
+class DirectDispatcher:
+    """把 (method, endpoint, params, json) 形式的请求分发到FastAPI应用的接口函数"""
+    def __init__(self, app: FastAPI):
+        self.routes = [route for route in app.routes if isinstance(route, APIRoute)]
+        self._adapters: Dict[Any, TypeAdapter] = {}
+
+    def _adapter(self, annotation) -> TypeAdapter:
+        adapter = self._adapters.get(annotation)
+        if adapter is None:
+            adapter = self._adapters[annotation] = TypeAdapter(annotation)
+        return adapter
+
+    def _param_adapter(self, route: APIRoute, name: str) -> TypeAdapter:
+        """
+        路径/查询参数的校验器：类型加上Query()/Path()中声明的约束（ge/le/pattern等），
+        与HTTP调用时FastAPI的校验一致
+        """
+        key = (route.unique_id, name)
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            field = next(f for f in route.dependant.path_params + route.dependant.query_params if f.name == name)
+            adapter = self._adapters[key] = TypeAdapter(Annotated[field.field_info.annotation, field.field_info])
+        return adapter
+
+    def _match(self, method: str, path: str) -> Tuple[APIRoute, Dict[str, str]]:
+        scope = {"type": "http", "method": method.upper(), "path": path}
+        method_mismatch = False
+        for route in self.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return route, child_scope["path_params"]
+            method_mismatch = method_mismatch or match == Match.PARTIAL
+        raise HTTPException(status_code=405 if method_mismatch else 404,
+                            detail="Method Not Allowed" if method_mismatch else "Not Found")
+
+    async def request(self, method: str, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                      json: Any = None) -> Any:
+        """
+        调用接口函数
+
+        Raises:
+            HTTPException: 与HTTP调用时返回的错误状态码相同
+        """
+        route, path_params = self._match(method, endpoint.split("?", 1)[0])
+        params = params or {}
+        kwargs: Dict[str, Any] = {}
+        dependencies = []
+        try:
+            try:
+                for name, parameter in inspect.signature(route.endpoint).parameters.items():
+                    default = parameter.default
+                    if isinstance(default, DependsParam):
+                        # 生成器依赖（如get_db）：取出值，调用结束后关闭
+                        generator = default.dependency()
+                        dependencies.append(generator)
+                        if inspect.isasyncgen(generator):
+                            kwargs[name] = await generator.__anext__()
+                        else:
+                            kwargs[name] = next(generator)
+                    elif name in path_params:
+                        kwargs[name] = self._param_adapter(route, name).validate_python(path_params[name])
+                    elif inspect.isclass(parameter.annotation) and issubclass(parameter.annotation, BaseModel):
+                        kwargs[name] = parameter.annotation.model_validate(json)
+                    elif name in params:
+                        kwargs[name] = self._param_adapter(route, name).validate_python(params[name])
+                    elif isinstance(default, FieldInfo):
+                        if default.default is PydanticUndefined:
+                            raise HTTPException(status_code=422, detail=f"缺少参数: {name}")
+                        kwargs[name] = default.default
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+            if inspect.iscoroutinefunction(route.endpoint):
+                result = await route.endpoint(**kwargs)
+            else:
+                # 与FastAPI一致：普通def接口（同步查询数据库）在线程池中执行，不阻塞事件循环
+                result = await asyncio.to_thread(route.endpoint, **kwargs)
+            if route.response_model is not None:
+                adapter = self._adapter(route.response_model)
+                return adapter.dump_python(adapter.validate_python(result, from_attributes=True), mode="json")
+            return jsonable_encoder(result)
+        finally:
+            for generator in dependencies:
+                if inspect.isasyncgen(generator):
+                    await generator.aclose()
+                else:
+                    generator.close()
@@ -7,20 +7,60 @@ MCP HTTP服务器
 from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
-from datetime import datetime, date, time
+from typing import List, Literal, Optional
+from datetime import datetime, date, time, timedelta
 from decimal import Decimal
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 
-from database import get_db, Booking, Flight
+from database import get_db, get_archive_db, create_tables, Booking, Flight, ArchivedBooking, DeletedFlight
+from fare_calendar import parse_month, get_fare_calendar, invalidate_fares, booked_seats
+from group_commit import BOOKING_GROUP_COMMIT, GroupCommitter, stage_bookings
+from outbox import OutboxRelay, OutboxSequencer, create_sink, record_booking_event, read_events
+from booking_archive import (
+    ARCHIVE_AFTER_DAYS, archive_bookings, run_archive_job, get_archived_booking,
+    get_bookings_page
+)
+from route_recommendations import (
+    RECOMMENDATION_REFRESH_INTERVAL, UnknownRouteError, bump_route_version, route_recommendations
+)
 from sqlalchemy.orm import Session
 
+# 组提交调度器（BOOKING_GROUP_COMMIT=1 时在启动时创建）
+group_committer: Optional[GroupCommitter] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服务生命周期：启动时补齐新增的表和发件箱排序器，并按配置启动组提交、后台归档、发件箱中继和推荐预热任务"""
+    global group_committer
+    create_tables()
+    if BOOKING_GROUP_COMMIT:
+        group_committer = GroupCommitter()
+    tasks = [asyncio.create_task(OutboxSequencer().run())]
+    if ARCHIVE_AFTER_DAYS > 0:
+        tasks.append(asyncio.create_task(run_archive_job()))
+    sink = create_sink()
+    if sink:
+        tasks.append(asyncio.create_task(OutboxRelay(sink).run()))
+    if RECOMMENDATION_REFRESH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(route_recommendations.run_refresher()))
+    yield
+    for task in tasks:
+        task.cancel()
+    if sink:
+        sink.close()
+    if group_committer:
+        await group_committer.close()
+        group_committer = None
+
 # 创建FastAPI实例
 app = FastAPI(
     title="智能机票预订系统 MCP Server",
     description="基于MCP协议的多Agent智能机票预订服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 添加CORS中间件
@@ -108,6 +148,26 @@ class FlightResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+class AutoBookingRequest(BaseModel):
+    passenger_name: str
+    departure_airport: str
+    arrival_airport: str
+    departure_date: date
+    policy: Literal["cheapest", "earliest", "most_seats"] = "cheapest"
+    title: Optional[str] = None
+    seat_number: Optional[str] = None
+
+class AutoBookingResponse(BaseModel):
+    booking: BookingResponse
+    flight: FlightResponse
+
+# 搜索并预订的航班选择策略：按 (航班, 当天余票) 计算排序键，取最小值
+AUTO_BOOKING_POLICIES = {
+    "cheapest": lambda flight, seats: (flight.price, flight.departure_time),
+    "earliest": lambda flight, seats: (flight.departure_time, flight.price),
+    "most_seats": lambda flight, seats: (-seats, flight.price),
+}
+
 # 健康检查端点
 @app.get("/health")
 async def health_check():
@@ -119,13 +179,22 @@ async def health_check():
     }
 
 # 预订管理API端点
+# 访问数据库的接口用普通def定义，由FastAPI在线程池中执行：数据库连接池耗尽时只有工作线程等待，
+# 事件循环仍能关闭已完成请求的会话、归还连接；在事件循环中直接查询数据库时，并发请求超过连接池容量会互相锁死
 
 @app.post("/bookings", response_model=BookingResponse)
 async def create_booking(booking: BookingCreate, db: Session = Depends(get_db)):
     """创建新预订"""
+    if group_committer:
+        try:
+            return await group_committer.submit(booking.model_dump())
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"创建预订失败: {str(e)}")
+    return await asyncio.to_thread(_create_booking, db, booking)
+
+def _create_booking(db: Session, booking: BookingCreate) -> Booking:
     try:
-        db_booking = Booking(**booking.model_dump())
-        db.add(db_booking)
+        db_booking, = stage_bookings(db, [booking.model_dump()])
         db.commit()
         db.refresh(db_booking)
         return db_booking
@@ -133,34 +202,128 @@ async def create_booking(booking: BookingCreate, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=400, detail=f"创建预订失败: {str(e)}")
 
+@app.post("/bookings/auto", response_model=AutoBookingResponse)
+def auto_book(request: AutoBookingRequest, db: Session = Depends(get_db)):
+    """
+    搜索并预订：按选择策略选定航线上当天仍有余票的航班，在同一事务中确认余票并创建预订（不经过组提交）
+
+    与其他预订接口一样不修改航班的 available_seats（每天的座位数），当天余票按预订数计算；
+    返回的航班中 available_seats 为预订后当天的余票
+    """
+    departure, arrival = request.departure_airport.upper(), request.arrival_airport.upper()
+    day = request.departure_date
+    flights = db.query(Flight).filter(
+        Flight.departure_airport == departure,
+        Flight.arrival_airport == arrival,
+        Flight.status == "active"
+    ).all()
+    if not flights:
+        raise HTTPException(status_code=404, detail=f"没有从 {departure} 到 {arrival} 的可预订航班")
+    booked = booked_seats(db, [f.flight_number for f in flights], day, day)
+    remaining = {f.id: (f.available_seats or 0) - booked.get((f.flight_number, day), 0) for f in flights}
+    policy = AUTO_BOOKING_POLICIES[request.policy]
+    candidates = sorted((f for f in flights if remaining[f.id] > 0), key=lambda f: (policy(f, remaining[f.id]), f.id))
+    
+    try:
+        for flight in candidates:
+            # 先对航班行做一次空更新加写锁（SQLite和PostgreSQL都会阻塞其他写事务），再重新统计当天占座：
+            # 并发请求争抢最后一个座位时只有一个能成功，失败的继续尝试下一个候选航班
+            db.query(Flight).filter(Flight.id == flight.id).update(
+                {Flight.available_seats: Flight.available_seats, Flight.updated_at: Flight.updated_at},
+                synchronize_session=False
+            )
+            taken = booked_seats(db, [flight.flight_number], day, day).get((flight.flight_number, day), 0)
+            seats_left = (flight.available_seats or 0) - taken
+            if seats_left > 0:
+                break
+        else:
+            raise HTTPException(status_code=409, detail=f"从 {departure} 到 {arrival} 的航班 {day} 已售罄")
+        
+        # 到达时间早于出发时间的航班次日到达
+        arrival_date = day + timedelta(days=1) if flight.arrival_time < flight.departure_time else day
+        db_booking, = stage_bookings(db, [{
+            "title": request.title or f"{request.passenger_name}的航班预订",
+            "passenger_name": request.passenger_name,
+            "flight_number": flight.flight_number,
+            "departure_date": day,
+            "departure_time": flight.departure_time,
+            "arrival_date": arrival_date,
+            "arrival_time": flight.arrival_time,
+            "departure_airport": flight.departure_airport,
+            "arrival_airport": flight.arrival_airport,
+            "seat_number": request.seat_number,
+            "price": flight.price
+        }])
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"自动预订失败: {str(e)}")
+    db.refresh(db_booking)
+    flight_data = FlightResponse.model_validate(flight).model_dump()
+    flight_data["available_seats"] = seats_left - 1
+    return {"booking": db_booking, "flight": flight_data}
+
 @app.get("/bookings", response_model=List[BookingResponse])
-async def get_bookings(
+def get_bookings(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    include_archived: bool = Query(False, description="是否包含已归档的历史预订"),
+    db: Session = Depends(get_db),
+    archive_db: Session = Depends(get_archive_db)
 ):
     """获取所有预订"""
-    bookings = db.query(Booking).offset(skip).limit(limit).all()
+    if include_archived:
+        return get_bookings_page(db, archive_db, skip, limit)
+    # 按ID排序保证分页结果稳定
+    bookings = db.query(Booking).order_by(Booking.id).offset(skip).limit(limit).all()
     return bookings
 
+@app.post("/bookings/archive")
+async def archive_old_bookings(older_than_days: int = Query(..., ge=0, description="归档出发日期早于N天前的预订")):
+    """手动触发历史预订归档"""
+    try:
+        result = await asyncio.to_thread(archive_bookings, older_than_days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"归档预订失败: {str(e)}")
+    return {**result, "older_than_days": older_than_days}
+
 @app.get("/bookings/{booking_id}", response_model=BookingResponse)
-async def get_booking(booking_id: int, db: Session = Depends(get_db)):
+def get_booking(
+    booking_id: int,
+    include_archived: bool = Query(False, description="热表中不存在时是否查询归档"),
+    db: Session = Depends(get_db),
+    archive_db: Session = Depends(get_archive_db)
+):
     """根据ID获取预订"""
     booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    if not booking and include_archived:
+        booking = get_archived_booking(archive_db, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="预订不存在")
     return booking
 
 @app.get("/bookings/search/{passenger_name}", response_model=List[BookingResponse])
-async def search_bookings_by_passenger(passenger_name: str, db: Session = Depends(get_db)):
+def search_bookings_by_passenger(
+    passenger_name: str,
+    include_archived: bool = Query(False, description="是否包含已归档的历史预订"),
+    db: Session = Depends(get_db),
+    archive_db: Session = Depends(get_archive_db)
+):
     """根据乘客姓名搜索预订"""
     bookings = db.query(Booking).filter(
         Booking.passenger_name.ilike(f"%{passenger_name}%")
     ).all()
+    if include_archived:
+        bookings += archive_db.query(ArchivedBooking).filter(
+            ArchivedBooking.passenger_name.ilike(f"%{passenger_name}%")
+        ).all()
     return bookings
 
 @app.put("/bookings/{booking_id}", response_model=BookingResponse)
-async def update_booking(
+def update_booking(
     booking_id: int, 
     booking_update: BookingUpdate, 
     db: Session = Depends(get_db)
@@ -171,11 +334,15 @@ async def update_booking(
         raise HTTPException(status_code=404, detail="预订不存在")
     
     try:
+        # 改签/取消会同时影响原日期和新日期的票价日历
+        invalidate_fares(db, booking.departure_airport, booking.arrival_airport, booking.departure_date)
         update_data = booking_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(booking, field, value)
+        invalidate_fares(db, booking.departure_airport, booking.arrival_airport, booking.departure_date)
         
         booking.updated_at = datetime.utcnow()
+        record_booking_event(db, "booking.updated", booking)
         db.commit()
         db.refresh(booking)
         return booking
@@ -184,13 +351,15 @@ async def update_booking(
         raise HTTPException(status_code=400, detail=f"更新预订失败: {str(e)}")
 
 @app.delete("/bookings/{booking_id}")
-async def delete_booking(booking_id: int, db: Session = Depends(get_db)):
+def delete_booking(booking_id: int, db: Session = Depends(get_db)):
     """删除预订"""
     booking = db.query(Booking).filter(Booking.id == booking_id).first()
     if not booking:
         raise HTTPException(status_code=404, detail="预订不存在")
     
     try:
+        invalidate_fares(db, booking.departure_airport, booking.arrival_airport, booking.departure_date)
+        record_booking_event(db, "booking.deleted", booking)
         db.delete(booking)
         db.commit()
         return {"message": f"预订 {booking_id} 已成功删除"}
@@ -201,11 +370,13 @@ async def delete_booking(booking_id: int, db: Session = Depends(get_db)):
 # 航班管理API端点
 
 @app.post("/flights", response_model=FlightResponse)
-async def create_flight(flight: FlightCreate, db: Session = Depends(get_db)):
+def create_flight(flight: FlightCreate, db: Session = Depends(get_db)):
     """创建新航班"""
     try:
         db_flight = Flight(**flight.model_dump())
         db.add(db_flight)
+        invalidate_fares(db, db_flight.departure_airport, db_flight.arrival_airport)
+        bump_route_version(db, db_flight.departure_airport, db_flight.arrival_airport)
         db.commit()
         db.refresh(db_flight)
         return db_flight
@@ -214,17 +385,35 @@ async def create_flight(flight: FlightCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=f"创建航班失败: {str(e)}")
 
 @app.get("/flights", response_model=List[FlightResponse])
-async def get_flights(
+def get_flights(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db)
 ):
     """获取所有航班"""
-    flights = db.query(Flight).filter(Flight.status == "active").offset(skip).limit(limit).all()
+    flights = db.query(Flight).filter(Flight.status == "active").order_by(Flight.id).offset(skip).limit(limit).all()
     return flights
 
+@app.get("/flights/changes")
+def get_flight_changes(
+    updated_since: Optional[datetime] = Query(None, description="只返回此时间(UTC)之后新增、修改或删除的航班，不传则返回完整目录"),
+    db: Session = Depends(get_db)
+):
+    """航班目录增量查询：返回变更的航班（含非active状态）和已删除的航班，server_time作为下次查询的updated_since"""
+    server_time = datetime.utcnow()
+    query = db.query(Flight)
+    deleted = []
+    if updated_since is not None:
+        query = query.filter(Flight.updated_at >= updated_since)
+        deleted = db.query(DeletedFlight).filter(DeletedFlight.deleted_at >= updated_since).all()
+    return {
+        "flights": [FlightResponse.model_validate(f) for f in query.order_by(Flight.id).all()],
+        "deleted": [{"id": d.flight_id, "flight_number": d.flight_number} for d in deleted],
+        "server_time": server_time.isoformat()
+    }
+
 @app.get("/flights/{flight_id}", response_model=FlightResponse)
-async def get_flight(flight_id: int, db: Session = Depends(get_db)):
+def get_flight(flight_id: int, db: Session = Depends(get_db)):
     """根据ID获取航班"""
     flight = db.query(Flight).filter(Flight.id == flight_id).first()
     if not flight:
@@ -232,7 +421,7 @@ async def get_flight(flight_id: int, db: Session = Depends(get_db)):
     return flight
 
 @app.get("/flights/search/{departure}/{arrival}", response_model=List[FlightResponse])
-async def search_flights(departure: str, arrival: str, db: Session = Depends(get_db)):
+def search_flights(departure: str, arrival: str, db: Session = Depends(get_db)):
     """搜索航班"""
     flights = db.query(Flight).filter(
         Flight.departure_airport.ilike(f"%{departure}%"),
@@ -242,7 +431,7 @@ async def search_flights(departure: str, arrival: str, db: Session = Depends(get
     return flights
 
 @app.get("/flights/number/{flight_number}", response_model=FlightResponse)
-async def get_flight_by_number(flight_number: str, db: Session = Depends(get_db)):
+def get_flight_by_number(flight_number: str, db: Session = Depends(get_db)):
     """根据航班号获取航班"""
     flight = db.query(Flight).filter(Flight.flight_number == flight_number).first()
     if not flight:
@@ -250,13 +439,16 @@ async def get_flight_by_number(flight_number: str, db: Session = Depends(get_db)
     return flight
 
 @app.delete("/flights/{flight_id}")
-async def delete_flight(flight_id: int, db: Session = Depends(get_db)):
+def delete_flight(flight_id: int, db: Session = Depends(get_db)):
     """删除航班"""
     flight = db.query(Flight).filter(Flight.id == flight_id).first()
     if not flight:
         raise HTTPException(status_code=404, detail="航班不存在")
     
     try:
+        invalidate_fares(db, flight.departure_airport, flight.arrival_airport)
+        bump_route_version(db, flight.departure_airport, flight.arrival_airport)
+        db.add(DeletedFlight(flight_id=flight.id, flight_number=flight.flight_number))
         db.delete(flight)
         db.commit()
         return {"message": f"航班 {flight_id} 已成功删除"}
@@ -264,20 +456,77 @@ async def delete_flight(flight_id: int, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=400, detail=f"删除航班失败: {str(e)}")
 
+# 航线推荐端点
+@app.get("/recommendations/{departure}/{arrival}")
+async def get_route_recommendation(
+    departure: str,
+    arrival: str,
+    wait: bool = Query(False, description="推荐已过期时是否等待重新生成")
+):
+    """获取航线的预计算AI推荐"""
+    try:
+        return await route_recommendations.get(departure, arrival, wait=wait)
+    except UnknownRouteError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取航线推荐失败: {str(e)}")
+
+# 票价日历端点
+@app.get("/fares/{departure}/{arrival}")
+def get_fares(
+    departure: str,
+    arrival: str,
+    month: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="月份，格式YYYY-MM"),
+    db: Session = Depends(get_db)
+):
+    """获取航线整月每天的最低票价"""
+    try:
+        first_day, last_day = parse_month(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的月份: {month}")
+    
+    return {
+        "departure_airport": departure.upper(),
+        "arrival_airport": arrival.upper(),
+        "month": month,
+        "days": get_fare_calendar(db, departure, arrival, first_day, last_day)
+    }
+
+# 事件日志端点
+@app.get("/events")
+def get_events(
+    after: int = Query(0, ge=0, description="从该偏移量之后开始读取"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """按偏移量读取预订变更事件日志"""
+    events = read_events(db, after, limit)
+    return {
+        "events": events,
+        "next_offset": events[-1]["offset"] if events else after
+    }
+
 # 统计信息端点
 @app.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
+def get_stats(
+    include_archived: bool = Query(False, description="是否统计已归档的历史预订"),
+    db: Session = Depends(get_db),
+    archive_db: Session = Depends(get_archive_db)
+):
     """获取系统统计信息"""
     total_bookings = db.query(Booking).count()
     total_flights = db.query(Flight).filter(Flight.status == "active").count()
     confirmed_bookings = db.query(Booking).filter(Booking.status == "confirmed").count()
     
-    return {
+    stats = {
         "total_bookings": total_bookings,
         "total_flights": total_flights,
         "confirmed_bookings": confirmed_bookings,
         "timestamp": datetime.utcnow().isoformat()
     }
+    if include_archived:
+        stats["archived_bookings"] = archive_db.query(ArchivedBooking).count()
+    return stats
 
 if __name__ == "__main__":
     # 获取配置
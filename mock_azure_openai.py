@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+本地模拟Azure OpenAI服务
+实现chat completions的请求/响应格式（含SSE流式和429限流），可配置延迟分布、错误率和脚本化回复，
+用于在不消耗真实token的情况下对 Agent → LLM → MCP 全链路做压测和延迟测试
+
+启动后把 AZURE_OPENAI_ENDPOINT 指向:
+    http://localhost:8100/openai/deployments/mock/chat/completions
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Dict, Any, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from agent_service import AdmittedStreamingResponse
+from intent_rules import IntentRuleEngine
+from recommendation_prompt import estimate_tokens
+
+FLIGHT_LINE_RE = re.compile(r"航班 (\S+) \(([^)]*)\).*?¥([\d.]+)")
+
+class MockConfig:
+    """模拟服务配置，默认值来自环境变量"""
+    def __init__(self, **overrides):
+        # 延迟分布: fixed / uniform / normal / lognormal
+        self.latency_distribution = os.getenv("MOCK_LATENCY_DISTRIBUTION", "fixed")
+        self.latency_ms = float(os.getenv("MOCK_LATENCY_MS", 300))
+        self.latency_jitter_ms = float(os.getenv("MOCK_LATENCY_JITTER_MS", 100))
+        # 流式响应每个数据块之间的间隔
+        self.token_delay_ms = float(os.getenv("MOCK_TOKEN_DELAY_MS", 20))
+        # 随机500错误和随机429的比例
+        self.error_rate = float(os.getenv("MOCK_ERROR_RATE", 0))
+        self.rate_limit_rate = float(os.getenv("MOCK_RATE_LIMIT_RATE", 0))
+        # 同时处理的请求上限，超出时返回429（0表示不限制）
+        self.max_concurrent = int(os.getenv("MOCK_MAX_CONCURRENT", 0))
+        self.retry_after_ms = int(os.getenv("MOCK_RETRY_AFTER_MS", 200))
+        # 脚本化回复文件：[{"match": "子串", "reply": "文本或JSON对象"}]
+        self.script_path = os.getenv("MOCK_SCRIPT_PATH", "")
+        self.seed = os.getenv("MOCK_SEED")
+        for name, value in overrides.items():
+            if not hasattr(self, name):
+                raise ValueError(f"未知配置项: {name}")
+            setattr(self, name, value)
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """按配置的分布采样一次响应延迟（秒）"""
+        mean, jitter = self.latency_ms, self.latency_jitter_ms
+        if self.latency_distribution == "uniform":
+            value = rng.uniform(mean - jitter, mean + jitter)
+        elif self.latency_distribution == "normal":
+            value = rng.gauss(mean, jitter)
+        elif self.latency_distribution == "lognormal":
+            # latency_ms为中位数，长尾程度由 jitter/mean 决定
+            value = rng.lognormvariate(math.log(max(mean, 1)), jitter / max(mean, 1))
+        else:
+            value = mean
+        return max(value, 0) / 1000
+
+def _load_script(path: str) -> List[Dict[str, Any]]:
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _analysis_reply(rules: IntentRuleEngine, text: str) -> Dict[str, Any]:
+    """用本地规则模拟LLM的意图分析结果"""
+    analysis = rules.analyze(text)
+    analysis.pop("source", None)
+    analysis.pop("context_entities", None)
+    if not analysis["response"]:
+        analysis["response"] = "我理解您的需求，请告诉我更多详细信息。"
+    return analysis
+
+def _reply_for(messages: List[Dict[str, Any]], script: List[Dict[str, Any]], rules: IntentRuleEngine) -> tuple:
+    """
+    根据请求内容生成回复
+
+    Returns:
+        (请求类型, 回复文本)
+    """
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = messages[-1].get("content", "") if messages else ""
+
+    for entry in script:
+        if entry.get("match", "") in user:
+            reply = entry["reply"]
+            return "scripted", reply if isinstance(reply, str) else json.dumps(reply, ensure_ascii=False)
+
+    if "识别意图和实体" in system:
+        try:
+            items = json.loads(user)
+        except json.JSONDecodeError:
+            items = None
+        if isinstance(items, list):
+            results = [dict(_analysis_reply(rules, item["text"]), id=item["id"]) for item in items]
+            return "batch_analyze", json.dumps({"results": results}, ensure_ascii=False)
+        return "analyze", json.dumps(_analysis_reply(rules, user), ensure_ascii=False)
+
+    if "航班推荐助手" in system:
+        match = FLIGHT_LINE_RE.search(system)
+        if match:
+            flight_number, airline, price = match.groups()
+            return "recommendation", f"推荐选择 {flight_number}（{airline}），票价 ¥{price}，综合价格、时间和余票最为均衡。"
+        return "recommendation", "暂无可推荐的航班。"
+
+    return "chat", f"（模拟回复）已收到您的问题：{user[:50]}"
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig()
+    rng = random.Random(config.seed)
+    script = _load_script(config.script_path)
+    rules = IntentRuleEngine(enabled=True)
+    state = {"in_flight": 0}
+    stats = {"requests": 0, "rate_limited": 0, "errors": 0, "streams": 0, "by_type": {}}
+
+    app = FastAPI(title="Mock Azure OpenAI", description="本地模拟Azure OpenAI chat completions")
+
+    def rate_limited() -> JSONResponse:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after-ms": str(config.retry_after_ms),
+                     "retry-after": str(max(1, config.retry_after_ms // 1000))},
+            content={"error": {"code": "429", "message": "Requests to the ChatCompletions Operation have exceeded the rate limit."}}
+        )
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if config.max_concurrent and state["in_flight"] >= config.max_concurrent:
+            return rate_limited()
+        if rng.random() < config.rate_limit_rate:
+            return rate_limited()
+
+        state["in_flight"] += 1
+        streaming = False
+        try:
+            messages = body.get("messages", [])
+            call_type, content = _reply_for(messages, script, rules)
+            stats["by_type"][call_type] = stats["by_type"].get(call_type, 0) + 1
+            await asyncio.sleep(config.sample_latency(rng))
+
+            if rng.random() < config.error_rate:
+                stats["errors"] += 1
+                return JSONResponse(status_code=500, content={
+                    "error": {"code": "InternalServerError", "message": "The server had an error while processing your request."}
+                })
+
+            completion_id = f"chatcmpl-mock{stats['requests']}"
+            if body.get("stream"):
+                stats["streams"] += 1
+                streaming = True
+                # 并发名额在响应结束时归还（客户端在响应体开始前断开时生成器不会执行）
+                return AdmittedStreamingResponse(stream_events(completion_id, deployment, content), release=release,
+                                                 media_type="text/event-stream")
+
+            usage = {
+                "prompt_tokens": sum(estimate_tokens(str(m.get("content", ""))) for m in messages),
+                "completion_tokens": estimate_tokens(content)
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": deployment,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage
+            }
+        finally:
+            if not streaming:
+                release()
+
+    def release() -> None:
+        state["in_flight"] -= 1
+
+    async def stream_events(completion_id: str, deployment: str, content: str):
+        # 与Azure一致：首个数据块只有prompt_filter_results
+        yield f"data: {json.dumps({'id': '', 'choices': [], 'prompt_filter_results': []})}\n\n"
+        for i in range(0, len(content), 4):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": deployment,
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(config.token_delay_ms / 1000)
+        yield "data: [DONE]\n\n"
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        """模拟服务收到的请求统计"""
+        return dict(stats, in_flight=state["in_flight"])
+
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    host = os.getenv("MOCK_AZURE_OPENAI_HOST", "localhost")
+    port = int(os.getenv("MOCK_AZURE_OPENAI_PORT", 8100))
+
+    print(f"🧪 启动模拟Azure OpenAI服务...")
+    print(f"📍 端点: http://{host}:{port}/openai/deployments/mock/chat/completions")
+    print(f"📊 统计: http://{host}:{port}/mock/stats")
+
+    uvicorn.run(app, host=host, port=port, log_level="warning")
@@ -0,0 +1,234 @@
+"""
+事务性发件箱
+预订的增删改在同一事务中写入outbox_events表；后台中继批量投递到可插拔的事件接收端，
+消费方也可以按偏移量直接读取追加式事件日志
+
+偏移量是事件提交之后由后台排序器分配的日志序号（不是自增ID），保证：序号单调递增，
+消费方读到序号N之后，之后再出现的事件序号都大于N，按next_offset续读不会漏事件；
+读取事件日志是只读操作，事件在排序器下一次运行（OUTBOX_SEQUENCE_INTERVAL秒内）编号后可见
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Booking, OutboxEvent
+
+# 中继配置：OUTBOX_SINK 为空时不启动后台中继（事件日志仍可通过 /events 读取）
+OUTBOX_SINK = os.getenv("OUTBOX_SINK", "")
+OUTBOX_NDJSON_PATH = os.getenv("OUTBOX_NDJSON_PATH", "./booking_events.ndjson")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", 1.0))
+# 排序器轮询间隔（秒）
+OUTBOX_SEQUENCE_INTERVAL = float(os.getenv("OUTBOX_SEQUENCE_INTERVAL", 0.05))
+# PostgreSQL上多个进程分配序号时使用的事务级咨询锁键
+OUTBOX_SEQUENCE_LOCK_KEY = int(os.getenv("OUTBOX_SEQUENCE_LOCK_KEY", 730001))
+
+_sequence_lock = threading.Lock()
+
+def _json_default(value: Any) -> str:
+    """日期/时间用ISO格式，Decimal等其余类型转字符串"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def booking_snapshot(booking: Booking) -> Dict[str, Any]:
+    """预订的完整快照（所有列）"""
+    return {column.name: getattr(booking, column.name) for column in Booking.__table__.columns}
+
+def record_booking_event(db: Session, event_type: str, booking: Booking) -> OutboxEvent:
+    """
+    在当前事务中记录预订事件，由调用方负责commit
+
+    Args:
+        db: 业务写入所用的会话
+        event_type: 事件类型，如 booking.created / booking.updated / booking.deleted
+        booking: 已flush（已分配ID）的预订
+    """
+    event = OutboxEvent(
+        aggregate_type="booking",
+        aggregate_id=booking.id,
+        event_type=event_type,
+        payload=json.dumps(booking_snapshot(booking), ensure_ascii=False, default=_json_default),
+        created_at=datetime.utcnow()
+    )
+    db.add(event)
+    return event
+
+def event_to_dict(event: OutboxEvent) -> Dict[str, Any]:
+    return {
+        "offset": event.sequence,
+        "aggregate_type": event.aggregate_type,
+        "aggregate_id": event.aggregate_id,
+        "event_type": event.event_type,
+        "payload": json.loads(event.payload),
+        "created_at": event.created_at.isoformat()
+    }
+
+def assign_sequences(db: Session, limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    为已提交但还没有序号的事件分配日志序号，返回本次编号的事件数
+
+    自增ID在写入时分配，提交顺序可能与ID顺序不同（PostgreSQL上ID较小的事务可能晚提交），
+    以ID为偏移量时消费方会越过晚提交的事件。序号只分配给已经提交可见的事件，
+    同一时刻只有一个排序器工作（进程内锁，PostgreSQL上再加事务级咨询锁），所以按分配顺序单调递增。
+    """
+    with _sequence_lock:
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": OUTBOX_SEQUENCE_LOCK_KEY})
+            events = db.query(OutboxEvent).filter(
+                OutboxEvent.sequence.is_(None)
+            ).order_by(OutboxEvent.id).limit(limit).all()
+            if not events:
+                db.rollback()
+                return 0
+            last = db.query(func.max(OutboxEvent.sequence)).scalar() or 0
+            for sequence, event in enumerate(events, start=last + 1):
+                event.sequence = sequence
+            db.commit()
+            return len(events)
+        except IntegrityError:
+            # SQLite上另一个进程的排序器同时分配了相同序号，这批留给下一次
+            db.rollback()
+            return 0
+        except Exception:
+            db.rollback()
+            raise
+
+def read_events(db: Session, after: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+    """从偏移量after之后按序号顺序读取已编号的事件（只读，编号由OutboxSequencer完成）"""
+    events = db.query(OutboxEvent).filter(
+        OutboxEvent.sequence > after
+    ).order_by(OutboxEvent.sequence).limit(limit).all()
+    return [event_to_dict(event) for event in events]
+
+class OutboxSequencer:
+    """
+    后台排序器：为新提交的事件分配日志序号
+
+    序号只在这里分配，读取事件日志和中继投递都只读取已编号的事件，不在请求路径上加锁写库。
+    """
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, interval: float = OUTBOX_SEQUENCE_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sequenced = 0
+
+    def sequence_once(self) -> int:
+        """为一批事件编号，返回本批事件数"""
+        db = SessionLocal()
+        try:
+            sequenced = assign_sequences(db, self.batch_size)
+        finally:
+            db.close()
+        self.sequenced += sequenced
+        return sequenced
+
+    async def run(self) -> None:
+        """后台循环：有积压时连续编号，空闲时按间隔轮询"""
+        while True:
+            try:
+                sequenced = await asyncio.to_thread(self.sequence_once)
+            except Exception as e:
+                print(f"❌ 发件箱事件编号失败: {e}")
+                sequenced = 0
+            if sequenced < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+class EventSink:
+    """事件接收端基类"""
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class NDJSONFileSink(EventSink):
+    """追加写入NDJSON文件，每行一个事件"""
+    def __init__(self, path: str = OUTBOX_NDJSON_PATH):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+class QueueSink(EventSink):
+    """投递到本地队列，供同进程消费者使用"""
+    def __init__(self, maxsize: int = 0):
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=maxsize)
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            self.queue.put(event)
+
+def create_sink(name: str = OUTBOX_SINK) -> Optional[EventSink]:
+    """根据配置创建事件接收端"""
+    if not name:
+        return None
+    if name == "ndjson":
+        return NDJSONFileSink()
+    if name == "queue":
+        return QueueSink()
+    raise ValueError(f"未知的发件箱接收端: {name}")
+
+class OutboxRelay:
+    """
+    发件箱中继：批量读取已编号的未投递事件，投递成功后再标记为已投递
+
+    投递语义为至少一次（at-least-once），消费方应按offset去重。
+    """
+    def __init__(self, sink: EventSink, batch_size: int = OUTBOX_BATCH_SIZE, interval: float = OUTBOX_RELAY_INTERVAL):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.published = 0
+
+    def relay_once(self) -> int:
+        """投递一批事件，返回本批事件数"""
+        db = SessionLocal()
+        try:
+            events = db.query(OutboxEvent).filter(
+                OutboxEvent.published_at.is_(None),
+                OutboxEvent.sequence.isnot(None)
+            ).order_by(OutboxEvent.sequence).limit(self.batch_size).all()
+            if not events:
+                return 0
+            self.sink.publish([event_to_dict(event) for event in events])
+            db.query(OutboxEvent).filter(
+                OutboxEvent.id.in_([event.id for event in events])
+            ).update({OutboxEvent.published_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            self.published += len(events)
+            return len(events)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run(self) -> None:
+        """后台循环：有积压时连续投递，空闲时按间隔轮询"""
+        while True:
+            try:
+                relayed = await asyncio.to_thread(self.relay_once)
+            except Exception as e:
+                print(f"❌ 发件箱投递失败: {e}")
+                relayed = 0
+            if relayed < self.batch_size:
+                await asyncio.sleep(self.interval)
@@ -0,0 +1,139 @@
+"""
+LLM调用的客户端限流
+按Azure部署的每分钟请求数(RPM)和每分钟token数(TPM)配额做令牌桶限流。
+调用方按到达顺序预约配额并等待到预约时间（先到先得，不会互相抢占），
+令牌桶状态可以放在进程内，也可以放在加锁的共享文件中供同一主机上的多个Agent进程协调
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，只能使用进程内状态
+    fcntl = None
+
+AZURE_OPENAI_RPM = int(os.getenv("AZURE_OPENAI_RPM", 0))
+AZURE_OPENAI_TPM = int(os.getenv("AZURE_OPENAI_TPM", 0))
+# 桶容量（允许的突发量）按多少秒的配额计算；Azure按10秒左右的窗口判定RPM超限
+AZURE_OPENAI_RATE_LIMIT_BURST_SECONDS = float(os.getenv("AZURE_OPENAI_RATE_LIMIT_BURST_SECONDS", 10))
+# 设置后多个进程通过该文件共享令牌桶状态
+AZURE_OPENAI_RATE_LIMIT_FILE = os.getenv("AZURE_OPENAI_RATE_LIMIT_FILE", "")
+
+class LocalBucketState:
+    """进程内令牌桶状态"""
+    def __init__(self):
+        self._state: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def update(self, fn):
+        """在锁内读取状态、调用fn(state)修改并返回其结果"""
+        with self._lock:
+            return fn(self._state)
+
+class FileBucketState:
+    """保存在共享文件中的令牌桶状态，读改写期间持有文件锁"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def update(self, fn):
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else {}
+                except json.JSONDecodeError:
+                    state = {}
+                result = fn(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class RateLimiter:
+    """
+    请求数 + token数双令牌桶限流器
+
+    每个桶容量为burst_seconds秒的配额，按 配额/60 每秒匀速补充；预约时先扣减，
+    余额为负表示需要等待补充，等待时间即为预约的生效时间，因此调用方天然按到达顺序排队。
+    """
+    def __init__(self, requests_per_minute: int = AZURE_OPENAI_RPM, tokens_per_minute: int = AZURE_OPENAI_TPM,
+                 state_file: str = AZURE_OPENAI_RATE_LIMIT_FILE,
+                 burst_seconds: float = AZURE_OPENAI_RATE_LIMIT_BURST_SECONDS):
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.burst_seconds = burst_seconds
+        if state_file and fcntl is None:
+            print("⚠️  当前平台不支持文件锁，限流状态仅在进程内共享")
+            state_file = ""
+        self._state = FileBucketState(state_file) if state_file else LocalBucketState()
+        self._stats_lock = threading.Lock()
+        self._stats = {"reservations": 0, "delayed": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit > 0 for limit in self.limits.values())
+
+    def reserve(self, tokens: int, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        预约一次请求和tokens个token的配额
+
+        Args:
+            tokens: 本次请求估算的token数（Azure按prompt + max_tokens计入TPM）
+            max_wait: 可接受的最长等待时间（秒）
+
+        Returns:
+            需要等待的秒数；等待时间超过max_wait时不预约并返回None
+        """
+        costs = {"requests": 1, "tokens": tokens}
+
+        def take(state: Dict[str, Any]) -> Optional[float]:
+            now = time.time()
+            wait = max(state.get("blocked_until", 0.0) - now, 0.0)
+            levels = {}
+            for name, limit in self.limits.items():
+                if limit <= 0:
+                    continue
+                rate = limit / 60
+                capacity = max(rate * self.burst_seconds, 1)
+                level, updated = state.get(name, (capacity, now))
+                level = min(capacity, level + (now - updated) * rate) - min(costs[name], capacity)
+                levels[name] = level
+                wait = max(wait, -level / rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            for name, level in levels.items():
+                state[name] = (level, now)
+            return wait
+
+        wait = self._state.update(take)
+        with self._stats_lock:
+            if wait is None:
+                self._stats["rejected"] += 1
+            else:
+                self._stats["reservations"] += 1
+                if wait > 0:
+                    self._stats["delayed"] += 1
+                    self._stats["wait_seconds"] += wait
+        return wait
+
+    def penalize(self, seconds: float) -> None:
+        """服务端返回429时暂停所有调用方（包括共享状态的其他进程）seconds秒"""
+        def block(state: Dict[str, Any]) -> None:
+            state["blocked_until"] = max(state.get("blocked_until", 0.0), time.time() + seconds)
+        self._state.update(block)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["limits"] = dict(self.limits)
+        stats["avg_wait_ms"] = stats["wait_seconds"] / stats["delayed"] * 1000 if stats["delayed"] else 0.0
+        return stats
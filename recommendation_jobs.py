@@ -0,0 +1,145 @@
+"""
+AI推荐后台任务队列
+在有界线程池中异步生成航班推荐，调用方先拿到航班列表，推荐完成后通过回调送达或按任务ID获取；
+结果按 航线 + 航班集合哈希 缓存
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+
+from azure_openai_client import azure_client
+
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", 4))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 256))
+RECOMMENDATION_MAX_JOBS = int(os.getenv("RECOMMENDATION_MAX_JOBS", 1000))
+
+def flight_set_hash(flights: List[Dict[str, Any]]) -> str:
+    """航班集合的稳定哈希：与顺序无关，价格或余票变化时哈希随之变化"""
+    items = sorted(
+        (str(f.get("flight_number")), str(f.get("price")), str(f.get("available_seats")),
+         str(f.get("departure_time")))
+        for f in flights
+    )
+    return hashlib.sha1(json.dumps(items).encode("utf-8")).hexdigest()
+
+class RecommendationJob:
+    """单个推荐任务"""
+    def __init__(self, job_id: str, departure: str, arrival: str, future: Future):
+        self.job_id = job_id
+        self.departure = departure
+        self.arrival = arrival
+        self.future = future
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            return "running" if self.future.running() else "pending"
+        return "failed" if self.future.exception() else "done"
+
+    @property
+    def result(self) -> Optional[str]:
+        if self.future.done() and not self.future.exception():
+            return self.future.result()
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        error = self.future.exception() if self.future.done() else None
+        return {
+            "job_id": self.job_id,
+            "route": f"{self.departure}-{self.arrival}",
+            "status": self.status,
+            "result": self.result,
+            "error": str(error) if error else None
+        }
+
+class RecommendationJobQueue:
+    def __init__(self, max_workers: int = RECOMMENDATION_WORKERS,
+                 cache_size: int = RECOMMENDATION_CACHE_SIZE,
+                 max_jobs: int = RECOMMENDATION_MAX_JOBS,
+                 generate: Optional[Callable[[str, str, List[Dict[str, Any]]], str]] = None):
+        """
+        Args:
+            generate: 生成推荐文本的函数 (出发地, 目的地, 航班列表)，默认直接调用LLM
+        """
+        self.generate = generate or azure_client.generate_flight_recommendation
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recommendation")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, RecommendationJob]" = OrderedDict()
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._inflight: Dict[tuple, Future] = {}
+        self.cache_size = cache_size
+        self.max_jobs = max_jobs
+
+    def submit(self, departure: str, arrival: str, flights: List[Dict[str, Any]],
+               callback: Optional[Callable[[RecommendationJob], None]] = None) -> str:
+        """
+        提交推荐任务
+
+        命中缓存时任务立即完成；相同航线和航班集合的并发请求共享同一次生成。
+
+        Args:
+            callback: 任务完成时调用（在工作线程中；已完成时在当前线程中立即调用）
+
+        Returns:
+            任务ID
+        """
+        key = (departure, arrival, flight_set_hash(flights))
+        started = False
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                future = Future()
+                future.set_result(self._cache[key])
+            elif key in self._inflight:
+                future = self._inflight[key]
+            else:
+                future = self._executor.submit(self.generate, departure, arrival, list(flights))
+                self._inflight[key] = future
+                started = True
+
+            job = RecommendationJob(uuid.uuid4().hex[:12], departure, arrival, future)
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        # 在锁外注册回调：任务若已完成，回调会在当前线程中立即执行
+        if started:
+            future.add_done_callback(lambda f: self._on_done(key, f))
+        if callback:
+            future.add_done_callback(lambda _: callback(job))
+        return job.job_id
+
+    def _on_done(self, key: tuple, future: Future) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.exception() is None:
+                self._cache[key] = future.result()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """按任务ID查询任务状态和结果"""
+        job = self._jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """等待任务完成并返回推荐文本；超时、失败或任务不存在时返回None"""
+        job = self._jobs.get(job_id)
+        if not job:
+            return None
+        try:
+            return job.future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# 创建全局任务队列实例
+recommendation_jobs = RecommendationJobQueue()
@@ -0,0 +1,111 @@
+"""
+航班推荐提示词构建
+在本地按价格、出发时间和余票对航班预排序，只把排名靠前的航班和整条航线的汇总统计放进提示词，
+并用本地token估算保证提示词不超过预算
+"""
+
+import math
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+RECOMMENDATION_PROMPT_TOKENS = int(os.getenv("RECOMMENDATION_PROMPT_TOKENS", 1200))
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", 10))
+
+# 排序权重：价格越低、余票越多越好，红眼航班（早7点前或晚9点后出发）降权
+PRICE_WEIGHT = 0.5
+SEATS_WEIGHT = 0.3
+TIME_WEIGHT = 0.2
+
+CJK_RE = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+def estimate_tokens(text: str) -> int:
+    """快速估算token数：中文字符及全角标点约1个token，其余约4个字符1个token"""
+    cjk = len(CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def _price(flight: Dict[str, Any]) -> float:
+    try:
+        return float(flight.get("price") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _hour(flight: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(str(flight.get("departure_time"))[:2])
+    except ValueError:
+        return None
+
+def rank_flights(flights: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按综合得分排序（得分越低越靠前）"""
+    if not flights:
+        return []
+    prices = [_price(f) for f in flights]
+    seats = [f.get("available_seats") or 0 for f in flights]
+    min_price, price_range = min(prices), (max(prices) - min(prices)) or 1
+    max_seats = max(seats) or 1
+
+    def score(item: Tuple[int, Dict[str, Any]]) -> float:
+        i, flight = item
+        hour = _hour(flight)
+        red_eye = 1.0 if hour is not None and (hour < 7 or hour >= 21) else 0.0
+        return (PRICE_WEIGHT * (prices[i] - min_price) / price_range
+                + SEATS_WEIGHT * (1 - seats[i] / max_seats)
+                + TIME_WEIGHT * red_eye)
+
+    return [flight for _, flight in sorted(enumerate(flights), key=score)]
+
+def _flight_line(flight: Dict[str, Any]) -> str:
+    line = f"航班 {flight['flight_number']} ({flight.get('airline', '未知')})"
+    if flight.get("departure_time"):
+        line += f" {str(flight['departure_time'])[:5]}-{str(flight.get('arrival_time', ''))[:5]}"
+    line += f" - 价格: ¥{flight['price']}"
+    if flight.get("available_seats") is not None:
+        line += f" - 余票: {flight['available_seats']}"
+    return line
+
+def _summary(flights: List[Dict[str, Any]]) -> str:
+    prices = [_price(f) for f in flights]
+    times = sorted(str(f["departure_time"])[:5] for f in flights if f.get("departure_time"))
+    airlines = {f.get("airline") for f in flights if f.get("airline")}
+    summary = (f"共 {len(flights)} 个航班，{len(airlines)} 家航空公司；"
+               f"价格 ¥{min(prices):.0f}-¥{max(prices):.0f}，均价 ¥{sum(prices) / len(prices):.0f}")
+    if times:
+        summary += f"；出发时间 {times[0]}-{times[-1]}"
+    return summary + f"；总余票 {sum(f.get('available_seats') or 0 for f in flights)}"
+
+def build_recommendation_prompt(departure: str, arrival: str, flights: List[Dict[str, Any]],
+                                token_budget: int = RECOMMENDATION_PROMPT_TOKENS,
+                                top_k: int = RECOMMENDATION_TOP_K) -> Tuple[str, Dict[str, Any]]:
+    """
+    构建推荐系统提示词
+
+    Returns:
+        (系统提示词, {"included": 放入的航班数, "total": 航班总数, "estimated_tokens": 估算token数})
+    """
+    header = f"""
+        你是一个专业的航班推荐助手。请根据以下航班信息，为用户提供个性化的推荐建议。
+
+        航线: {departure} → {arrival}
+        航线概况: {_summary(flights) if flights else "暂无航班"}
+        综合排名靠前的航班:
+        """
+    footer = """
+
+        请提供简洁、实用的推荐建议，包括性价比分析和选择建议。
+        """
+    used = estimate_tokens(header) + estimate_tokens(footer)
+    ranked = rank_flights(flights)
+    # 已售罄的航班只计入汇总
+    ranked = [f for f in ranked if f.get("available_seats") != 0] or ranked
+    lines = []
+    for flight in ranked[:top_k]:
+        line = _flight_line(flight)
+        cost = estimate_tokens(line) + 1
+        if lines and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+
+    prompt = header + "\n        ".join(lines) + footer
+    return prompt, {"included": len(lines), "total": len(flights), "estimated_tokens": used}
@@ -0,0 +1,211 @@
+"""
+航线推荐预计算缓存
+每条航线的AI推荐按版本号缓存：航线的航班新增、删除时版本号递增，缓存随之过期；
+过期的推荐先照常返回并在后台重新生成，后台任务定期刷新访问最多的航线
+"""
+
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Flight, RouteRecommendation
+from azure_openai_client import azure_client, fallback_recommendation
+
+RECOMMENDATION_REFRESH_INTERVAL = int(os.getenv("RECOMMENDATION_REFRESH_INTERVAL", 60))
+RECOMMENDATION_REFRESH_TOP_N = int(os.getenv("RECOMMENDATION_REFRESH_TOP_N", 10))
+# 访问计数最多跟踪的航线数，超出时只保留访问最多的一半
+RECOMMENDATION_MAX_TRACKED_ROUTES = 10000
+
+class UnknownRouteError(LookupError):
+    """航线上没有航班，也从未生成过推荐"""
+
+def bump_route_version(db: Session, departure: str, arrival: str) -> None:
+    """
+    递增航线的推荐版本号，使缓存的推荐过期
+
+    在写操作的同一事务中调用，由调用方负责commit。
+    """
+    departure, arrival = departure.upper(), arrival.upper()
+    route = (RouteRecommendation.departure_airport == departure, RouteRecommendation.arrival_airport == arrival)
+    updated = db.query(RouteRecommendation).filter(*route).update(
+        {RouteRecommendation.version: RouteRecommendation.version + 1}, synchronize_session=False
+    )
+    if updated:
+        return
+    try:
+        with db.begin_nested():
+            db.add(RouteRecommendation(departure_airport=departure, arrival_airport=arrival, version=1))
+    except IntegrityError:
+        # 并发请求已创建该航线的记录
+        db.query(RouteRecommendation).filter(*route).update(
+            {RouteRecommendation.version: RouteRecommendation.version + 1}, synchronize_session=False
+        )
+
+def route_flights(db: Session, departure: str, arrival: str) -> List[Dict[str, Any]]:
+    """航线上的有效航班（与航班接口返回的字段格式一致）"""
+    flights = db.query(Flight).filter(
+        Flight.departure_airport == departure,
+        Flight.arrival_airport == arrival,
+        Flight.status == "active"
+    ).all()
+    return [
+        {
+            "flight_number": f.flight_number,
+            "airline": f.airline,
+            "departure_time": f.departure_time.isoformat(),
+            "arrival_time": f.arrival_time.isoformat(),
+            "price": str(f.price),
+            "available_seats": f.available_seats
+        }
+        for f in flights
+    ]
+
+def _to_dict(departure: str, arrival: str, row: Optional[RouteRecommendation]) -> Dict[str, Any]:
+    return {
+        "departure_airport": departure,
+        "arrival_airport": arrival,
+        "version": row.version if row else 0,
+        "recommendation": row.recommendation if row else None,
+        "flight_count": row.flight_count if row else 0,
+        "stale": row is None or row.recommendation is None or row.computed_version != row.version,
+        "updated_at": row.updated_at.isoformat() if row and row.updated_at else None
+    }
+
+def _read_route(departure: str, arrival: str) -> Dict[str, Any]:
+    """读取航线的推荐记录；航线上没有航班、也从未生成过推荐时抛出 UnknownRouteError"""
+    db = SessionLocal()
+    try:
+        row = db.query(RouteRecommendation).filter(
+            RouteRecommendation.departure_airport == departure,
+            RouteRecommendation.arrival_airport == arrival
+        ).first()
+        if row is None and not db.query(Flight.id).filter(
+            Flight.departure_airport == departure,
+            Flight.arrival_airport == arrival,
+            Flight.status == "active"
+        ).first():
+            # 不为不存在的航线创建记录、调用LLM或计数
+            raise UnknownRouteError(f"没有从 {departure} 到 {arrival} 的航班")
+        return _to_dict(departure, arrival, row)
+    finally:
+        db.close()
+
+class RouteRecommendationCache:
+    """航线推荐缓存的读取、去重刷新和后台预热"""
+    def __init__(self, refresh_interval: int = RECOMMENDATION_REFRESH_INTERVAL,
+                 refresh_top_n: int = RECOMMENDATION_REFRESH_TOP_N):
+        self.refresh_interval = refresh_interval
+        self.refresh_top_n = refresh_top_n
+        self._hits: Counter = Counter()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def get(self, departure: str, arrival: str, wait: bool = False) -> Dict[str, Any]:
+        """
+        读取航线推荐
+
+        缓存有效时直接返回；已过期时返回旧推荐并在后台刷新（wait=True时等待刷新完成）；
+        从未生成过时等待首次生成。
+        """
+        departure, arrival = departure.upper(), arrival.upper()
+        # 数据库查询在线程池中用独立会话执行：等待生成推荐期间不占用数据库连接
+        result = await asyncio.to_thread(_read_route, departure, arrival)
+        self._count_hit((departure, arrival))
+        if not result["stale"]:
+            return result
+        if wait or result["recommendation"] is None:
+            return await self.refresh(departure, arrival)
+        self._schedule_refresh(departure, arrival)
+        return result
+
+    def _count_hit(self, route: Tuple[str, str]) -> None:
+        self._hits[route] += 1
+        if len(self._hits) > RECOMMENDATION_MAX_TRACKED_ROUTES:
+            self._hits = Counter(dict(self._hits.most_common(RECOMMENDATION_MAX_TRACKED_ROUTES // 2)))
+
+    def _decay_hits(self) -> None:
+        """每轮后台刷新后访问计数减半：热度反映最近的访问，不再访问的航线逐渐移出"""
+        self._hits = Counter({route: count // 2 for route, count in self._hits.items() if count > 1})
+
+    def _schedule_refresh(self, departure: str, arrival: str) -> asyncio.Task:
+        key = (departure, arrival)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(asyncio.to_thread(self._refresh_sync, departure, arrival))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._inflight[key] = task
+        return task
+
+    async def refresh(self, departure: str, arrival: str) -> Dict[str, Any]:
+        """重新生成航线推荐；同一航线的并发刷新只调用一次LLM"""
+        return await asyncio.shield(self._schedule_refresh(departure.upper(), arrival.upper()))
+
+    def _refresh_sync(self, departure: str, arrival: str) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            row = db.query(RouteRecommendation).filter(
+                RouteRecommendation.departure_airport == departure,
+                RouteRecommendation.arrival_airport == arrival
+            ).first()
+            if row is None:
+                bump_route_version(db, departure, arrival)
+                db.commit()
+                row = db.query(RouteRecommendation).filter(
+                    RouteRecommendation.departure_airport == departure,
+                    RouteRecommendation.arrival_airport == arrival
+                ).first()
+            # 记下生成前的版本：生成期间航班再次变更时，结果仍标记为过期
+            version = row.version
+            flights = route_flights(db, departure, arrival)
+            db.commit()
+
+            recommendation = azure_client.recommend_flights(departure, arrival, flights)
+            if recommendation is None:
+                # LLM调用失败：降级文本只用于本次返回，不写入缓存，推荐保持过期，下次访问或后台刷新时重试
+                result = _to_dict(departure, arrival, row)
+                result["recommendation"] = result["recommendation"] or fallback_recommendation(flights)
+                return result
+
+            row.recommendation = recommendation
+            row.computed_version = version
+            row.flight_count = len(flights)
+            row.updated_at = datetime.utcnow()
+            db.commit()
+            db.refresh(row)
+            return _to_dict(departure, arrival, row)
+        finally:
+            db.close()
+
+    def hottest_routes(self) -> List[Tuple[Tuple[str, str], int]]:
+        return self._hits.most_common(self.refresh_top_n)
+
+    async def run_refresher(self) -> None:
+        """定期刷新访问最多且已过期的航线推荐"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            hottest = self.hottest_routes()
+            self._decay_hits()
+            for (departure, arrival), _ in hottest:
+                try:
+                    db = SessionLocal()
+                    try:
+                        row = db.query(RouteRecommendation).filter(
+                            RouteRecommendation.departure_airport == departure,
+                            RouteRecommendation.arrival_airport == arrival
+                        ).first()
+                        stale = _to_dict(departure, arrival, row)["stale"]
+                    finally:
+                        db.close()
+                    if stale:
+                        await self.refresh(departure, arrival)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️  航线推荐刷新失败 {departure}-{arrival}: {e}")
+
+# 创建全局航线推荐缓存实例
+route_recommendations = RouteRecommendationCache()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Agent消息总线测试
+两个总线经Unix域套接字连接（两端在同一进程中）
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from typing import ClassVar
+
+from agent_bus import BusMessage, MessageBus, connect_bus, register_message, serve_bus
+
+@register_message
+class Ping(BusMessage):
+    topic: ClassVar[str] = "test.ping"
+    seq: int = 0
+
+@register_message
+class Notice(BusMessage):
+    topic: ClassVar[str] = "test.notice"
+    seq: int = 0
+
+class TestSocketLink(unittest.TestCase):
+    def setUp(self):
+        self.address = os.path.join(tempfile.mkdtemp(), "test_bus.sock")
+
+    def test_01_bad_frames_skipped(self):
+        """无法解析的帧被计数并跳过，之后的消息照常投递"""
+        async def run():
+            bus = MessageBus("server")
+            subscription = bus.subscribe(Ping)
+            server = await serve_bus(bus, self.address, topics=[Ping])
+            reader, writer = await asyncio.open_unix_connection(self.address)
+            valid = {"op": "message", "id": "c-1", "topic": "test.ping", "type": "test.ping", "body": {"seq": 1}}
+            frames = [b"not json", json.dumps({**valid, "type": "test.unknown"}).encode(),
+                      json.dumps({**valid, "body": {"seq": "x"}}).encode(), json.dumps({"op": "message"}).encode(),
+                      json.dumps(valid).encode()]
+            writer.write(b"\n".join(frames) + b"\n")
+            await writer.drain()
+            envelope = await asyncio.wait_for(subscription.get(), 2)
+            self.assertEqual(envelope.message.seq, 1)
+            self.assertEqual(bus.stats()["bad_frames"], 4)
+            writer.close()
+            server.close()
+            await bus.close()
+        asyncio.run(run())
+        print("✅ 跳过无法解析的帧通过")
+
+    def test_02_reply_not_blocked_by_full_queue(self):
+        """本端订阅者队列已满、投递在等待时，排在后面的应答仍能送达"""
+        async def run():
+            server_bus, client_bus = MessageBus("server"), MessageBus("client")
+            server_bus.subscribe(Ping, lambda envelope: envelope.message)
+            server = await serve_bus(server_bus, self.address, topics=[Ping])
+            # 客户端处理 test.notice，但没有人取走，队列长度为1
+            client_bus.subscribe(Notice, max_queue=1)
+            link = await connect_bus(client_bus, self.address, topics=[Notice])
+            await asyncio.sleep(0.05)
+            for seq in range(3):
+                await server_bus.publish(Notice(seq=seq))
+            reply = await client_bus.request(Ping(seq=7), timeout=2)
+            self.assertEqual(reply.seq, 7)
+            await link.close()
+            server.close()
+            await client_bus.close()
+            await server_bus.close()
+        asyncio.run(run())
+        print("✅ 应答不被满队列阻塞通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
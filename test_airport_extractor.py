@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+机场/城市实体抽取测试
+"""
+
+import unittest
+
+from airport_extractor import AhoCorasick, AirportExtractor, extract_airports, extract_route
+
+class TestAirportExtractor(unittest.TestCase):
+    def test_01_cue_route(self):
+        """按"从/到/from/to"等提示词确定出发地和目的地，与出现顺序无关"""
+        for text, route in [("从上海到北京", ("SHA", "PEK")), ("去上海，从北京出发", ("PEK", "SHA")),
+                            ("from Shanghai to Beijing", ("SHA", "PEK")), ("飞往广州", (None, "CAN"))]:
+            self.assertEqual(extract_route(text), route, text)
+        print("✅ 提示词识别出发地/目的地通过")
+
+    def test_02_positional_route(self):
+        """没有提示词时按出现顺序补位，相邻重复的机场只算一次"""
+        for text, route in [("北京 上海", ("PEK", "SHA")), ("PEK-SHA", ("PEK", "SHA")),
+                            ("上海虹桥SHA到北京", ("SHA", "PEK")), ("查一下航班", (None, None))]:
+            self.assertEqual(extract_route(text), route, text)
+        print("✅ 按位置识别出发地/目的地通过")
+
+    def test_03_ambiguous_codes_uppercase_only(self):
+        """同时是英文单词的机场代码只在大写时识别"""
+        self.assertEqual(extract_airports("can you book a flight"), [])
+        self.assertEqual(extract_route("CAN to PEK"), ("CAN", "PEK"))
+        self.assertEqual([m["iata"] for m in extract_airports("pek to sha")], ["PEK", "SHA"])
+        print("✅ 歧义机场代码通过")
+
+    def test_04_whole_word_and_longest_match(self):
+        """英文模式完整单词匹配，重叠时取最左最长的匹配"""
+        extractor = AirportExtractor([
+            {"iata": "SHA", "city": "上海", "city_en": "Shanghai", "aliases": ["上海虹桥"]},
+            {"iata": "PVG", "city": "上海", "aliases": ["上海浦东"]},
+        ])
+        self.assertEqual([m["text"] for m in extractor.extract("shanghai")], ["shanghai"])
+        self.assertEqual(extractor.extract("marshall"), [])
+        self.assertEqual([(m["iata"], m["kind"]) for m in extractor.extract("上海浦东")], [("PVG", "alias")])
+        self.assertEqual([(m["iata"], m["kind"]) for m in extractor.extract("上海")], [("SHA", "city")])
+        print("✅ 完整单词和最长匹配通过")
+
+    def test_05_aho_corasick(self):
+        """自动机找出所有模式的所有出现位置（含互相重叠的模式）"""
+        automaton = AhoCorasick()
+        for pattern in ("he", "she", "his", "hers"):
+            automaton.add(pattern, pattern)
+        self.assertEqual(sorted(automaton.iter("ushers")), [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")])
+        print("✅ Aho-Corasick自动机通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
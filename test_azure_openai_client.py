@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Azure OpenAI客户端测试
+不访问Azure OpenAI，用假的发送函数测试熔断器与本地限流的配合
+"""
+
+import asyncio
+import unittest
+
+import httpx
+
+from azure_openai_client import AzureOpenAIClient, CircuitBreaker
+from rate_limiter import RateLimiter
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        """熔断器已打开且冷却期已过：下一次调用是半开状态的试探调用"""
+        self.breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        self.breaker.record_failure()
+        # 每分钟1个请求、没有突发余量：先用掉唯一的配额，之后的调用在耗时预算内拿不到配额
+        limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=0, state_file="", burst_seconds=0)
+        limiter.reserve(0)
+        self.client = AzureOpenAIClient(breaker=self.breaker, rate_limiter=limiter)
+        self.sent = []
+
+    def send(self, timeout: float) -> httpx.Response:
+        self.sent.append(timeout)
+        return httpx.Response(200)
+
+    async def asend(self, timeout: float) -> httpx.Response:
+        return self.send(timeout)
+
+    def test_01_quota_rejection_releases_trial(self):
+        """本地限流拒绝试探调用后，熔断器仍放行下一次试探"""
+        self.assertIsNone(self.client._send_with_retries(self.send, deadline=0.01))
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertTrue(self.breaker.allow())
+        print("✅ 限流拒绝后归还试探名额通过")
+
+    def test_02_async_quota_rejection_releases_trial(self):
+        """异步版本同样归还试探名额"""
+        self.assertIsNone(asyncio.run(self.client._asend_with_retries(self.asend, deadline=0.01)))
+        self.assertTrue(self.breaker.allow())
+        print("✅ 异步限流拒绝后归还试探名额通过")
+
+    def test_03_trial_success_closes_breaker(self):
+        """试探调用成功后熔断器关闭"""
+        self.client.rate_limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0, state_file="")
+        response = self.client._send_with_retries(self.send, deadline=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.breaker.state, "closed")
+        print("✅ 试探成功关闭熔断器通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
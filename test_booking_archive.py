@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+预订归档测试
+热表和冷存储使用临时SQLite库
+"""
+
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, time
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import booking_archive
+from booking_archive import archive_bookings
+from database import ArchiveBase, ArchivedBooking, Base, Booking
+
+OLD_DAY = date(2001, 1, 1)
+
+class TestArchiveBookings(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        hot_engine = create_engine(f"sqlite:///{os.path.join(directory, 'hot.db')}")
+        archive_engine = create_engine(f"sqlite:///{os.path.join(directory, 'archive.db')}")
+        Base.metadata.create_all(bind=hot_engine)
+        ArchiveBase.metadata.create_all(bind=archive_engine)
+        self.HotSession = sessionmaker(bind=hot_engine)
+        self.ArchiveSession = sessionmaker(bind=archive_engine)
+        self.patches = [mock.patch.object(booking_archive, "SessionLocal", self.HotSession),
+                        mock.patch.object(booking_archive, "ArchiveSessionLocal", self.ArchiveSession)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def add_booking(self, passenger_name: str, departure_date: date = OLD_DAY) -> int:
+        db = self.HotSession()
+        booking = Booking(title="归档测试", passenger_name=passenger_name, flight_number="CA1001",
+                          departure_date=departure_date, departure_time=time(8, 0), arrival_date=departure_date,
+                          arrival_time=time(10, 0), departure_airport="PEK", arrival_airport="SHA", price=500)
+        db.add(booking)
+        db.commit()
+        booking_id = booking.id
+        db.close()
+        return booking_id
+
+    def hot_ids(self) -> list:
+        db = self.HotSession()
+        ids = [booking.id for booking in db.query(Booking).order_by(Booking.id)]
+        db.close()
+        return ids
+
+    def archived(self) -> dict:
+        db = self.ArchiveSession()
+        rows = {row.id: (row.passenger_name, row.departure_date) for row in db.query(ArchivedBooking)}
+        db.close()
+        return rows
+
+    def test_01_conflict_skipped(self):
+        """归档中同ID属于另一个预订时只跳过该预订，之后的归档照常进行"""
+        first, second = self.add_booking("张三"), self.add_booking("李四")
+        db = self.ArchiveSession()
+        db.add(ArchivedBooking(id=first, title="其他", passenger_name="王五", flight_number="MU5101",
+                               departure_date=OLD_DAY, departure_time=time(8, 0), arrival_date=OLD_DAY,
+                               arrival_time=time(10, 0), departure_airport="PEK", arrival_airport="SHA", price=500,
+                               created_at=datetime(2000, 1, 1), updated_at=datetime(2000, 1, 1)))
+        db.commit()
+        db.close()
+
+        result = archive_bookings(0, batch_size=1)
+        self.assertEqual(result["archived"], 1)
+        self.assertEqual(result["conflicts"], [first])
+        self.assertEqual(self.hot_ids(), [first])
+        self.assertEqual(self.archived()[second][0], "李四")
+
+        third = self.add_booking("赵六")
+        result = archive_bookings(0, batch_size=1)
+        self.assertEqual((result["archived"], result["conflicts"]), (1, [first]))
+        self.assertIn(third, self.archived())
+        print("✅ 归档冲突跳过通过")
+
+    def test_02_modified_during_archive_kept(self):
+        """读取之后被修改（改到未来日期）的预订不删除，冷存储中也不留旧版本"""
+        booking_id = self.add_booking("张三")
+        ensure_partitions = booking_archive._ensure_partitions
+
+        def modify(archive_db, days):
+            db = self.HotSession()
+            booking = db.get(Booking, booking_id)
+            booking.departure_date = date(2099, 1, 1)
+            booking.updated_at = datetime.utcnow()
+            db.commit()
+            db.close()
+            ensure_partitions(archive_db, days)
+
+        with mock.patch.object(booking_archive, "_ensure_partitions", modify):
+            result = archive_bookings(0)
+        self.assertEqual((result["archived"], result["changed"]), (0, 1))
+        self.assertEqual(self.hot_ids(), [booking_id])
+        self.assertEqual(self.archived(), {})
+        print("✅ 归档期间修改的预订保留通过")
+
+    def test_03_rerun_replaces_leftover_copy(self):
+        """上次中断留下的同一预订的副本被热表的当前内容替换"""
+        booking_id = self.add_booking("张三")
+        archive_bookings(0)
+        db = self.HotSession()
+        db.add(Booking(id=booking_id, title="归档测试", passenger_name="张三（改名）", flight_number="CA1001",
+                       departure_date=OLD_DAY, departure_time=time(8, 0), arrival_date=OLD_DAY,
+                       arrival_time=time(10, 0), departure_airport="PEK", arrival_airport="SHA", price=500,
+                       created_at=self.archived_created_at(booking_id)))
+        db.commit()
+        db.close()
+        self.assertEqual(archive_bookings(0)["archived"], 1)
+        self.assertEqual(self.archived(), {booking_id: ("张三（改名）", OLD_DAY)})
+        print("✅ 重跑替换遗留副本通过")
+
+    def archived_created_at(self, booking_id: int) -> datetime:
+        db = self.ArchiveSession()
+        created_at = db.get(ArchivedBooking, (booking_id, OLD_DAY)).created_at
+        db.close()
+        return created_at
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
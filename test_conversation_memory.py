@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+会话记忆测试：指代解析、摘要压缩和会话淘汰
+"""
+
+import unittest
+
+from conversation_memory import ConversationMemory, ConversationStore
+
+FLIGHTS = [
+    {"flight_number": "CA1234", "departure_airport": "PEK", "arrival_airport": "SHA", "price": 1200},
+    {"flight_number": "MU5678", "departure_airport": "PEK", "arrival_airport": "SHA", "price": 980},
+    {"flight_number": "CZ3456", "departure_airport": "PEK", "arrival_airport": "SHA", "price": 1500},
+]
+BOOKINGS = [
+    {"id": 7, "passenger_name": "张三", "flight_number": "CA1234", "departure_date": "2030-01-01", "status": "confirmed"},
+    {"id": 9, "passenger_name": "张三", "flight_number": "MU5678", "departure_date": "2030-01-02", "status": "pending"},
+]
+
+class TestConversationMemory(unittest.TestCase):
+    def test_01_resolve_ordinal(self):
+        """第N个、最后一个按上次查询结果的顺序解析，超出范围时返回None"""
+        memory = ConversationMemory("s1")
+        memory.remember(flights=FLIGHTS, bookings=BOOKINGS)
+        self.assertEqual(memory.resolve_flight("订第2个航班")["flight_number"], "MU5678")
+        self.assertEqual(memory.resolve_flight("第 三 班")["flight_number"], "CZ3456")
+        self.assertEqual(memory.resolve_flight("最后一个")["flight_number"], "CZ3456")
+        self.assertIsNone(memory.resolve_flight("第五个"))
+        self.assertEqual(memory.resolve_booking("取消第一个")["id"], 7)
+        self.assertEqual(memory.resolve_booking("最后一个预订")["id"], 9)
+        print("✅ 序号引用解析通过")
+
+    def test_02_resolve_reference(self):
+        """"那个"在只有一个结果时指向它，否则指向最近单独提到的实体；航班号和预订ID直接匹配"""
+        memory = ConversationMemory("s2")
+        memory.remember(flights=FLIGHTS)
+        self.assertIsNone(memory.resolve_flight("那个航班"))
+        memory.remember(flight=FLIGHTS[2])
+        self.assertEqual(memory.resolve_flight("那个航班")["flight_number"], "CZ3456")
+        self.assertEqual(memory.resolve_flight("就订mu5678")["flight_number"], "MU5678")
+        memory.remember(bookings=BOOKINGS[:1])
+        self.assertEqual(memory.resolve_booking("取消那个预订")["id"], 7)
+        self.assertEqual(memory.resolve_booking("预订号 7")["id"], 7)
+        self.assertIsNone(memory.resolve_booking("预订号 8"))
+        self.assertIsNone(memory.resolve_flight("查一下明天的航班"))
+        print("✅ 指代词解析通过")
+
+    def test_03_summary_folding(self):
+        """超出最近条数的对话压缩进摘要，摘要超出上限时丢弃最早的内容"""
+        memory = ConversationMemory("s3", recent_turns=2, summary_chars=20)
+        memory.add_turn("user", "第一条  消息")
+        memory.add_turn("agent", "第二条")
+        memory.add_turn("user", "第三条")
+        self.assertEqual(memory.summary, "用户: 第一条 消息")
+        self.assertEqual([text for _, text in memory.turns], ["第二条", "第三条"])
+        memory.add_turn("agent", "x" * 200)
+        memory.add_turn("user", "第五条")
+        self.assertEqual(memory.summary, "助手: 第二条\n用户: 第三条")
+        memory.add_turn("agent", "好的")
+        self.assertEqual(memory.summary, "助手: " + "x" * 79 + "…")
+        messages = memory.context_messages()
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertIn("此前对话摘要", messages[0]["content"])
+        self.assertEqual([m["role"] for m in messages[1:]], ["user", "assistant"])
+        print("✅ 摘要压缩通过")
+
+    def test_04_store_eviction(self):
+        """会话数超出上限时淘汰最久未活动的会话"""
+        store = ConversationStore(max_sessions=2)
+        store.get("a").remember(route=("PEK", "SHA"))
+        store.get("b")
+        store.get("a")
+        store.get("c")
+        self.assertEqual(store.get("a").recall("route"), ("PEK", "SHA"))
+        self.assertFalse(store.drop("b"))
+        self.assertEqual(store.stats()["evicted"], 1)
+        print("✅ 会话淘汰通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+票价日历测试
+用临时SQLite库模拟补算期间发生失效的情况
+"""
+
+import os
+import tempfile
+import unittest
+from datetime import date, time
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import fare_calendar
+from database import Base, Booking, Flight
+from fare_calendar import get_fare_calendar, invalidate_fares
+
+DAY = date(2024, 8, 1)
+
+class TestFareCalendar(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "fares.db")
+        engine = create_engine(f"sqlite:///{self.path}")
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(bind=engine)
+        self.db = self.Session()
+        self.db.add(Flight(flight_number="FC001", airline="测试航空", departure_airport="PEK", arrival_airport="SHA",
+                           departure_time=time(8, 0), arrival_time=time(10, 0), price=500, available_seats=1))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.path)
+
+    def book_and_invalidate(self, *args, fare_date=DAY):
+        """另一个会话订完唯一的座位并使票价日历失效"""
+        writer = self.Session()
+        writer.add(Booking(title="测试", passenger_name="张三", flight_number="FC001", departure_date=DAY,
+                           departure_time=time(8, 0), arrival_date=DAY, arrival_time=time(10, 0),
+                           departure_airport="PEK", arrival_airport="SHA", price=500))
+        invalidate_fares(writer, "PEK", "SHA", fare_date)
+        writer.commit()
+        writer.close()
+
+    def available(self) -> int:
+        return get_fare_calendar(self.db, "PEK", "SHA", DAY, DAY)[0]["available_flights"]
+
+    def compute_then(self, writer):
+        """计算完成后、写回之前执行writer，模拟并发的写操作"""
+        compute = fare_calendar._compute_days
+
+        def racing(*args):
+            entries = compute(*args)
+            writer()
+            return entries
+        return mock.patch.object(fare_calendar, "_compute_days", racing)
+
+    def test_01_invalidate_during_compute(self):
+        """补算期间当天失效时，旧结果不写回，下次查询重新计算"""
+        with self.compute_then(self.book_and_invalidate):
+            self.assertEqual(self.available(), 1)
+        self.assertEqual(self.available(), 0)
+        print("✅ 补算期间的日期失效通过")
+
+    def test_02_route_invalidate_during_compute(self):
+        """补算期间整条航线失效时同样不写回"""
+        with self.compute_then(lambda: self.book_and_invalidate(fare_date=None)):
+            self.assertEqual(self.available(), 1)
+        self.assertEqual(self.available(), 0)
+        print("✅ 补算期间的航线失效通过")
+
+    def test_03_cached_until_invalidated(self):
+        """未失效的日期直接读聚合表"""
+        self.assertEqual(self.available(), 1)
+        with mock.patch.object(fare_calendar, "_compute_days", side_effect=AssertionError("不应重新计算")):
+            self.assertEqual(self.available(), 1)
+        self.book_and_invalidate()
+        self.assertEqual(self.available(), 0)
+        print("✅ 缓存与失效通过")
+
+    def test_04_marker_date_rejected(self):
+        """查询区间不能包含航线标记行的日期"""
+        with self.assertRaises(ValueError):
+            fare_calendar.parse_month("0001-01")
+        with self.assertRaises(ValueError):
+            get_fare_calendar(self.db, "PEK", "SHA", fare_calendar.ROUTE_MARKER_DATE, DAY)
+        print("✅ 标记行日期排除通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+预订组提交测试
+使用临时SQLite库
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import date, time
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import group_commit
+from database import Base, Booking
+from group_commit import GroupCommitter, commit_bookings
+
+def booking_data(passenger_name):
+    return dict(title="组提交测试", passenger_name=passenger_name, flight_number="CA1001",
+                departure_date=date(2030, 1, 1), departure_time=time(8, 0), arrival_date=date(2030, 1, 1),
+                arrival_time=time(10, 0), departure_airport="PEK", arrival_airport="SHA", price=500)
+
+class TestGroupCommit(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'group.db')}")
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(bind=engine)
+        self.patch = mock.patch.object(group_commit, "SessionLocal", self.Session)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def passengers(self) -> list:
+        db = self.Session()
+        names = [booking.passenger_name for booking in db.query(Booking).order_by(Booking.id)]
+        db.close()
+        return names
+
+    def test_01_batch_commit(self):
+        """一批预订在一个事务中提交，按提交顺序返回"""
+        results = commit_bookings([booking_data("张三"), booking_data("李四")])
+        self.assertEqual([booking.passenger_name for booking in results], ["张三", "李四"])
+        self.assertTrue(all(booking.id for booking in results))
+        self.assertEqual(self.passengers(), ["张三", "李四"])
+        print("✅ 批量提交通过")
+
+    def test_02_bad_row_fails_alone(self):
+        """一条坏数据只让它自己失败，同批其他预订逐条重试后正常提交"""
+        results = commit_bookings([booking_data("张三"), booking_data(None), booking_data("王五")])
+        self.assertIsInstance(results[0], Booking)
+        self.assertIsInstance(results[1], Exception)
+        self.assertIsInstance(results[2], Booking)
+        self.assertEqual(self.passengers(), ["张三", "王五"])
+        print("✅ 坏数据隔离通过")
+
+    def test_03_committer_futures_independent(self):
+        """同一批次中的调用方各自得到结果或错误"""
+        async def run():
+            committer = GroupCommitter(window_ms=50, max_batch=10)
+            try:
+                return await asyncio.gather(*(committer.submit(booking_data(name)) for name in ("张三", None, "王五")),
+                                            return_exceptions=True), committer.batches
+            finally:
+                await committer.close()
+
+        results, batches = asyncio.run(run())
+        self.assertEqual(batches, 1)
+        self.assertEqual(results[0].passenger_name, "张三")
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(results[2].passenger_name, "王五")
+        self.assertEqual(self.passengers(), ["张三", "王五"])
+        print("✅ 组提交调用方结果独立通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
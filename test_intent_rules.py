@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+本地规则意图识别测试
+"""
+
+import unittest
+
+from intent_rules import IntentRuleEngine
+
+class TestIntentRules(unittest.TestCase):
+    def setUp(self):
+        self.rules = IntentRuleEngine(threshold=0.85, enabled=True)
+
+    def test_01_passenger_name(self):
+        """姓名识别命中时在本地回答"""
+        for text, name in [("查询张三的预订", "张三"), ("查看欧阳娜娜的订单", "欧阳娜娜"),
+                           ("查询乘客：李四的预订", "李四"), ("查看passenger: John Smith", "John Smith")]:
+            analysis = self.rules.match(text)
+            self.assertIsNotNone(analysis, text)
+            self.assertEqual(analysis["intent"], "search_booking")
+            self.assertEqual(analysis["entities"]["passenger_name"], name)
+        print("✅ 乘客姓名识别通过")
+
+    def test_02_not_passenger_name(self):
+        """时间词、代词、数量词和城市名不会被当作姓名，也不会跳过LLM"""
+        for text in ["查询明天的预订", "查看最近的订单", "查询全部的预订", "查一下下周的航班", "查看今天的订单",
+                     "查询北京的航班", "帮我查询一下我们的预订"]:
+            analysis = self.rules.analyze(text)
+            self.assertNotIn("passenger_name", analysis["entities"], text)
+            self.assertIsNone(self.rules.match(text), text)
+        print("✅ 非姓名词排除通过")
+
+    def test_03_weak_name_goes_to_llm(self):
+        """仅有 "XX的预订" 这一弱提示且XX不以常见姓氏开头时交给LLM"""
+        self.assertIsNone(self.rules.match("查询小明的预订"))
+        print("✅ 弱提示姓名交给LLM通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+MCP客户端分页读取测试
+"""
+
+import asyncio
+import unittest
+
+from mcp_client import MCPRequestError, aiter_pages, iter_pages
+
+ITEMS = list(range(7))
+
+def fetch_page(skip: int, limit: int, fail_at: int = -1):
+    if skip == fail_at:
+        return None
+    return ITEMS[skip:skip + limit]
+
+class TestIterPages(unittest.TestCase):
+    def test_01_reads_until_short_page(self):
+        """读到不满一页或空页时结束"""
+        for prefetch in (True, False):
+            self.assertEqual(list(iter_pages(fetch_page, 3, prefetch)), ITEMS)
+            self.assertEqual(list(iter_pages(fetch_page, 7, prefetch)), ITEMS)
+        print("✅ 分页读取通过")
+
+    def test_02_failed_page_raises(self):
+        """中间某页失败时抛出异常，而不是当作读完"""
+        for prefetch in (True, False):
+            items = []
+            with self.assertRaises(MCPRequestError):
+                for item in iter_pages(lambda skip, limit: fetch_page(skip, limit, fail_at=3), 3, prefetch):
+                    items.append(item)
+            self.assertEqual(items, ITEMS[:3])
+        print("✅ 分页失败抛出异常通过")
+
+    def test_03_async_failed_page_raises(self):
+        """异步版本同样抛出异常"""
+        async def afetch(skip: int, limit: int):
+            return fetch_page(skip, limit, fail_at=6)
+
+        async def collect(prefetch: bool):
+            return [item async for item in aiter_pages(afetch, 3, prefetch)]
+
+        for prefetch in (True, False):
+            with self.assertRaises(MCPRequestError):
+                asyncio.run(collect(prefetch))
+        print("✅ 异步分页失败抛出异常通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -7,6 +7,7 @@ MCP服务器测试脚本
 import requests
 import json
 import unittest
+import time as systime
 from datetime import datetime, date, time
 from decimal import Decimal
 
@@ -182,7 +183,295 @@ class TestMCPServer(unittest.TestCase):
             self.assertIn(field, stats)
         
         print(f"✅ 获取统计信息通过 (预订: {stats['total_bookings']}, 航班: {stats['total_flights']})")
-    
+
+    def test_12_fare_calendar(self):
+        """测试票价日历"""
+        response = self.session.get(f"{self.base_url}/fares/PEK/SHA", params={"month": "2024-08"})
+        self.assertEqual(response.status_code, 200)
+
+        calendar = response.json()
+        self.assertEqual(calendar['month'], '2024-08')
+        self.assertEqual(len(calendar['days']), 31)
+        self.assertEqual(calendar['days'][0]['date'], '2024-08-01')
+        for day in calendar['days']:
+            self.assertIsNotNone(day['min_price'])
+            self.assertLessEqual(Decimal(str(day['min_price'])), Decimal("680.00"))
+
+        # 再次查询应命中预计算结果
+        cached = self.session.get(f"{self.base_url}/fares/PEK/SHA", params={"month": "2024-08"}).json()
+        self.assertEqual(cached['days'], calendar['days'])
+
+        for month in ("2024-13", "0001-01"):
+            response = self.session.get(f"{self.base_url}/fares/PEK/SHA", params={"month": month})
+            self.assertEqual(response.status_code, 400, month)
+
+        print("✅ 票价日历通过")
+
+    def test_13_archive_bookings(self):
+        """测试历史预订归档"""
+        booking_data = {
+            "title": "归档测试预订",
+            "passenger_name": "归档测试用户",
+            "flight_number": "CA1001",
+            "departure_date": "2001-01-01",
+            "departure_time": "08:30:00",
+            "arrival_date": "2001-01-01",
+            "arrival_time": "10:45:00",
+            "departure_airport": "PEK",
+            "arrival_airport": "SHA",
+            "price": "680.00"
+        }
+        response = self.session.post(f"{self.base_url}/bookings", json=booking_data)
+        self.assertEqual(response.status_code, 200)
+        booking_id = response.json()['id']
+
+        # 只归档2010年之前出发的预订
+        older_than_days = (date.today() - date(2010, 1, 1)).days
+        response = self.session.post(f"{self.base_url}/bookings/archive",
+                                     params={"older_than_days": older_than_days})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json()['archived'], 1)
+
+        response = self.session.get(f"{self.base_url}/bookings/{booking_id}")
+        self.assertEqual(response.status_code, 404)
+
+        response = self.session.get(f"{self.base_url}/bookings/{booking_id}",
+                                    params={"include_archived": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['passenger_name'], '归档测试用户')
+
+        bookings = self.session.get(f"{self.base_url}/bookings/search/归档测试用户",
+                                    params={"include_archived": True}).json()
+        self.assertIn(booking_id, [b['id'] for b in bookings])
+
+        # 已归档预订的ID不会再分配给新预订
+        response = self.session.post(f"{self.base_url}/bookings", json={**booking_data, "departure_date": "2024-08-15",
+                                                                         "arrival_date": "2024-08-15"})
+        self.assertEqual(response.status_code, 200)
+        new_booking_id = response.json()['id']
+        self.assertGreater(new_booking_id, booking_id)
+        self.session.delete(f"{self.base_url}/bookings/{new_booking_id}")
+
+        print(f"✅ 历史预订归档通过 (ID: {booking_id})")
+
+    def test_14_booking_event_log(self):
+        """测试预订变更事件日志"""
+        start = self.session.get(f"{self.base_url}/events", params={"limit": 10000}).json()['next_offset']
+
+        booking_data = {
+            "title": "事件测试预订",
+            "passenger_name": "事件测试用户",
+            "flight_number": "CA1001",
+            "departure_date": "2024-08-16",
+            "departure_time": "08:30:00",
+            "arrival_date": "2024-08-16",
+            "arrival_time": "10:45:00",
+            "departure_airport": "PEK",
+            "arrival_airport": "SHA",
+            "price": "680.00"
+        }
+        booking_id = self.session.post(f"{self.base_url}/bookings", json=booking_data).json()['id']
+        self.session.put(f"{self.base_url}/bookings/{booking_id}", json={"seat_number": "1A"})
+        self.session.delete(f"{self.base_url}/bookings/{booking_id}")
+
+        # 事件由后台排序器编号后才出现在日志中
+        for _ in range(50):
+            response = self.session.get(f"{self.base_url}/events", params={"after": start})
+            self.assertEqual(response.status_code, 200)
+            log = response.json()
+            events = [e for e in log['events'] if e['aggregate_id'] == booking_id]
+            if len(events) == 3:
+                break
+            systime.sleep(0.1)
+        self.assertEqual([e['event_type'] for e in events],
+                         ['booking.created', 'booking.updated', 'booking.deleted'])
+        self.assertEqual(events[1]['payload']['seat_number'], '1A')
+        self.assertGreater(log['next_offset'], start)
+
+        print(f"✅ 事件日志通过 ({len(log['events'])} 个事件)")
+
+    def test_15_route_recommendation(self):
+        """测试航线推荐缓存随航班变更失效"""
+        flight_ids = []
+        for n in range(2):
+            flight_data = {
+                "flight_number": f"RECTEST{n}",
+                "airline": "推荐测试航空",
+                "departure_airport": "TSA",
+                "arrival_airport": "TSB",
+                "departure_time": f"{9 + n:02d}:00:00",
+                "arrival_time": f"{11 + n:02d}:00:00",
+                "price": "500.00",
+                "available_seats": 50
+            }
+            response = self.session.post(f"{self.base_url}/flights", json=flight_data)
+            self.assertEqual(response.status_code, 200)
+            flight_ids.append(response.json()['id'])
+
+            if n == 0:
+                # 航线记录在航班删除后仍保留，重复运行时上次的推荐已过期，等待重新生成
+                first = self.session.get(f"{self.base_url}/recommendations/TSA/TSB", params={"wait": True}).json()
+                self.assertFalse(first['stale'])
+                self.assertEqual(first['flight_count'], 1)
+                self.assertTrue(first['recommendation'])
+
+        # 新增航班后旧推荐立即返回但标记为过期
+        stale = self.session.get(f"{self.base_url}/recommendations/TSA/TSB").json()
+        self.assertTrue(stale['stale'])
+        self.assertGreater(stale['version'], first['version'])
+
+        fresh = self.session.get(f"{self.base_url}/recommendations/TSA/TSB", params={"wait": True}).json()
+        self.assertFalse(fresh['stale'])
+        self.assertEqual(fresh['flight_count'], 2)
+
+        for flight_id in flight_ids:
+            self.session.delete(f"{self.base_url}/flights/{flight_id}")
+        response = self.session.get(f"{self.base_url}/recommendations/TSA/TSB")
+        self.assertTrue(response.json()['stale'])
+
+        # 没有航班的航线不创建推荐记录
+        response = self.session.get(f"{self.base_url}/recommendations/TSX/TSY")
+        self.assertEqual(response.status_code, 404)
+
+        print(f"✅ 航线推荐缓存通过 (版本: {fresh['version']})")
+
+    def test_16_flight_changes(self):
+        """测试航班目录增量查询"""
+        full = self.session.get(f"{self.base_url}/flights/changes").json()
+        self.assertEqual(full['deleted'], [])
+        flight_numbers = {f['flight_number'] for f in full['flights']}
+        since = full['server_time']
+
+        flight_data = {
+            "flight_number": "DELTA001",
+            "airline": "增量测试航空",
+            "departure_airport": "TSC",
+            "arrival_airport": "TSD",
+            "departure_time": "09:00:00",
+            "arrival_time": "11:00:00",
+            "price": "600.00",
+            "available_seats": 20
+        }
+        response = self.session.post(f"{self.base_url}/flights", json=flight_data)
+        self.assertEqual(response.status_code, 200)
+        flight_id = response.json()['id']
+
+        changes = self.session.get(f"{self.base_url}/flights/changes", params={"updated_since": since}).json()
+        changed = [f['flight_number'] for f in changes['flights']]
+        self.assertIn("DELTA001", changed)
+        self.assertFalse(flight_numbers & set(changed))
+
+        self.session.delete(f"{self.base_url}/flights/{flight_id}")
+        changes = self.session.get(f"{self.base_url}/flights/changes", params={"updated_since": since}).json()
+        self.assertNotIn("DELTA001", [f['flight_number'] for f in changes['flights']])
+        self.assertIn({"id": flight_id, "flight_number": "DELTA001"}, changes['deleted'])
+
+        print(f"✅ 航班目录增量查询通过 (完整目录: {len(full['flights'])} 个航班)")
+
+    def test_17_auto_booking(self):
+        """测试搜索并预订的组合端点"""
+        flights = []
+        for number, price, departure_time, seats in [("AUTO001", "900.00", "07:00:00", 1),
+                                                     ("AUTO002", "500.00", "12:00:00", 1),
+                                                     ("AUTO003", "700.00", "20:00:00", 30)]:
+            response = self.session.post(f"{self.base_url}/flights", json={
+                "flight_number": number,
+                "airline": "自动预订测试航空",
+                "departure_airport": "TAU",
+                "arrival_airport": "TAV",
+                "departure_time": departure_time,
+                "arrival_time": "23:30:00",
+                "price": price,
+                "available_seats": seats
+            })
+            self.assertEqual(response.status_code, 200)
+            flights.append(response.json()['id'])
+
+        request = {"passenger_name": "自动预订测试", "departure_airport": "tau", "arrival_airport": "TAV",
+                   "departure_date": "2024-09-01"}
+        booking_ids = []
+        try:
+            # cheapest: AUTO002，余票扣减为0
+            response = self.session.post(f"{self.base_url}/bookings/auto", json=request)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            booking_ids.append(data['booking']['id'])
+            self.assertEqual(data['flight']['flight_number'], "AUTO002")
+            self.assertEqual(data['flight']['available_seats'], 0)
+            self.assertEqual(data['booking']['flight_number'], "AUTO002")
+            self.assertEqual(data['booking']['departure_date'], "2024-09-01")
+            self.assertEqual(Decimal(data['booking']['price']), Decimal("500.00"))
+
+            # 已售罄的AUTO002不再被选中
+            response = self.session.post(f"{self.base_url}/bookings/auto", json={**request, "policy": "earliest"})
+            self.assertEqual(response.status_code, 200)
+            booking_ids.append(response.json()['booking']['id'])
+            self.assertEqual(response.json()['flight']['flight_number'], "AUTO001")
+
+            response = self.session.post(f"{self.base_url}/bookings/auto", json={**request, "policy": "most_seats"})
+            self.assertEqual(response.status_code, 200)
+            booking_ids.append(response.json()['booking']['id'])
+            self.assertEqual(response.json()['flight']['available_seats'], 29)
+
+            # 余票按日期计算：航班的每日座位数不变，其他日期不受影响
+            response = self.session.get(f"{self.base_url}/flights/{flights[1]}")
+            self.assertEqual(response.json()['available_seats'], 1)
+            days = {day['date']: day for day in self.session.get(f"{self.base_url}/fares/TAU/TAV",
+                                                                 params={"month": "2024-09"}).json()['days']}
+            self.assertEqual(days['2024-09-01']['available_flights'], 1)
+            self.assertEqual(days['2024-09-01']['flight_number'], "AUTO003")
+            self.assertEqual(days['2024-09-02']['available_flights'], 3)
+            self.assertEqual(days['2024-09-02']['flight_number'], "AUTO002")
+
+            response = self.session.post(f"{self.base_url}/bookings/auto", json={**request, "policy": "fastest"})
+            self.assertEqual(response.status_code, 422)
+            response = self.session.post(f"{self.base_url}/bookings/auto",
+                                         json={**request, "departure_airport": "TAX"})
+            self.assertEqual(response.status_code, 404)
+        finally:
+            for booking_id in booking_ids:
+                self.session.delete(f"{self.base_url}/bookings/{booking_id}")
+            for flight_id in flights:
+                self.session.delete(f"{self.base_url}/flights/{flight_id}")
+
+        print(f"✅ 搜索并预订通过 (创建 {len(booking_ids)} 个预订)")
+
+    def test_18_direct_dispatch_validation(self):
+        """测试进程内直接调用与HTTP调用对超出约束的参数返回相同的状态码"""
+        import asyncio
+        from fastapi import HTTPException
+        from mcp_direct import DirectDispatcher
+        from mcp_server import app
+
+        dispatcher = DirectDispatcher(app)
+        cases = [
+            ("/events", {"limit": 0}),
+            ("/events", {"after": -1}),
+            ("/flights", {"limit": 5000}),
+            ("/bookings", {"skip": -1}),
+            ("/fares/PEK/SHA", {"month": "2024-8"}),
+        ]
+        for endpoint, params in cases:
+            response = self.session.get(f"{self.base_url}{endpoint}", params=params)
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(dispatcher.request("GET", endpoint, params=params))
+            self.assertEqual(raised.exception.status_code, response.status_code, (endpoint, params))
+            self.assertEqual(response.status_code, 422)
+        print("✅ 直接调用参数校验通过")
+
+    def test_19_concurrency_beyond_db_pool(self):
+        """测试并发请求数超过数据库连接池容量时服务器不会锁死"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def search(_):
+            return requests.get(f"{self.base_url}/flights/search/PEK/SHA", timeout=20).status_code
+
+        with ThreadPoolExecutor(max_workers=60) as executor:
+            statuses = list(executor.map(search, range(120)))
+        self.assertEqual(set(statuses), {200})
+        self.assertEqual(self.session.get(f"{self.base_url}/health", timeout=5).status_code, 200)
+        print(f"✅ 超过连接池容量的并发请求通过 ({len(statuses)} 个请求)")
+
     def test_99_cleanup(self):
         """清理测试数据"""
         # 删除测试预订
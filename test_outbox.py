@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+事务性发件箱测试
+用临时SQLite库模拟ID较小的事件晚提交的情况
+"""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, OutboxEvent
+from outbox import assign_sequences, read_events
+
+class TestOutboxLog(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+        engine = create_engine(f"sqlite:///{self.path}")
+        Base.metadata.create_all(bind=engine, tables=[OutboxEvent.__table__])
+        self.db = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.path)
+
+    def commit_event(self, event_id: int) -> None:
+        self.db.add(OutboxEvent(id=event_id, aggregate_type="booking", aggregate_id=event_id,
+                                event_type="booking.created", payload="{}", created_at=datetime.utcnow()))
+        self.db.commit()
+
+    def test_01_late_commit_not_skipped(self):
+        """ID较小的事件晚于消费方的读取提交时，续读仍能读到"""
+        self.commit_event(2)
+        assign_sequences(self.db)
+        first = read_events(self.db)
+        self.assertEqual([e["aggregate_id"] for e in first], [2])
+        self.commit_event(1)
+        assign_sequences(self.db)
+        second = read_events(self.db, after=first[-1]["offset"])
+        self.assertEqual([e["aggregate_id"] for e in second], [1])
+        self.assertGreater(second[0]["offset"], first[-1]["offset"])
+        print("✅ 晚提交事件不被跳过通过")
+
+    def test_02_read_is_read_only(self):
+        """读取事件日志不分配序号，未编号的事件由排序器编号后才可读"""
+        self.commit_event(1)
+        self.assertEqual(read_events(self.db), [])
+        self.assertIsNone(self.db.query(OutboxEvent).one().sequence)
+        self.assertEqual(assign_sequences(self.db), 1)
+        self.assertEqual([e["offset"] for e in read_events(self.db)], [1])
+        print("✅ 读取事件日志只读通过")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)